@@ -0,0 +1,14 @@
+#!/bin/bash
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROJECT_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
+DATA_DIR="$PROJECT_ROOT/functions/data"
+
+# Offline reverse geocoding index (functions/geoindex.py) is built from this dump
+echo "🌍 Downloading GeoNames cities15000 dump..."
+mkdir -p "$DATA_DIR"
+curl -sSfL -o "$DATA_DIR/cities15000.zip" https://download.geonames.org/export/dump/cities15000.zip
+unzip -o -q "$DATA_DIR/cities15000.zip" -d "$DATA_DIR"
+rm "$DATA_DIR/cities15000.zip"
+echo "✅ Saved $(wc -l < "$DATA_DIR/cities15000.txt") cities to $DATA_DIR/cities15000.txt"
@@ -0,0 +1,83 @@
+"""
+Multi-city Gemini prompts: several cities per grounded call, answered as one
+JSON object keyed by city name and split back into per-city event lists.
+
+The batch size adapts to the model's output limit: it is derived from the
+observed output tokens per city and halved whenever a response was cut off
+(or the call failed, e.g. timed out).
+"""
+import math
+import threading
+
+# Output token limit requested per batched call
+MAX_OUTPUT_TOKENS = 32768
+# Keep headroom below the limit, city output sizes vary a lot
+TOKEN_HEADROOM = 0.75
+# Initial guess: ~30 events with ~80 tokens each
+DEFAULT_TOKENS_PER_CITY = 2400
+MAX_BATCH_SIZE = 8
+# Weight of the newest observation in the tokens-per-city average
+EWMA_ALPHA = 0.3
+
+
+def build_batch_prompt(city_names):
+    cities = "\n".join(f"- {name}" for name in city_names)
+    return f"""
+    Find as many upcoming events as possible in each of these cities for the next 7 days:
+    {cities}
+    Aim for at least 30 events per city if available.
+    Include: Title, Date, Location, Category, and a short Description.
+    Return the result ONLY as one JSON object whose keys are exactly the city
+    names listed above and whose values are JSON lists of event objects.
+    Use an empty list for a city without events.
+    Event keys: 'title', 'description', 'category', 'startTime', 'address'.
+    """
+
+
+def split_batch_response(parsed, city_names):
+    """
+    Splits a parsed city-keyed response into {city: [events]} for the
+    requested cities. Keys are matched case-insensitively; cities that are
+    missing or have no usable events map to an empty list.
+    """
+    by_key = {}
+    if isinstance(parsed, dict):
+        for key, value in parsed.items():
+            if isinstance(value, list):
+                by_key[str(key).strip().casefold()] = [e for e in value if isinstance(e, dict)]
+    return {name: by_key.get(name.casefold(), []) for name in city_names}
+
+
+class BatchSizer:
+    """
+    Chooses how many cities go into one prompt. Thread-safe; one instance is
+    shared by all batched refreshes of a process.
+    """
+
+    def __init__(self, max_output_tokens=MAX_OUTPUT_TOKENS, max_batch=MAX_BATCH_SIZE,
+                 tokens_per_city=DEFAULT_TOKENS_PER_CITY):
+        self.max_output_tokens = max_output_tokens
+        self.max_batch = max_batch
+        self.tokens_per_city = float(tokens_per_city)
+        self._limit = max_batch
+        self._lock = threading.Lock()
+
+    def size(self):
+        with self._lock:
+            fits = math.floor(self.max_output_tokens * TOKEN_HEADROOM / self.tokens_per_city)
+            return max(1, min(self._limit, fits, self.max_batch))
+
+    def observe(self, city_count, output_tokens, truncated):
+        """
+        Records the outcome of a batched call. A truncated response halves the
+        batch limit; complete ones update the per-city token estimate and let
+        the limit grow back one city at a time.
+        """
+        with self._lock:
+            if truncated:
+                self._limit = max(1, math.ceil(min(self._limit, city_count) / 2))
+                return
+            if output_tokens and city_count:
+                per_city = output_tokens / city_count
+                self.tokens_per_city += EWMA_ALPHA * (per_city - self.tokens_per_city)
+            self._limit = min(self.max_batch, self._limit + 1)
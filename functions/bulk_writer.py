@@ -0,0 +1,162 @@
+"""
+Chunked, parallel Firestore bulk writes.
+
+A single WriteBatch is limited to 500 operations and commits serially. The
+BulkWriter splits operations into chunks, commits chunks concurrently with
+bounded parallelism and retries transient failures with exponential backoff.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions
+
+# Firestore allows 500 writes per batch; stay below to leave room for transforms
+CHUNK_SIZE = 400
+MAX_WORKERS = 4
+MAX_ATTEMPTS = 5
+BASE_DELAY_SECONDS = 0.2
+
+RETRYABLE_ERRORS = (
+    exceptions.Aborted,
+    exceptions.DeadlineExceeded,
+    exceptions.InternalServerError,
+    exceptions.ResourceExhausted,
+    exceptions.ServiceUnavailable,
+)
+
+
+class BulkWriteError(Exception):
+    def __init__(self, message, stats):
+        super().__init__(message)
+        self.stats = stats
+
+
+class BulkWriter:
+    """
+    Buffers set/delete operations; full chunks are committed in the background
+    as soon as they fill up, flush() commits the rest and waits for all.
+
+        writer = BulkWriter(db)
+        for ref, data in items:
+            writer.set(ref, data, merge=True)
+        stats = writer.flush()
+    """
+
+    def __init__(self, db, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS,
+                 max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY_SECONDS, sleep=time.sleep,
+                 label="BulkWriter"):
+        self._db = db
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self._sleep = sleep
+        self.label = label
+        self._pending = []
+        self._futures = []
+        self._errors = []
+        self._executor = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._stats = {"ops": 0, "chunks": 0, "retries": 0, "failed_chunks": 0}
+
+    def set(self, ref, data, merge=False):
+        self._add(("set", ref, data, merge))
+
+    def delete(self, ref):
+        self._add(("delete", ref, None, False))
+
+    def _add(self, op):
+        if self._started is None:
+            self._started = time.monotonic()
+        self._pending.append(op)
+        if len(self._pending) >= self.chunk_size:
+            self._submit()
+
+    def _submit(self, inline=False):
+        chunk, self._pending = self._pending, []
+        if not chunk:
+            return
+        if inline or self.max_workers <= 1:
+            try:
+                self._commit_chunk(chunk)
+            except Exception as e:
+                self._errors.append(e)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures.append(self._executor.submit(self._commit_chunk, chunk))
+
+    def _commit_chunk(self, chunk):
+        attempt = 0
+        while True:
+            attempt += 1
+            batch = self._db.batch()
+            for kind, ref, data, merge in chunk:
+                if kind == "set":
+                    batch.set(ref, data, merge=merge)
+                else:
+                    batch.delete(ref)
+            try:
+                batch.commit()
+                with self._lock:
+                    self._stats["ops"] += len(chunk)
+                    self._stats["chunks"] += 1
+                return
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_attempts:
+                    with self._lock:
+                        self._stats["failed_chunks"] += 1
+                    raise
+                delay = self.base_delay * (2 ** (attempt - 1)) * (1 + random.random())
+                print(f"{self.label}: Commit failed ({e}), retry {attempt} in {delay:.2f}s")
+                with self._lock:
+                    self._stats["retries"] += 1
+                self._sleep(delay)
+            except Exception:
+                with self._lock:
+                    self._stats["failed_chunks"] += 1
+                raise
+
+    def flush(self):
+        """
+        Commits all remaining operations and waits for in-flight chunks.
+        Returns stats (ops, chunks, retries, seconds, ops_per_second);
+        raises BulkWriteError if any chunk ultimately failed.
+        """
+        # A lone chunk is committed on this thread, no pool needed
+        self._submit(inline=not self._futures)
+        errors, self._errors = self._errors, []
+        for future in self._futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        self._futures = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        stats = dict(self._stats)
+        stats["seconds"] = time.monotonic() - self._started if self._started else 0.0
+        self._stats = {"ops": 0, "chunks": 0, "retries": 0, "failed_chunks": 0}
+        self._started = None
+        stats["ops_per_second"] = stats["ops"] / stats["seconds"] if stats["seconds"] else 0.0
+        if stats["ops"] >= self.chunk_size:
+            print(f"{self.label}: {stats['ops']} ops in {stats['chunks']} chunks, "
+                  f"{stats['seconds']:.2f}s ({stats['ops_per_second']:.0f} ops/s)")
+        if errors:
+            raise BulkWriteError(f"{len(errors)} chunk(s) failed: {errors[0]}", stats)
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        elif self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
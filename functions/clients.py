@@ -0,0 +1,179 @@
+"""
+Registry of lazily created, process-wide clients: a pooled HTTP session,
+the Firebase app / Firestore client, Gemini and Pub/Sub.
+
+Nothing is constructed at import time, so each Cloud Functions entry point
+only pays for the clients it actually uses. prewarm() builds the clients an
+instance will need in a background thread, off the first request's path.
+Clients are reused for the lifetime of the instance (keep-alive connections,
+no repeated TLS handshakes) and every client has explicit timeouts.
+"""
+import os
+import threading
+from collections import Counter
+
+import firebase_admin
+import requests
+from firebase_admin import firestore
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+PROJECT_ID = os.environ.get("GCLOUD_PROJECT", "poppin-80886")
+
+# HTTP (GeoNames, geocoding): (connect, read) seconds, retries for idempotent GETs
+HTTP_TIMEOUT = (3.05, 10)
+HTTP_POOL_SIZE = 16
+HTTP_RETRY = Retry(total=2, connect=2, read=1, backoff_factor=0.3,
+                   status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+# Gemini requests (the SDK takes milliseconds); callers may pass a shorter per-call timeout
+GEMINI_TIMEOUT_SECONDS = 90
+# Pub/Sub publish RPC deadline; publishes are sent in batches by the client
+# (flushed after max_latency seconds)
+PUBSUB_PUBLISH_TIMEOUT = 10.0
+PUBSUB_BATCH_SETTINGS = {"max_messages": 100, "max_bytes": 1024 * 1024, "max_latency": 0.05}
+
+_lock = threading.Lock()
+_app = None
+_http_session = None
+_gemini_clients = {}
+_publisher = None
+_usage = Counter()
+
+
+def _count(name, n=1):
+    with _lock:
+        _usage[name] += n
+
+
+def usage_stats():
+    """
+    Counters of client constructions and uses ('<client>.created', '<client>.used',
+    'http.requests', 'http.errors') since the instance started.
+    """
+    with _lock:
+        return dict(_usage)
+
+
+class _TimeoutSession(requests.Session):
+    """
+    Session that applies HTTP_TIMEOUT unless a timeout is given and counts requests.
+    """
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        _count("http.requests")
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.RequestException:
+            _count("http.errors")
+            raise
+
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                session = _TimeoutSession()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE,
+                                      max_retries=HTTP_RETRY)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+                _usage["http.created"] += 1
+    return _http_session
+
+
+def http_get(url, **kwargs):
+    return get_http_session().get(url, **kwargs)
+
+
+def get_app():
+    global _app
+    if _app is None:
+        with _lock:
+            if _app is None:
+                try:
+                    _app = firebase_admin.get_app()
+                except ValueError:
+                    _app = firebase_admin.initialize_app()
+                    _usage["firebase.created"] += 1
+    return _app
+
+
+def get_db():
+    """
+    Firestore client (cached per app by firebase_admin). RPC deadlines are the
+    SDK's per-method defaults unless a call passes `timeout`.
+    """
+    _count("firestore.used")
+    return firestore.client(app=get_app())
+
+
+def get_gemini_client(api_key):
+    """
+    One google.genai client per API key and process (it holds the HTTP
+    connection pool, so it must not be rebuilt per call).
+    """
+    client = _gemini_clients.get(api_key)
+    if client is None:
+        from google import genai
+        with _lock:
+            client = _gemini_clients.get(api_key)
+            if client is None:
+                client = _gemini_clients[api_key] = genai.Client(
+                    api_key=api_key,
+                    http_options={"timeout": GEMINI_TIMEOUT_SECONDS * 1000},
+                )
+                _usage["gemini.created"] += 1
+    _count("gemini.used")
+    return client
+
+
+def get_publisher():
+    global _publisher
+    if _publisher is None:
+        from google.cloud import pubsub_v1
+        with _lock:
+            if _publisher is None:
+                _publisher = pubsub_v1.PublisherClient(
+                    batch_settings=pubsub_v1.types.BatchSettings(**PUBSUB_BATCH_SETTINGS),
+                    publisher_options=pubsub_v1.types.PublisherOptions(timeout=PUBSUB_PUBLISH_TIMEOUT),
+                )
+                _usage["pubsub.created"] += 1
+    _count("pubsub.used")
+    return _publisher
+
+
+def topic_path(topic_id):
+    return get_publisher().topic_path(PROJECT_ID, topic_id)
+
+
+def ensure_topic(topic_id):
+    """
+    Creates the topic if it doesn't exist yet (deploying the Pub/Sub trigger
+    normally does). Only called while prewarming, never per publish.
+    """
+    try:
+        get_publisher().create_topic(request={"name": topic_path(topic_id)})
+        print(f"Clients: Created Pub/Sub topic: {topic_id}")
+    except Exception:
+        # Topic likely already exists
+        pass
+
+
+def prewarm(warmers):
+    """
+    Runs the given warm-up callables in a daemon thread and returns it.
+    Failures are logged; the clients are then simply built on first use.
+    """
+    def _run():
+        for warm in warmers:
+            try:
+                warm()
+            except Exception as e:
+                print(f"Clients: Prewarm of {getattr(warm, '__name__', warm)} failed: {e}")
+
+    thread = threading.Thread(target=_run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,120 @@
+"""
+Low-overhead demand tracking: which cities (and rough locations) are requested.
+
+Requests only bump in-memory counters; a background flush writes the
+aggregated counts to sharded, hourly counter docs in `demandCounters`
+(one merge write per flush and instance, never a write per request).
+"""
+import datetime
+import random
+import threading
+import time
+from collections import Counter
+
+from firebase_admin import firestore
+
+DEMAND_COLLECTION = "demandCounters"
+SHARDS = 10
+FLUSH_INTERVAL_SECONDS = 60
+# Locations are counted on a ~10 km grid
+LOCATION_PRECISION = 1
+
+
+def hour_bucket(now):
+    return now.astimezone(datetime.timezone.utc).strftime("%Y%m%d%H")
+
+
+def location_key(lat, lng):
+    return f"{round(lat, LOCATION_PRECISION)}_{round(lng, LOCATION_PRECISION)}"
+
+
+class DemandCounter:
+    """
+    Lock-protected per-city / per-location request counters of one instance.
+    Each instance writes to one randomly chosen shard so counter docs stay
+    well below Firestore's per-document write rate.
+    """
+
+    def __init__(self, db_factory, shards=SHARDS, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 clock=time.monotonic, now=None):
+        self._db_factory = db_factory
+        self.shard = random.randrange(shards)
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._now = now or (lambda: datetime.datetime.now(datetime.timezone.utc))
+        self._lock = threading.Lock()
+        self._cities = Counter()
+        self._locations = Counter()
+        self._last_flush = clock()
+        self._flushing = False
+
+    def record(self, city, lat=None, lng=None):
+        with self._lock:
+            self._cities[city] += 1
+            if lat is not None and lng is not None:
+                self._locations[location_key(lat, lng)] += 1
+
+    def maybe_flush(self):
+        """
+        Starts a background flush if the interval has passed. Never blocks
+        the caller on Firestore.
+        """
+        with self._lock:
+            if self._flushing or self._clock() - self._last_flush < self.flush_interval:
+                return False
+            self._flushing = True
+        threading.Thread(target=self._flush_in_background, daemon=True).start()
+        return True
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Demand flush error: {e}")
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def flush(self):
+        """
+        Writes the counts gathered since the last flush with one merge write.
+        Counts are put back if the write fails.
+        """
+        with self._lock:
+            cities, self._cities = self._cities, Counter()
+            locations, self._locations = self._locations, Counter()
+            self._last_flush = self._clock()
+        if not cities and not locations:
+            return 0
+
+        bucket = hour_bucket(self._now())
+        ref = self._db_factory().collection(DEMAND_COLLECTION).document(f"{bucket}_{self.shard}")
+        try:
+            ref.set({
+                "bucket": bucket,
+                "cities": {name: firestore.Increment(n) for name, n in cities.items()},
+                "locations": {key: firestore.Increment(n) for key, n in locations.items()},
+                "updatedAt": self._now(),
+            }, merge=True)
+        except Exception:
+            with self._lock:
+                self._cities.update(cities)
+                self._locations.update(locations)
+            raise
+        return sum(cities.values())
+
+
+def top_cities(db, window_hours=1, n=10, now=None):
+    """
+    Most requested cities over the last `window_hours` hours (current hour
+    included), summed over all shards. Returns [(city, count), ...].
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    buckets = [hour_bucket(now - datetime.timedelta(hours=h)) for h in range(window_hours)]
+    totals = Counter()
+    # 'in' queries accept up to 30 values
+    for i in range(0, len(buckets), 30):
+        query = db.collection(DEMAND_COLLECTION).where("bucket", "in", buckets[i:i + 30])
+        for doc in query.stream():
+            totals.update(doc.to_dict().get("cities") or {})
+    return totals.most_common(n)
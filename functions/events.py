@@ -0,0 +1,58 @@
+"""
+Helpers for normalizing event documents produced from Gemini output.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+try:
+    from zoneinfo import ZoneInfo
+    EVENT_TIMEZONE = ZoneInfo(os.environ.get("EVENT_TIMEZONE", "Europe/Berlin"))
+except Exception:  # tzdata missing
+    EVENT_TIMEZONE = datetime.timezone.utc
+
+
+def parse_start_time(value):
+    """
+    Normalizes Gemini's free-form 'startTime' (ISO date or datetime, with or
+    without offset) to an aware UTC datetime. Naive values are local to
+    EVENT_TIMEZONE. Returns None if the value can't be parsed.
+    """
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, str) and value.strip():
+        text = value.strip().replace("Z", "+00:00")
+        try:
+            parsed = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=EVENT_TIMEZONE)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+# Fields added by the backend, not part of the event content from Gemini
+DERIVED_FIELDS = ("city", "fetchedAt", "startTs", "expiresAt", "location", "geohash", "contentHash")
+
+
+def event_id(city_name, event):
+    """
+    Deterministic document ID based on title and address to avoid simple duplicates.
+    """
+    title = event.get('title', 'Unknown')
+    address = event.get('address', 'Unknown')
+    return f"{city_name}_{title}_{address}".replace(" ", "_").replace("/", "_")
+
+
+def content_hash(event):
+    """
+    Stable hash of an event's content (ignoring derived fields), used to skip
+    rewriting unchanged events on refresh.
+    """
+    content = {k: v for k, v in event.items() if k not in DERIVED_FIELDS}
+    canonical = json.dumps(content, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
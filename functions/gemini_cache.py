@@ -0,0 +1,154 @@
+"""
+Content-addressed cache for Gemini responses.
+
+Entries are keyed by a hash of model, prompt, request config and a date
+bucket, so a repeated call for the same city on the same day (force refresh,
+debug trigger, retry) is answered from the cache instead of the API. The
+in-memory tier is per instance; the persistent tier (Firestore collection
+geminiCache, or a directory of JSON files for local runs and tests) is shared.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+from cache import TTLCache
+
+GEMINI_CACHE_COLLECTION = "geminiCache"
+GEMINI_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", "3600"))
+
+
+def date_bucket(now=None):
+    """
+    Prompts ask for "the next 7 days", so answers are only reusable on the same (UTC) day.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+def response_key(model, prompt, config=None, bucket=None):
+    canonical = json.dumps(
+        {"model": model, "prompt": prompt, "config": config or {}, "bucket": bucket or date_bucket()},
+        sort_keys=True, default=str, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class FirestoreResponseStore:
+    """
+    Persistent tier in Firestore. `expiresAt` can back a Firestore TTL policy;
+    expired entries are ignored on read either way.
+    """
+
+    def __init__(self, db_factory, collection=GEMINI_CACHE_COLLECTION):
+        self._db_factory = db_factory
+        self.collection = collection
+
+    def get(self, key, now):
+        doc = self._db_factory().collection(self.collection).document(key).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        if data.get("expiresAt") is None or data["expiresAt"] <= now:
+            return None
+        return data.get("text")
+
+    def set(self, key, text, expires_at, model=None):
+        self._db_factory().collection(self.collection).document(key).set({
+            "text": text,
+            "model": model,
+            "expiresAt": expires_at,
+        })
+
+
+class FileResponseStore:
+    """
+    Persistent tier as one JSON file per key in a local directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, now):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if datetime.datetime.fromisoformat(data["expiresAt"]) <= now:
+            return None
+        return data.get("text")
+
+    def set(self, key, text, expires_at, model=None):
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"text": text, "model": model, "expiresAt": expires_at.isoformat()}, f)
+        os.replace(tmp, self._path(key))
+
+
+class GeminiResponseCache:
+    """
+    Two-tier response cache with hit/miss counters.
+
+        text = cache.get(key)
+        if text is None:
+            text = call_gemini()
+            cache.set(key, text)
+    """
+
+    def __init__(self, store, ttl_seconds=GEMINI_CACHE_TTL, max_entries=256, now=None):
+        self._store = store
+        self.ttl_seconds = ttl_seconds
+        self._memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._now = now or (lambda: datetime.datetime.now(datetime.timezone.utc))
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "store_errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        text = self._memory.get(key)
+        if text is not None:
+            self._count("memory_hits")
+            return text
+        if self._store is not None:
+            try:
+                text = self._store.get(key, self._now())
+            except Exception as e:
+                print(f"Gemini cache read error: {e}")
+                self._count("store_errors")
+                text = None
+            if text is not None:
+                self._memory.set(key, text, size=len(text))
+                self._count("store_hits")
+                return text
+        self._count("misses")
+        return None
+
+    def set(self, key, text, model=None):
+        self._memory.set(key, text, size=len(text))
+        if self._store is None:
+            return
+        expires_at = self._now() + datetime.timedelta(seconds=self.ttl_seconds)
+        try:
+            self._store.set(key, text, expires_at, model=model)
+        except Exception as e:
+            print(f"Gemini cache write error: {e}")
+            self._count("store_errors")
+
+    def clear(self):
+        self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
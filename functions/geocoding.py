@@ -0,0 +1,132 @@
+"""
+Address geocoding for events at ingest, backed by a persistent cache so that
+repeated venues never hit the geocoding service again.
+
+Uses a Nominatim-compatible search endpoint (OpenStreetMap by default).
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+from cache import TTLCache
+
+GEOCODER_URL = os.environ.get("GEOCODER_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODER_USER_AGENT = os.environ.get("GEOCODER_USER_AGENT", "poppin-events/1.0")
+# Nominatim's usage policy allows at most one request per second
+GEOCODER_MIN_INTERVAL = float(os.environ.get("GEOCODER_MIN_INTERVAL", "1.0"))
+GEOCODER_TIMEOUT = (3.05, 5)  # (connect, read) seconds
+
+GEOCODE_CACHE_COLLECTION = "geocodeCache"
+
+
+def geocode_key(query):
+    normalized = " ".join(query.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class Geocoder:
+    """
+    Geocodes free-form addresses with an in-memory tier and a Firestore tier
+    (collection geocodeCache). Misses are cached too, so unknown venues are
+    not retried on every ingest.
+    """
+
+    def __init__(self, db_factory, http_get=None, clock=time.monotonic, sleep=time.sleep):
+        self._db_factory = db_factory
+        self._http_get = http_get
+        self._clock = clock
+        self._sleep = sleep
+        self._memory = TTLCache(max_entries=10000, ttl_seconds=7 * 86400)
+        # Keys prefetch() found missing in Firestore, so geocode() skips the point read
+        self._not_stored = TTLCache(max_entries=10000, ttl_seconds=3600)
+        self._lock = threading.Lock()
+        self._last_request = None
+        self.lookups = 0
+
+    def prefetch(self, queries):
+        """
+        Loads persisted cache entries for many addresses with one get_all.
+        """
+        keys = {geocode_key(q): q for q in queries}
+        missing = [k for k in keys if self._memory.get(k) is None]
+        if not missing:
+            return
+        db = self._db_factory()
+        refs = [db.collection(GEOCODE_CACHE_COLLECTION).document(k) for k in missing]
+        found = set()
+        for doc in db.get_all(refs):
+            if doc.exists:
+                found.add(doc.id)
+                self._remember(doc.id, doc.to_dict())
+        for key in missing:
+            if key not in found:
+                self._not_stored.set(key, True)
+
+    def geocode(self, query, deadline=None):
+        """
+        Returns (lat, lng) or None. Doesn't call the service past the
+        (monotonic) deadline; such addresses are simply left for next time.
+        """
+        key = geocode_key(query)
+        cached = self._memory.get(key)
+        if cached is not None:
+            return cached.get("location")
+
+        ref = self._db_factory().collection(GEOCODE_CACHE_COLLECTION).document(key)
+        if self._not_stored.get(key) is None:
+            doc = ref.get()
+            if doc.exists:
+                return self._remember(key, doc.to_dict())
+
+        if deadline is not None and self._clock() >= deadline:
+            return None
+
+        try:
+            location = self._lookup(query)
+        except Exception as e:
+            print(f"Geocoding Error for '{query}': {e}")
+            return None
+
+        entry = {
+            "query": query,
+            "found": location is not None,
+            "createdAt": datetime.datetime.now(datetime.timezone.utc),
+        }
+        if location is not None:
+            entry["lat"], entry["lng"] = location
+        ref.set(entry)
+        return self._remember(key, entry)
+
+    def _remember(self, key, entry):
+        location = None
+        if entry.get("found"):
+            location = (entry["lat"], entry["lng"])
+        self._memory.set(key, {"location": location})
+        return location
+
+    def _lookup(self, query):
+        with self._lock:
+            # Respect the provider's rate limit across threads
+            if self._last_request is not None:
+                wait = GEOCODER_MIN_INTERVAL - (self._clock() - self._last_request)
+                if wait > 0:
+                    self._sleep(wait)
+            self._last_request = self._clock()
+            self.lookups += 1
+
+        http_get = self._http_get
+        if http_get is None:
+            import requests
+            http_get = requests.get
+        response = http_get(
+            GEOCODER_URL,
+            params={"q": query, "format": "json", "limit": 1},
+            headers={"User-Agent": GEOCODER_USER_AGENT},
+            timeout=GEOCODER_TIMEOUT,
+        )
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
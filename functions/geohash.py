@@ -0,0 +1,92 @@
+"""
+Geohash encoding and radius covering for prefix range queries in Firestore.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+KM_PER_DEGREE_LAT = 111.2
+
+# Upper bound on prefixes (= Firestore queries, run concurrently) per radius query.
+# Enough for precision 4 (~20x39 km cells at 52°N) at the app's 30 km radius.
+MAX_COVERING_CELLS = 24
+
+
+def encode(lat, lng, precision=9):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size_degrees(precision):
+    """
+    (height, width) of a geohash cell in degrees.
+    """
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _cell_distance_km(lat, lng, south, west, height, width):
+    """
+    Approximate distance from a point to the nearest point of a cell (0 inside).
+    """
+    nearest_lat = min(max(lat, south), south + height)
+    nearest_lng = min(max(lng, west), west + width)
+    dy = (nearest_lat - lat) * KM_PER_DEGREE_LAT
+    dx = (nearest_lng - lng) * KM_PER_DEGREE_LAT * math.cos(math.radians(nearest_lat))
+    return math.hypot(dx, dy)
+
+
+def covering_prefixes(lat, lng, radius_km, max_cells=MAX_COVERING_CELLS):
+    """
+    Geohash prefixes whose cells together cover the circle. Cells of the
+    bounding box that don't touch the circle are left out; of the precisions
+    needing at most max_cells prefixes, the one covering the least area wins.
+    """
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(min(89.9, abs(lat) + lat_span))), 1e-6)
+    lng_span = min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+    south, north = max(-90.0, lat - lat_span), min(90.0, lat + lat_span)
+    west, east = lng - lng_span, lng + lng_span
+
+    best, best_area = {encode(lat, lng, 1)}, float("inf")
+    for precision in range(1, 10):
+        height, width = cell_size_degrees(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        cols = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * cols > 4 * max_cells:
+            break  # Finer precisions only need more cells
+        cells = set()
+        for r in range(rows):
+            cell_south = (math.floor(south / height) + r) * height
+            for c in range(cols):
+                cell_west = (math.floor(west / width) + c) * width
+                # Slack for the flat-earth distance approximation
+                if _cell_distance_km(lat, lng, cell_south, cell_west, height, width) > radius_km * 1.01:
+                    continue
+                cell_lat = min(89.999999, cell_south + height / 2)
+                cell_lng = (cell_west + width / 2 + 180.0) % 360.0 - 180.0
+                cells.add(encode(cell_lat, cell_lng, precision))
+        area = len(cells) * height * width
+        if len(cells) <= max_cells and area < best_area:
+            best, best_area = cells, area
+    return sorted(best)
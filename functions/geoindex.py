@@ -0,0 +1,171 @@
+"""
+Offline reverse geocoding: nearest cities for a coordinate without calling
+the GeoNames web service.
+
+Built from the GeoNames `cities15000` dump (all cities with > 15k inhabitants,
+https://download.geonames.org/export/dump/cities15000.zip). Run
+`bin/fetch-geonames.sh` to place it at functions/data/cities15000.txt.
+"""
+import io
+import math
+import os
+import threading
+import zipfile
+from array import array
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.2
+
+DEFAULT_DUMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities15000.txt")
+CITIES_DUMP_PATH = os.environ.get("CITIES_DUMP_PATH", DEFAULT_DUMP_PATH)
+
+# Grid cell size in degrees (cities are bucketed per cell)
+CELL_DEGREES = 1.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in kilometers.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lng):
+    row = int(math.floor((lat + 90.0) / CELL_DEGREES))
+    col = int(math.floor(((lng + 180.0) % 360.0) / CELL_DEGREES))
+    return row, col
+
+
+class CityIndex:
+    """
+    Array-backed grid index over city coordinates.
+    Cities are sorted by grid cell so each cell is a contiguous slice of the
+    coordinate arrays; a radius query only scans the cells it overlaps.
+    """
+
+    def __init__(self, cities):
+        """
+        cities: iterable of (geoname_id, name, lat, lng, country_code, population)
+        """
+        rows = sorted(cities, key=lambda c: _cell(c[2], c[3]))
+        self.ids = array("q", (c[0] for c in rows))
+        self.names = [c[1] for c in rows]
+        self.lats = array("d", (c[2] for c in rows))
+        self.lngs = array("d", (c[3] for c in rows))
+        self.countries = [c[4] for c in rows]
+        self.populations = array("q", (c[5] for c in rows))
+
+        # cell -> (start, end) slice into the arrays
+        self._cells = {}
+        for i, row in enumerate(rows):
+            cell = _cell(row[2], row[3])
+            start, _ = self._cells.get(cell, (i, i))
+            self._cells[cell] = (start, i + 1)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_geonames_dump(cls, path):
+        """
+        Loads a GeoNames dump (tab separated, .txt or .zip).
+        """
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                member = archive.namelist()[0]
+                with archive.open(member) as raw:
+                    return cls(_parse_dump(io.TextIOWrapper(raw, encoding="utf-8")))
+        with open(path, encoding="utf-8") as f:
+            return cls(_parse_dump(f))
+
+    def nearby(self, lat, lng, radius_km=50, max_rows=5):
+        """
+        Cities within radius_km, nearest first, in the shape of the GeoNames
+        findNearbyPlaceNameJSON response (name, lat, lng, distance, ...).
+        """
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(min(89.9, abs(lat) + lat_span))), 1e-6)
+        lng_span = min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+
+        row_min, _ = _cell(max(-90.0, lat - lat_span), lng)
+        row_max, _ = _cell(min(89.999999, lat + lat_span), lng)
+        n_cols = int(round(360.0 / CELL_DEGREES))
+        _, col_min = _cell(lat, lng - lng_span)
+        col_count = min(n_cols, int(math.ceil(2 * lng_span / CELL_DEGREES)) + 1)
+
+        hits = []
+        for row in range(row_min, row_max + 1):
+            for k in range(col_count):
+                bounds = self._cells.get((row, (col_min + k) % n_cols))
+                if bounds is None:
+                    continue
+                for i in range(*bounds):
+                    distance = haversine_km(lat, lng, self.lats[i], self.lngs[i])
+                    if distance <= radius_km:
+                        hits.append((distance, -self.populations[i], i))
+
+        hits.sort()
+        return [self._as_geonames(i, distance) for distance, _, i in hits[:max_rows]]
+
+    def _as_geonames(self, i, distance):
+        return {
+            "geonameId": self.ids[i],
+            "name": self.names[i],
+            "lat": str(self.lats[i]),
+            "lng": str(self.lngs[i]),
+            "countryCode": self.countries[i],
+            "population": self.populations[i],
+            "distance": f"{distance:.5f}",
+        }
+
+
+def _parse_dump(lines):
+    # Columns: geonameid, name, asciiname, alternatenames, latitude, longitude,
+    # feature class, feature code, country code, ..., population (14)
+    for line in lines:
+        cols = line.rstrip("\n").split("\t")
+        if len(cols) < 15:
+            continue
+        try:
+            yield (
+                int(cols[0]),
+                cols[1],
+                float(cols[4]),
+                float(cols[5]),
+                cols[8],
+                int(cols[14] or 0),
+            )
+        except ValueError:
+            continue
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_city_index():
+    """
+    Lazily loads the city index on first use (once per instance).
+    Returns None if the dump is not available.
+    """
+    global _index, _index_loaded
+    if _index_loaded:
+        return _index
+    with _index_lock:
+        if not _index_loaded:
+            if os.path.exists(CITIES_DUMP_PATH):
+                try:
+                    _index = CityIndex.from_geonames_dump(CITIES_DUMP_PATH)
+                    print(f"GeoIndex: Loaded {len(_index)} cities from {CITIES_DUMP_PATH}")
+                except Exception as e:
+                    print(f"GeoIndex: Failed to load {CITIES_DUMP_PATH}: {e}")
+            else:
+                print(f"GeoIndex: {CITIES_DUMP_PATH} not found, using GeoNames web service")
+            _index_loaded = True
+    return _index
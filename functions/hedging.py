@@ -0,0 +1,145 @@
+"""
+Tail-latency control for slow upstream calls (Gemini): hedged requests with a
+latency-percentile based delay, an overall deadline and a circuit breaker.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LatencyTracker:
+    """
+    Sliding window of observed latencies (seconds) of one kind of call.
+    """
+
+    def __init__(self, window=50, default=15.0, min_samples=5):
+        self._samples = deque(maxlen=window)
+        self.default = default
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Latency below which a fraction `q` of the calls finished; the default
+        until enough samples were seen.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return self.default
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open, allow()
+    is False. After `reset_timeout` seconds one trial call is let through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+# Losing calls can't be cancelled (blocking HTTP), they finish in the background
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def hedged_call(primary, fallback, hedge_delay, deadline, is_valid=lambda result: True,
+                on_primary_done=None, executor=None):
+    """
+    Runs `primary()`; if it has not produced a valid result after `hedge_delay`
+    seconds (or failed earlier), also runs `fallback()` and returns whichever
+    valid result arrives first. `fallback` may be None (no hedging).
+
+    `deadline` bounds the total wait in seconds; raises TimeoutError when it
+    passes without a valid result, or the last error if all calls failed.
+    `on_primary_done(ok, seconds)` is called once the primary finishes, even
+    if it lost the race, so latency and failures can still be recorded.
+    """
+    executor = executor or _executor
+    started = time.monotonic()
+    end = started + deadline
+
+    def _run_primary():
+        try:
+            result = primary()
+        except Exception:
+            if on_primary_done:
+                on_primary_done(False, time.monotonic() - started)
+            raise
+        if on_primary_done:
+            on_primary_done(is_valid(result), time.monotonic() - started)
+        return result
+
+    pending = {executor.submit(_run_primary)}
+    hedge_at = started + hedge_delay if fallback is not None else None
+    last_error = None
+
+    while pending:
+        now = time.monotonic()
+        if now >= end:
+            break
+        timeout = end - now
+        if hedge_at is not None:
+            timeout = max(0.0, min(timeout, hedge_at - now))
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if is_valid(result):
+                return result
+            last_error = ValueError("invalid result")
+        # Hedge once the delay has passed or the primary already gave up
+        if hedge_at is not None and (time.monotonic() >= hedge_at or not pending):
+            pending.add(executor.submit(fallback))
+            hedge_at = None
+
+    if pending:
+        raise TimeoutError(f"no valid result within {deadline:.1f}s")
+    raise last_error or TimeoutError("no valid result")
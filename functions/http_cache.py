@@ -0,0 +1,166 @@
+"""
+HTTP caching helpers: ETags, conditional requests, Cache-Control,
+Accept-Encoding negotiation (gzip, and brotli if installed) and response
+bodies that are serialized and compressed once, then reused.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, json is used without it
+    orjson = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+ENCODING_SUFFIXES = {"gzip": "-gz", "br": "-br"}
+
+
+def make_etag(*parts):
+    """
+    Strong ETag (quoted) derived from the given parts, e.g. city and data version.
+    """
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def etag_for_encoding(etag, encoding):
+    """
+    Strong ETags must differ between content codings of the same resource.
+    """
+    suffix = ENCODING_SUFFIXES.get(encoding)
+    if not suffix:
+        return etag
+    return f'{etag[:-1]}{suffix}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison as required for If-None-Match, ignoring coding suffixes.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = _strip_etag(etag)
+    return any(_strip_etag(candidate) == base for candidate in if_none_match.split(","))
+
+
+def _strip_etag(etag):
+    tag = etag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES.values():
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)]
+    return tag
+
+
+def cache_control(max_age, stale_while_revalidate):
+    if max_age is None:
+        return "no-cache"
+    return f"public, max-age={int(max_age)}, stale-while-revalidate={int(stale_while_revalidate)}"
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Picks the best supported content coding from an Accept-Encoding header.
+    Returns "br", "gzip" or "identity".
+    """
+    if not accept_encoding:
+        return "identity"
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    def _quality(name):
+        return accepted.get(name, accepted.get("*", 0.0))
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=_quality)
+    return best if _quality(best) > 0 else "identity"
+
+
+def response_coding(body, encoding):
+    """
+    The coding a body is sent with for the negotiated one: small bodies are
+    left uncompressed.
+    """
+    return "identity" if len(body) < MIN_COMPRESS_BYTES else encoding
+
+
+def compress(body, encoding):
+    """
+    Encodes a body for the negotiated coding. Returns (body, encoding) since
+    small bodies are left uncompressed.
+    """
+    if response_coding(body, encoding) == "identity":
+        return body, "identity"
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_json(value):
+    """
+    Compact UTF-8 JSON bytes. Datetimes (including subclasses) are written as
+    ISO 8601, with orjson if installed; anything else unknown as str().
+    """
+    if orjson is not None:
+        try:
+            # Datetime subclasses (Firestore's DatetimeWithNanoseconds) reach the default
+            return orjson.dumps(value, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bit
+    return json.dumps(value, default=_json_default, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody:
+    """
+    A serialized response body and its ETag. Compressed variants are built on
+    first request for a coding and then reused, so a cached instance turns
+    warm requests into a lookup.
+    """
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self._variants = {"identity": (body, "identity")}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        """
+        Returns (body, encoding) for the negotiated coding (see compress()).
+        """
+        found = self._variants.get(encoding)
+        if found is None:
+            with self._lock:
+                found = self._variants.get(encoding)
+                if found is None:
+                    found = self._variants[encoding] = compress(self.body, encoding)
+        return found
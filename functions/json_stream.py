@@ -0,0 +1,106 @@
+"""
+Incremental parser for a JSON array of objects arriving in text chunks
+(e.g. a streamed Gemini response, possibly wrapped in ```json fences or prose).
+"""
+import json
+
+
+class JsonArrayStream:
+    """
+    Feed text chunks; every top-level object of the first JSON array is
+    returned as soon as its closing brace has arrived. Brackets in prose
+    before it (an array without objects, or one cut short by a code fence)
+    are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+        self._emitted = 0
+        self.skipped = 0
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, text):
+        """
+        Adds a chunk and returns the list of objects completed by it.
+        """
+        if self._done or not text:
+            return []
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        i = self._pos
+
+        while i < len(buffer):
+            ch = buffer[i]
+            if not self._started:
+                # Skip prose and code fences until the array opens
+                if ch == "[":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "`" and not self._emitted:
+                # A code fence opens after a bracket in prose: the array is in the fence
+                self._restart()
+            elif ch in "{[":
+                if ch == "{" and self._depth == 1:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._depth == 1 and self._obj_start is not None:
+                    self._emit(buffer[self._obj_start:i + 1], objects)
+                    self._obj_start = None
+                elif self._depth == 0 and not self._emitted:
+                    # e.g. "[Oct 17-24]" in prose, keep looking for the event array
+                    self._restart()
+                elif self._depth == 0:
+                    self._done = True
+                    break
+            i += 1
+
+        # Keep only the unfinished object in memory
+        keep_from = self._obj_start if self._obj_start is not None else i
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._obj_start is not None:
+            self._obj_start = 0
+        return objects
+
+    def _restart(self):
+        self._started = False
+        self._depth = 0
+        self._obj_start = None
+
+    def _emit(self, text, objects):
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.skipped += 1
+            return
+        if isinstance(value, dict):
+            objects.append(value)
+            self._emitted += 1
+        else:
+            self.skipped += 1
+
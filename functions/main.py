@@ -1,131 +1,828 @@
 # The Cloud Functions for Firebase SDK to create Cloud Functions and set up triggers.
 from firebase_functions import https_fn, options, scheduler_fn, pubsub_fn
-from firebase_admin import initialize_app, firestore
+import base64
 import datetime
+import hashlib
 import json
+import math
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-# Global app initialization
-initialize_app()
+import geohash
 
-# Global Pub/Sub Publisher (Initialized lazily)
-_publisher = None
-PROJECT_ID = os.environ.get("GCLOUD_PROJECT", "poppin-80886")
-TOPIC_ID = "fetch-events"
+from batch_fetch import MAX_OUTPUT_TOKENS, BatchSizer, build_batch_prompt, split_batch_response
+from bulk_writer import BulkWriter
+from cache import TTLCache
+from clients import (
+    PUBSUB_PUBLISH_TIMEOUT, ensure_topic, get_db, get_gemini_client, get_publisher, http_get, prewarm,
+    topic_path, usage_stats,
+)
+from demand import DemandCounter, top_cities
+from events import content_hash, event_id, parse_start_time
+from gemini_cache import FileResponseStore, FirestoreResponseStore, GeminiResponseCache, response_key
+from geocoding import Geocoder
+from hedging import CircuitBreaker, LatencyTracker, hedged_call
+from geoindex import get_city_index, haversine_km
+from json_stream import JsonArrayStream
+from http_cache import (
+    EncodedBody, cache_control, encode_json, etag_for_encoding, etag_matches, make_etag,
+    negotiate_encoding, response_coding,
+)
+from staleness import DEFAULT_TTL_SECONDS, city_ttl, events_due_at, update_churn
+from singleflight import SingleFlight, acquire_lease, release_lease, wait_for_lease
+from ratelimit import TokenBucket
+from scheduler import plan_refreshes
+from tracing import annotate, metrics_snapshot, span, traced
+from snapshots import (
+    DUE_FIELD, REFRESH_MARKER_FIELD, claim_refresh, merge_sorted_events, read_refresh_metadata, read_snapshot,
+    read_snapshots, rebuild_snapshot, sort_events, touch_snapshot, write_snapshot,
+)
 
-def get_publisher():
-    from google.cloud import pubsub_v1
-    global _publisher
-    if _publisher is None:
-        _publisher = pubsub_v1.PublisherClient()
-    return _publisher
+# The Firebase app and all SDK clients are created lazily (see clients.py)
+TOPIC_ID = "fetch-events"
 
 def get_topic_path():
-    return get_publisher().topic_path(PROJECT_ID, TOPIC_ID)
+    return topic_path(TOPIC_ID)
 
-def get_db():
-    return firestore.client()
+def city_doc_id(city_name):
+    """
+    Firestore-safe document ID for a city name.
+    """
+    return city_name.replace(" ", "_").replace("/", "_")
 
 # --- Config ---
 GEONAMES_USER = os.environ.get("GEONAMES_USER", "poppin") 
+# Use the GeoNames web service only if the offline city index is unavailable
+GEONAMES_FALLBACK = os.environ.get("GEONAMES_FALLBACK", "true") == "true"
+GEONAMES_TIMEOUT = (3.05, 5)  # (connect, read) seconds
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") # Set this in your .env file
+# Stream the synchronous discovery and write events while Gemini is still generating
+GEMINI_STREAMING = os.environ.get("GEMINI_STREAMING", "true") == "true"
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "5"))
+
+# SWR: data older than the city's TTL is served stale while a background refresh
+# runs. This is the TTL of cities without observed churn (see staleness.py).
+STALE_AFTER_SECONDS = DEFAULT_TTL_SECONDS
+# HTTP caching (browsers / CDN in front of get_events_v1)
+HTTP_MAX_AGE = int(os.environ.get("HTTP_MAX_AGE", "300"))
+HTTP_STALE_WHILE_REVALIDATE = int(os.environ.get("HTTP_STALE_WHILE_REVALIDATE", "3600"))
+
+# Geocoding of event addresses at ingest (geohash radius queries)
+GEOCODE_AT_INGEST = os.environ.get("GEOCODE_AT_INGEST", "true") == "true"
+GEOCODE_BUDGET_SECONDS = float(os.environ.get("GEOCODE_BUDGET_SECONDS", "5"))
+GEOHASH_PRECISION = 9
+MAX_RADIUS_KM = 100
+# Radius queries: docs read per geohash prefix at most, concurrent prefix queries
+RADIUS_SCAN_LIMIT = 1000
+RADIUS_QUERY_WORKERS = 8
+# Cities per get_events_bulk_v1 request
+MAX_BULK_CITIES = 10
+
+_geocoder = Geocoder(lambda: get_db(), http_get=http_get)
+
+# Proactive refreshes: scheduled_event_fetch_v1 runs every SCHEDULER_INTERVAL_MINUTES
+# and spends a slice of the Gemini budget of each REFRESH_WINDOW_HOURS window
+SCHEDULER_INTERVAL_MINUTES = 30
+REFRESH_WINDOW_HOURS = 6
+GEMINI_REFRESH_BUDGET = int(os.environ.get("GEMINI_REFRESH_BUDGET", "120"))
+SCHEDULER_PUBLISH_RATE = float(os.environ.get("SCHEDULER_PUBLISH_RATE", "2"))  # messages/s
+SCHEDULER_MAX_DEMANDED_CITIES = 200
+
+# Expiry of past events: kept this long after they start (undated ones after
+# they were fetched), then deleted by prune_expired_events_v1
+EVENT_RETENTION_HOURS = float(os.environ.get("EVENT_RETENTION_HOURS", "24"))
+UNDATED_EVENT_RETENTION_DAYS = float(os.environ.get("UNDATED_EVENT_RETENTION_DAYS", "14"))
+PRUNE_INTERVAL_HOURS = 6
+PRUNE_PAGE_SIZE = 1000
+PRUNE_MAX_DELETES = int(os.environ.get("PRUNE_MAX_DELETES", "20000"))
+
+# Deduplication of background refreshes: per instance, then across instances
+# via the snapshot's refreshInFlight marker (expires if the worker fails)
+REFRESH_DEBOUNCE_SECONDS = int(os.environ.get("REFRESH_DEBOUNCE_SECONDS", "60"))
+REFRESH_IN_FLIGHT_TTL = int(os.environ.get("REFRESH_IN_FLIGHT_TTL", "600"))
+# Time limit of the fetch-events worker (the maximum for event-driven functions).
+# Batched refreshes requeue the cities they can't finish this long before it
+REFRESH_WORKER_TIMEOUT = 540
+REFRESH_WORKER_MARGIN = 60
+
+_refresh_debounce = TTLCache(max_entries=4096, ttl_seconds=REFRESH_DEBOUNCE_SECONDS)
+
+# Speculative refreshes of the other cities found near a lat/lng request, so
+# they are warm when users pan there. Each city is considered once per dedupe
+# window and refreshes are rate limited per instance.
+PREFETCH_NEIGHBOURS = os.environ.get("PREFETCH_NEIGHBOURS", "true") == "true"
+PREFETCH_PER_MINUTE = float(os.environ.get("PREFETCH_PER_MINUTE", "10"))
+PREFETCH_DEDUPE_SECONDS = int(os.environ.get("PREFETCH_DEDUPE_SECONDS", "900"))
+
+_prefetch_limiter = TokenBucket(PREFETCH_PER_MINUTE / 60, capacity=5)
+_prefetch_seen = TTLCache(max_entries=4096, ttl_seconds=PREFETCH_DEDUPE_SECONDS)
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+# Request counters per city / location (flushed in batches, see demand.py)
+_demand = DemandCounter(lambda: get_db())
+
+# Server-side windowing / pagination in get_events_v1
+MAX_PAGE_SIZE = 500
+
+# Per-instance cache of city event lists (warm instances skip Firestore)
+EVENT_CACHE_TTL = int(os.environ.get("EVENT_CACHE_TTL", "300"))
+EVENT_CACHE_MAX_ENTRIES = int(os.environ.get("EVENT_CACHE_MAX_ENTRIES", "256"))
+EVENT_CACHE_MAX_BYTES = int(os.environ.get("EVENT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+_event_cache = TTLCache(
+    max_entries=EVENT_CACHE_MAX_ENTRIES,
+    max_bytes=EVENT_CACHE_MAX_BYTES,
+    ttl_seconds=EVENT_CACHE_TTL,
+)
+
+# Serialized (and lazily compressed) response bodies per (city, data version).
+# Sized by the uncompressed body; the compressed variants add a fraction of it.
+PAYLOAD_CACHE_MAX_BYTES = int(os.environ.get("PAYLOAD_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_payload_cache = TTLCache(
+    max_entries=EVENT_CACHE_MAX_ENTRIES,
+    max_bytes=PAYLOAD_CACHE_MAX_BYTES,
+    ttl_seconds=3600,
+)
+
+# Cache of Gemini responses per (model, prompt, config, day); persisted in
+# Firestore, or in a local directory if GEMINI_CACHE_DIR is set
+GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_CACHE_DIR = os.environ.get("GEMINI_CACHE_DIR")
+GROUNDED_CONFIG = {'tools': [{'google_search': {}}]}
+
+_gemini_cache = GeminiResponseCache(
+    FileResponseStore(GEMINI_CACHE_DIR) if GEMINI_CACHE_DIR
+    else FirestoreResponseStore(lambda: get_db())
+)
+
+# Time limit of the HTTP functions that may fetch synchronously. The Gemini
+# deadline and the fetch lease are derived from it: a follower waits out the
+# lease and may then fetch itself, both within one request
+HTTP_FUNCTION_TIMEOUT = 180
+
+# Deadline-aware Gemini calls: the ungrounded call is started as a hedge when
+# the grounded one takes longer than usual, grounding is skipped while failing
+GEMINI_CALL_TIMEOUT = float(os.environ.get("GEMINI_CALL_TIMEOUT", "60"))
+# Batched prompts generate output for several cities: extra time per additional city
+GEMINI_BATCH_SECONDS_PER_CITY = float(os.environ.get("GEMINI_BATCH_SECONDS_PER_CITY", "20"))
+GEMINI_DEADLINE_SECONDS = float(os.environ.get("GEMINI_DEADLINE_SECONDS", str(HTTP_FUNCTION_TIMEOUT / 3)))
+GEMINI_HEDGE_PERCENTILE = 0.9
+GEMINI_HEDGE_MIN_DELAY = 5.0
+
+_grounding_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=300)
+# Grounded call latencies: full response / first streamed chunk
+_grounded_latency = LatencyTracker(default=30.0)
+_grounded_first_chunk_latency = LatencyTracker(default=15.0)
+
+# Coalescing of synchronous Gemini fetches (per instance + Firestore lease across instances)
+INSTANCE_ID = uuid.uuid4().hex
+FETCH_LEASE_TTL = int(os.environ.get("FETCH_LEASE_TTL", str(HTTP_FUNCTION_TIMEOUT // 2)))
+
+_fetch_flight = SingleFlight()
+
+def city_events_query(city):
+    return get_db().collection("events").where("city", "==", city)
+
+def query_city_events(city):
+    """
+    Reads all event docs of a city (one read per event), sorted by startTime.
+    """
+    return sort_events([doc.to_dict() for doc in city_events_query(city).stream()])
+
+def load_city_snapshot(city):
+    """
+    Returns {"events", "version", "updatedAt", "churn"} for a city, events sorted by startTime.
+    Served from the per-instance cache, else from the city's snapshot doc (one read),
+    else by querying the event docs (and backfilling the snapshot).
+    The returned dict is shared with the cache and must not be mutated.
+    """
+    snapshot = _event_cache.get(city)
+    if snapshot is not None:
+        annotate(cache="hit")
+        return snapshot
+
+    annotate(cache="miss")
+    db = get_db()
+    snapshot = read_snapshot(db, city_doc_id(city))
+    if snapshot is None:
+        # No snapshot yet (city ingested before snapshots existed). The backfill
+        # is not a refresh: a queued refresh's marker and the age stay as they are
+        events = query_city_events(city)
+        if events:
+            write_snapshot(db, city_doc_id(city), city, events, touch_refresh=False)
+        snapshot = {"events": events, "version": None, "updatedAt": None, "churn": None}
+    _cache_snapshot(city, snapshot)
+    return snapshot
+
+def _cache_snapshot(city, snapshot):
+    # Empty cities are not cached so a fetch on another instance becomes visible
+    if snapshot["events"]:
+        # Serializing here also primes the response body cache
+        size = len(encoded_events(city, snapshot).body)
+        _event_cache.set(city, snapshot, size=size)
+
+def load_city_snapshots(cities):
+    """
+    Returns {city: snapshot} (see load_city_snapshot) for several cities.
+    Cached cities are served from memory, the others are read with one get_all
+    on their snapshot docs; cities without a snapshot doc are queried concurrently.
+    """
+    snapshots = {}
+    missing = []
+    for city in cities:
+        cached = _event_cache.get(city)
+        if cached is not None:
+            snapshots[city] = cached
+        else:
+            missing.append(city)
+    annotate(cache_hits=len(snapshots), cache_misses=len(missing))
+    if not missing:
+        return snapshots
+
+    stored = read_snapshots(get_db(), [city_doc_id(city) for city in missing])
+    unsnapshotted = []
+    for city in missing:
+        snapshot = stored.get(city_doc_id(city))
+        if snapshot is None:
+            unsnapshotted.append(city)
+            continue
+        snapshots[city] = snapshot
+        _cache_snapshot(city, snapshot)
+
+    if unsnapshotted:
+        with ThreadPoolExecutor(max_workers=min(len(unsnapshotted), MAX_BULK_CITIES)) as pool:
+            snapshots.update(zip(unsnapshotted, pool.map(load_city_snapshot, unsnapshotted)))
+    return snapshots
+
+def encoded_events(city, snapshot):
+    """
+    Returns the EncodedBody (JSON body + strong ETag) of a city's events.
+    Versioned snapshots are serialized once per (city, version) and the body
+    is shared by all requests; unversioned lists (window / radius results,
+    backfills) are encoded per call and tagged by content.
+    """
+    version = snapshot.get("version")
+    if version is None:
+        body = encode_json(snapshot["events"])
+        return EncodedBody(body, make_etag(city, hashlib.sha1(body).hexdigest()))
 
-def is_cache_stale(events):
+    key = (city, version)
+    encoded = _payload_cache.get(key)
+    if encoded is None:
+        encoded = EncodedBody(encode_json(snapshot["events"]), make_etag(city, version))
+        _payload_cache.set(key, encoded, size=len(encoded.body))
+    return encoded
+
+def load_city_events(city):
+    """
+    Returns the events of a city sorted by startTime (see load_city_snapshot).
+    """
+    return load_city_snapshot(city)["events"]
+
+def refresh_city_snapshot(city, extra=None, touch_refresh=True):
+    """
+    Rebuilds the snapshot doc of a city from its event docs after a write.
+    touch_refresh=False keeps the city's refresh metadata (see write_snapshot).
+    """
+    rebuild_snapshot(get_db(), city_doc_id(city), city, city_events_query(city), extra, touch_refresh)
+    invalidate_city_events(city)
+
+def invalidate_city_events(city):
+    """
+    Drops the cached event list of a city after it has been written.
+    """
+    _event_cache.invalidate(city)
+
+def parse_coordinates(lat, lng):
+    """
+    Returns the lat/lng query parameters as a (lat, lng) float tuple,
+    or None if either is missing or not a number.
+    """
+    try:
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+def parse_window_params(args):
+    """
+    Reads the optional from/to/limit/cursor/fields query parameters.
+    Returns None if none are given (whole city served from the snapshot).
+    Raises ValueError on malformed values, and for limit/cursor without
+    from/to: windows only cover events with a start time (see
+    query_city_events_window), so paging must not silently drop the rest.
+    """
+    window = {
+        "start": args.get("from"),
+        "end": args.get("to"),
+        "limit": args.get("limit"),
+        "cursor": args.get("cursor"),
+        "fields": args.get("fields"),
+    }
+    if not any(window.values()):
+        return None
+
+    for key in ("start", "end"):
+        if window[key]:
+            window[key] = parse_start_time(window[key])
+            if window[key] is None:
+                raise ValueError(f"Invalid '{'from' if key == 'start' else 'to'}' timestamp")
+    if window["limit"]:
+        window["limit"] = int(window["limit"])
+        if not 0 < window["limit"] <= MAX_PAGE_SIZE:
+            raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    if (window["limit"] or window["cursor"]) and not (window["start"] or window["end"]):
+        raise ValueError("'limit' and 'cursor' require 'from' or 'to'")
+    if window["cursor"]:
+        window["cursor"] = decode_cursor(window["cursor"])
+    if window["fields"]:
+        window["fields"] = [f.strip() for f in window["fields"].split(",") if f.strip()]
+        for name in window["fields"]:
+            # Top-level field names only, anything else is not a valid select() path
+            if not (name.isidentifier() and name.isascii()):
+                raise ValueError(f"Invalid field '{name}'")
+    return window
+
+def encode_cursor(start_ts, doc_id):
+    raw = json.dumps([start_ts.isoformat(), doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        start_ts, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.datetime.fromisoformat(start_ts), doc_id
+    except Exception:
+        raise ValueError("Invalid 'cursor'")
+
+def query_city_events_window(city, start=None, end=None, limit=None, cursor=None, fields=None):
     """
-    Checks if the events are older than 24 hours.
-    Assumes events come from Firestore and have 'fetchedAt'.
+    Reads a time window of a city's events, pushed down into Firestore:
+    filtered and ordered by the normalized 'startTs' (composite index
+    city + startTs), paginated with a cursor and projected to 'fields'.
+    Events without a parseable start time have no startTs and are not
+    included. Returns (events, next_cursor).
+    """
+    query = get_db().collection("events").where("city", "==", city)
+    if start:
+        query = query.where("startTs", ">=", start)
+    if end:
+        query = query.where("startTs", "<", end)
+    query = query.order_by("startTs").order_by("__name__")
+    if cursor:
+        query = query.start_after({"startTs": cursor[0], "__name__": cursor[1]})
+    if fields:
+        # startTs is needed for the cursor even if not requested
+        query = query.select(sorted(set(fields) | {"startTs"}))
+    if limit:
+        query = query.limit(limit)
+
+    docs = list(query.stream())
+    events = []
+    for doc in docs:
+        data = doc.to_dict()
+        if fields and "startTs" not in fields:
+            data.pop("startTs", None)
+        events.append(data)
+
+    next_cursor = None
+    if limit and len(docs) == limit:
+        next_cursor = encode_cursor(docs[-1].get("startTs"), docs[-1].id)
+    return events, next_cursor
+
+def query_events_near(lat, lng, radius_km):
+    """
+    Events within radius_km of a coordinate, across cities: one geohash range
+    query per covering prefix (run concurrently), then exact distance filtering.
+    Sorted by startTime, at most MAX_PAGE_SIZE events; each prefix query reads
+    at most RADIUS_SCAN_LIMIT docs.
+    """
+    collection = get_db().collection("events")
+    prefixes = geohash.covering_prefixes(lat, lng, radius_km)
+
+    def _scan(prefix):
+        query = collection.where("geohash", ">=", prefix).where("geohash", "<", prefix + "~")
+        docs = [doc.to_dict() for doc in query.limit(RADIUS_SCAN_LIMIT).stream()]
+        if len(docs) >= RADIUS_SCAN_LIMIT:
+            print(f"Radius query: Prefix {prefix} hit the scan limit, results may be incomplete")
+        return docs
+
+    with ThreadPoolExecutor(max_workers=min(len(prefixes), RADIUS_QUERY_WORKERS)) as pool:
+        scanned = list(pool.map(_scan, prefixes))
+
+    events = []
+    for batch in scanned:
+        for event in batch:
+            location = event["location"]
+            distance = haversine_km(lat, lng, location["latitude"], location["longitude"])
+            if distance <= radius_km:
+                events.append(event)
+    return sort_events(events)[:MAX_PAGE_SIZE]
+
+def locate_event(event_data, city_name, deadline=None):
+    """
+    Adds 'location' (geocoded from the address unless Gemini provided
+    coordinates) and 'geohash' to an event.
+    """
+    location = event_data.get("location")
+    try:
+        lat, lng = float(location["latitude"]), float(location["longitude"])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f"Coordinates out of range: {lat}, {lng}")
+    except (TypeError, KeyError, ValueError):
+        # Missing, or a place name / malformed coordinates
+        lat = lng = None
+    if lat is not None:
+        event_data["location"] = dict(location, latitude=lat, longitude=lng)
+    else:
+        address = event_data.get("address")
+        if not address:
+            return
+        found = _geocoder.geocode(f"{address}, {city_name}", deadline=deadline)
+        if not found:
+            return
+        lat, lng = found
+        event_data["location"] = {"latitude": lat, "longitude": lng}
+    event_data["geohash"] = geohash.encode(lat, lng, GEOHASH_PRECISION)
+
+def events_refreshed_at(events, refreshed_at=None):
+    """
+    When a city's events were last refreshed, or None if unknown.
+    Uses the city's last refresh time if known (unchanged events keep their
+    original 'fetchedAt' with diff-based refreshes), else the newest 'fetchedAt'
+    of the events (the list is sorted by startTime, not by fetch time).
+    """
+    newest = None
+    for fetched_at in [refreshed_at] if refreshed_at else [e.get("fetchedAt") for e in events or ()]:
+        # Handle both string (JSON) and datetime object (direct DB)
+        if isinstance(fetched_at, str):
+            try:
+                fetched_at = datetime.datetime.fromisoformat(fetched_at)
+            except ValueError:
+                continue
+        if not isinstance(fetched_at, datetime.datetime):
+            continue
+
+        # Ensure UTC awareness
+        if fetched_at.tzinfo is None:
+            fetched_at = fetched_at.replace(tzinfo=datetime.timezone.utc)
+        if newest is None or fetched_at > newest:
+            newest = fetched_at
+    return newest
+
+def events_age_seconds(events, refreshed_at=None):
+    """
+    Seconds since the events were fetched, or None if unknown (see events_refreshed_at).
     """
     if not events:
+        return None
+    fetched_at = events_refreshed_at(events, refreshed_at)
+    if fetched_at is None:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (now - fetched_at).total_seconds()
+
+def freshness_ttl(events, refreshed_at=None, churn=None):
+    """
+    Seconds a city's events stay fresh: learned from the city's churn (24 hours
+    while unknown) and shortened once a share of its upcoming events has
+    started (see staleness.city_ttl).
+    """
+    refreshed_at = events_refreshed_at(events, refreshed_at)
+    due_at = events_due_at(events, refreshed_at) if events and refreshed_at else None
+    return city_ttl(churn, due_at, refreshed_at)
+
+def is_cache_stale(events, refreshed_at=None, churn=None):
+    """
+    Checks if the events are older than the city's TTL (see freshness_ttl).
+    Missing or unparseable timestamps are treated as stale.
+    """
+    age = events_age_seconds(events, refreshed_at)
+    if age is None:
         return True
-        
-    # Check the first event (assuming all batch fetched at same time)
-    fetched_at = events[0].get("fetchedAt")
-    if not fetched_at:
-        return True # Treat missing timestamp as stale
-        
-    # Handle both string (JSON) and datetime object (direct DB)
-    if isinstance(fetched_at, str):
-        try:
-            fetched_at = datetime.datetime.fromisoformat(fetched_at)
-        except ValueError:
-            return True
+    return age > freshness_ttl(events, refreshed_at, churn)
 
-    # Ensure UTC awareness
-    if fetched_at.tzinfo is None:
-        fetched_at = fetched_at.replace(tzinfo=datetime.timezone.utc)
-        
-    now = datetime.datetime.now(datetime.timezone.utc)
-    delta = now - fetched_at
-    
-    # Stale if older than 24h
-    return delta.total_seconds() > 86400
+# Nearby lookups keyed by quantized coordinates (~1 km)
+_nearby_cache = TTLCache(max_entries=4096, ttl_seconds=86400)
+
+def find_nearby_cities(lat, lng, radius_km=50, max_rows=5):
+    """
+    Finds up to `max_rows` cities > 15k inhabitants near a coordinate, nearest first.
+    Answered from the offline GeoNames index; the GeoNames web service is only
+    used as a fallback when the index is not available.
+    """
+    key = (round(lat, 2), round(lng, 2), radius_km, max_rows)
+    cached = _nearby_cache.get(key)
+    if cached is not None:
+        return cached
+
+    index = get_city_index()
+    if index is not None:
+        nearby = index.nearby(key[0], key[1], radius_km=radius_km, max_rows=max_rows)
+    elif GEONAMES_FALLBACK:
+        nearby = find_nearby_cities_via_geonames(key[0], key[1], radius_km, max_rows)
+        if not nearby:
+            return nearby  # Don't cache errors
+    else:
+        nearby = []
+
+    _nearby_cache.set(key, nearby)
+    return nearby
 
-def find_nearby_cities(lat, lng, radius_km=50):
+def find_nearby_cities_via_geonames(lat, lng, radius_km=50, max_rows=5):
     """
-    Queries GeoNames for cities > 15k inhabitants.
+    Queries the GeoNames web service for cities > 15k inhabitants.
     """
-    import requests
     url = "http://api.geonames.org/findNearbyPlaceNameJSON"
     params = {
         "lat": lat,
         "lng": lng,
         "radius": radius_km,
-        "maxRows": 5,
+        "maxRows": max_rows,
         "cities": "cities15000",
         "username": GEONAMES_USER
     }
     try:
-        response = requests.get(url, params=params)
-        return response.json().get("geonames", [])
+        with span("geonames"):
+            response = http_get(url, params=params, timeout=GEONAMES_TIMEOUT)
+            return response.json().get("geonames", [])
     except Exception as e:
         print(f"GeoNames Error: {e}")
         return []
 
-def fetch_events_via_gemini(city_name):
-    """
-    Uses Gemini 1.5 with Search Grounding to find events using the new google.genai library.
-    """
-    if not GEMINI_API_KEY:
-        return json.dumps({"error": "GEMINI_API_KEY not set"})
-    
-    from google import genai
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    
-    prompt = f"""
+def build_events_prompt(city_name):
+    return f"""
     Find as many upcoming events as possible in {city_name} for the next 7 days.
     Aim for at least 30 events if available.
     Include: Title, Date, Location, Category, and a short Description.
     Return the result ONLY as a JSON list of objects.
     Keys: 'title', 'description', 'category', 'startTime', 'address'.
     """
+
+def fetch_events_via_gemini(city_name):
+    """
+    Uses Gemini 1.5 with Search Grounding to find events using the new google.genai library.
+    Answers from the response cache if the same request was made today.
+    """
+    prompt = build_events_prompt(city_name)
+    for config in (GROUNDED_CONFIG, None):
+        cached = _gemini_cache.get(response_key(GEMINI_MODEL, prompt, config))
+        if cached is not None:
+            return cached
+
+    if not GEMINI_API_KEY:
+        return json.dumps({"error": "GEMINI_API_KEY not set"})
     
+    client = get_gemini_client(GEMINI_API_KEY)
+
+    def _generate(config):
+        def _call():
+            response = client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=with_call_timeout(config)
+            )
+            return remember_gemini_response(prompt, config, response.text)
+        return _call
+
     try:
-        # Try with Google Search Grounding using the working model found
+        # Grounded call with an ungrounded hedge (or ungrounded only while grounding fails)
+        with span("gemini"):
+            return hedged_gemini_call(_generate, _grounded_latency,
+                                      is_valid=lambda text: bool(text) and parse_events(text) is not None)
+    except Exception as e:
+        print(f"Gemini Error: {e}")
+        return str(e)
+
+def hedged_gemini_call(make_call, latency, is_valid):
+    """
+    Runs make_call(GROUNDED_CONFIG)() and, if it is slower than the usual
+    `latency` percentile or fails, make_call(None)() as a hedge; returns the
+    first valid result. While the grounding circuit breaker is open only the
+    ungrounded call runs. Raises if nothing valid arrives before the deadline.
+    """
+    if not _grounding_breaker.allow():
+        print("Gemini: Grounding circuit open, calling without tools")
+        return hedged_call(make_call(None), None, 0, GEMINI_DEADLINE_SECONDS, is_valid=is_valid)
+
+    def _record(ok, seconds):
+        if ok:
+            latency.record(seconds)
+            _grounding_breaker.record_success()
+        else:
+            _grounding_breaker.record_failure()
+
+    hedge_delay = max(GEMINI_HEDGE_MIN_DELAY, latency.percentile(GEMINI_HEDGE_PERCENTILE))
+    return hedged_call(make_call(GROUNDED_CONFIG), make_call(None), hedge_delay,
+                       GEMINI_DEADLINE_SECONDS, is_valid=is_valid, on_primary_done=_record)
+
+def with_call_timeout(config, timeout=None):
+    """
+    Request config with the per-call HTTP timeout (GEMINI_CALL_TIMEOUT unless
+    given, in seconds; the API takes milliseconds).
+    """
+    return dict(config or {}, http_options={'timeout': int((timeout or GEMINI_CALL_TIMEOUT) * 1000)})
+
+def batch_call_timeout(city_count):
+    """
+    HTTP timeout of a batched call, scaled with its number of cities but
+    leaving time for the worker to fall back to single-city fetches.
+    """
+    timeout = GEMINI_CALL_TIMEOUT + GEMINI_BATCH_SECONDS_PER_CITY * max(0, city_count - 1)
+    return min(timeout, (REFRESH_WORKER_TIMEOUT - REFRESH_WORKER_MARGIN) / 2)
+
+def remember_gemini_response(prompt, config, text, parse=None):
+    """
+    Caches a response if `parse` (the parser its readers use, parse_events
+    by default) accepts it, so that retries after parse failures still
+    reach the API. Returns the text.
+    """
+    if text and (parse or parse_events)(text) is not None:
+        _gemini_cache.set(response_key(GEMINI_MODEL, prompt, config), text, model=GEMINI_MODEL)
+    return text
+
+# Cities per batched Gemini prompt, adapted to the observed output sizes
+_batch_sizer = BatchSizer()
+
+def fetch_events_batch_via_gemini(city_names):
+    """
+    One grounded Gemini call for several cities, answered as a city-keyed JSON
+    object. Returns (text, output_tokens, truncated); raises on API errors.
+    """
+    prompt = build_batch_prompt(city_names)
+    config = dict(GROUNDED_CONFIG, max_output_tokens=MAX_OUTPUT_TOKENS)
+    cached = _gemini_cache.get(response_key(GEMINI_MODEL, prompt, config))
+    if cached is not None:
+        return cached, 0, False
+
+    if not GEMINI_API_KEY:
+        print("Gemini Error: GEMINI_API_KEY not set")
+        return "", 0, False
+
+    client = get_gemini_client(GEMINI_API_KEY)
+    with span("gemini_batch", cities=len(city_names)):
         response = client.models.generate_content(
-            model="gemini-2.5-flash",
+            model=GEMINI_MODEL,
             contents=prompt,
-            config={
-                'tools': [{'google_search': {}}]
-            }
+            config=with_call_timeout(config, batch_call_timeout(len(city_names)))
         )
-        return response.text
+    truncated = any(
+        getattr(candidate.finish_reason, "name", candidate.finish_reason) == "MAX_TOKENS"
+        for candidate in response.candidates or []
+    )
+    usage = response.usage_metadata
+    output_tokens = (usage.candidates_token_count if usage else 0) or 0
+    text = response.text or ""
+    if not truncated:
+        remember_gemini_response(prompt, config, text, parse_batch_response)
+    return text, output_tokens, truncated
+
+def stream_events_via_gemini(city_name):
+    """
+    Streaming variant of fetch_events_via_gemini: yields text chunks as Gemini
+    generates them. The grounded and ungrounded streams are hedged on the
+    arrival of their first chunk. A cached response is yielded as one chunk.
+    """
+    prompt = build_events_prompt(city_name)
+    for config in (GROUNDED_CONFIG, None):
+        cached = _gemini_cache.get(response_key(GEMINI_MODEL, prompt, config))
+        if cached is not None:
+            yield cached
+            return
+
+    if not GEMINI_API_KEY:
+        print("Gemini Error: GEMINI_API_KEY not set")
+        return
+
+    client = get_gemini_client(GEMINI_API_KEY)
+
+    def _open_stream(config):
+        # Returns (config, first_text, rest) once the first chunk arrived
+        def _call():
+            stream = iter(client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=with_call_timeout(config)
+            ))
+            for chunk in stream:
+                if chunk.text:
+                    return config, chunk.text, stream
+            return None
+        return _call
+
+    try:
+        with span("gemini_first_chunk"):
+            config, first_text, rest = hedged_gemini_call(
+                _open_stream, _grounded_first_chunk_latency, is_valid=lambda opened: opened is not None)
     except Exception as e:
-        print(f"Gemini (with tools) Error: {e}. Retrying without tools...")
-        try:
-            # Fallback without tools if grounding fails
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            return response.text
-        except Exception as e2:
-            print(f"Gemini (no tools) Error: {e2}")
-            return str(e2)
+        print(f"Gemini stream Error: {e}")
+        return
 
-# Track topic existence to avoid redundant creation attempts
-_topic_checked = False
+    received = [first_text]
+    yield first_text
+    try:
+        for chunk in rest:
+            if chunk.text:
+                received.append(chunk.text)
+                yield chunk.text
+    except Exception as e:
+        print(f"Gemini stream aborted: {e}")
+        return
+    remember_gemini_response(prompt, config, "".join(received))
 
-@https_fn.on_request()
+def publish_refresh(city_name):
+    """
+    Queues a background refresh of a city on the fetch-events topic.
+    Returns the publish future.
+    """
+    return _publish_fetch_message({"city": city_name})
+
+def request_refresh(city_name):
+    """
+    Queues a background refresh of a stale city unless one is already on its
+    way. Debounced per instance first, so only the first of many concurrent
+    requests pays for the marker transaction. Returns True if published.
+    """
+    if _refresh_debounce.get(city_name) is not None:
+        return False
+    _refresh_debounce.set(city_name, True)
+    if not claim_refresh(get_db(), city_doc_id(city_name), REFRESH_IN_FLIGHT_TTL):
+        print(f"SWR: Refresh of '{city_name}' already in flight, not publishing")
+        return False
+    publish_refresh(city_name)
+    return True
+
+def schedule_prefetch(city_names):
+    """
+    Runs prefetch_neighbours off the request path.
+    """
+    if city_names:
+        _prefetch_executor.submit(_prefetch_in_background, city_names)
+
+def _prefetch_in_background(city_names):
+    try:
+        prefetch_neighbours(city_names)
+    except Exception as e:
+        print(f"Prefetch Error: {e}")
+
+def prefetch_neighbours(city_names):
+    """
+    Queues background refreshes (via request_refresh and Pub/Sub) for the
+    given cities that have no data or stale data. Skips cities seen within
+    PREFETCH_DEDUPE_SECONDS and stops when the per-instance rate limit is
+    exhausted. Returns the cities a refresh was published for.
+    """
+    candidates = []
+    for name in city_names:
+        if _prefetch_seen.get(name) is not None:
+            continue
+        snapshot = _event_cache.get(name)
+        if snapshot is not None and not is_cache_stale(
+                snapshot["events"], snapshot.get("updatedAt"), snapshot.get("churn")):
+            _prefetch_seen.set(name, True)
+            continue
+        candidates.append(name)
+    if not candidates:
+        return []
+
+    # One read for all candidates, refresh metadata only
+    metadata = read_refresh_metadata(get_db(), [city_doc_id(name) for name in candidates])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    queued = []
+    for name in candidates:
+        meta = metadata.get(city_doc_id(name), {})
+        updated_at = meta.get("updatedAt")
+        if updated_at and (now - updated_at).total_seconds() <= city_ttl(
+                meta.get("churn"), meta.get(DUE_FIELD), updated_at):
+            _prefetch_seen.set(name, True)
+            continue
+        if not _prefetch_limiter.try_acquire():
+            # Not marked as seen, a later request may prefetch it
+            print(f"Prefetch: Rate limit reached, skipping {name}")
+            break
+        _prefetch_seen.set(name, True)
+        if request_refresh(name):
+            queued.append(name)
+    if queued:
+        print(f"Prefetch: Queued refreshes for {', '.join(queued)}")
+    return queued
+
+def publish_refresh_batch(city_names):
+    """
+    Queues one background refresh message for several cities, handled with
+    batched Gemini prompts. Returns the publish future.
+    """
+    return _publish_fetch_message({"cities": list(city_names)})
+
+def _publish_fetch_message(payload):
+    # Lets the worker drop messages for cities refreshed in the meantime
+    payload["requestedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    message_json = json.dumps(payload).encode("utf-8")
+    return get_publisher().publish(get_topic_path(), message_json)
+
+@https_fn.on_request(timeout_sec=HTTP_FUNCTION_TIMEOUT)
+@traced("get_events_v1")
 def get_events_v1(req: https_fn.Request) -> https_fn.Response:
     """
     API Endpoint: Returns events for a location. 
@@ -138,35 +835,54 @@ def get_events_v1(req: https_fn.Request) -> https_fn.Response:
             headers={
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '3600'
             }
         )
 
     print(f"DEBUG: get_events_v1 called from {req.remote_addr} with city={req.args.get('city')}")
-    global _topic_checked
     
     # Accept city directly or fall back to lat/lng lookup
     city = req.args.get("city")
-    lat = req.args.get("lat")
-    lng = req.args.get("lng")
+    coords = parse_coordinates(req.args.get("lat"), req.args.get("lng"))
     
     # If no city provided, try to resolve from coordinates via GeoNames
     if not city:
-        if lat and lng:
-            nearby = find_nearby_cities(float(lat), float(lng), radius_km=30)
+        if coords:
+            with span("city_lookup"):
+                nearby = find_nearby_cities(*coords, radius_km=30)
             if nearby:
                 city = nearby[0].get("name", "Braunschweig")
+                if PREFETCH_NEIGHBOURS:
+                    schedule_prefetch([place["name"] for place in nearby[1:] if place.get("name")])
             else:
                 city = "Braunschweig"  # Default fallback
         else:
             city = "Braunschweig"  # Default for POC
+
+    # Count demand in memory only, flushed off the request path
+    _demand.record(city, *(coords or ()))
+    _demand.maybe_flush()
     
-    # Query for existing events
-    events_ref = get_db().collection("events").where("city", "==", city)
-    docs = list(events_ref.stream())
-    
-    events = [doc.to_dict() for doc in docs]
+    radius_km = req.args.get("radius_km")
+    try:
+        window = parse_window_params(req.args)
+        if radius_km:
+            radius_km = float(radius_km)
+            if not coords or not 0 < radius_km <= MAX_RADIUS_KM:
+                raise ValueError(f"'radius_km' requires lat/lng and must be between 0 and {MAX_RADIUS_KM}")
+    except ValueError as e:
+        return https_fn.Response(
+            json.dumps({"error": str(e)}),
+            status=400,
+            mimetype="application/json",
+            headers={"Access-Control-Allow-Origin": "*"}
+        )
+
+    # Query for existing events (cached per instance)
+    with span("snapshot_read"):
+        snapshot = load_city_snapshot(city)
+    events = snapshot["events"]
     
     # SWR Strategy:
     # 1. No Data OR Force Refresh -> Synchronous Fetch (Wait)
@@ -175,45 +891,192 @@ def get_events_v1(req: https_fn.Request) -> https_fn.Response:
     
     force_refresh = req.args.get("force") == "true"
     
-    if not docs or force_refresh:
+    if not events or force_refresh:
         print(f"SWR: Fetching fresh events for '{city}' (Force: {force_refresh})...")
-        raw_response = fetch_events_via_gemini(city)
-        count = process_and_save_events(city, raw_response)
+        annotate(swr="sync")
+        with span("sync_fetch"):
+            count = fetch_and_save_city(city)
         print(f"SWR: Saved {count} events via sync fetch.")
-        # Re-fetch after saving
-        docs = list(events_ref.stream())
-        events = [doc.to_dict() for doc in docs]
+        # Re-fetch after saving (cache was invalidated by the save)
+        snapshot = load_city_snapshot(city)
+        events = snapshot["events"]
     
-    elif is_cache_stale(events):
+    elif is_cache_stale(events, snapshot.get("updatedAt"), snapshot.get("churn")):
         print(f"SWR: Data for '{city}' is stale. Triggering background update...")
+        annotate(swr="stale")
         try:
-            # Ensure topic exists before publishing (lazy creation, once per instance)
-            if not _topic_checked:
-                try:
-                    get_publisher().create_topic(request={"name": get_topic_path()})
-                    print(f"SWR: Created Pub/Sub topic: {TOPIC_ID}")
-                except Exception:
-                    # Topic likely already exists
-                    pass
-                _topic_checked = True
-
-            message_json = json.dumps({"city": city}).encode("utf-8")
-            future = get_publisher().publish(get_topic_path(), message_json)
+            with span("refresh_trigger"):
+                request_refresh(city)
             # future.result() # Do not wait for result to keep API fast
         except Exception as e:
             print(f"SWR PubSub Error: {e}")
-            
-    events.sort(key=lambda x: str(x.get("startTime", "0")))
+    else:
+        annotate(swr="fresh")
+
+    annotate(city=city)
+    if radius_km:
+        # Radius mode: events near the coordinate, regardless of city
+        with span("radius_query"):
+            events = query_events_near(*coords, radius_km)
+        return events_response(req, city, {"events": events, "version": None})
+
+    if window is not None and not (window["start"] or window["end"]):
+        # Projection only: the whole list, undated events included
+        events = [{key: event[key] for key in window["fields"] if key in event} for event in events]
+        return events_response(req, city, {"events": events, "version": None})
+
+    if window is not None:
+        # Time window / page / projection read directly from the events query
+        with span("window_query"):
+            events, next_cursor = query_city_events_window(city, **window)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return events_response(req, city, {"events": events, "version": None}, headers)
         
-    return https_fn.Response(
-        json.dumps(events, default=str),
-        mimetype="application/json",
-        headers={"Access-Control-Allow-Origin": "*"}  # CORS for frontend
-    )
+    return events_response(req, city, snapshot)
 
-def process_and_save_events(city_name, raw_response):
+def parse_bulk_cities(args):
     """
-    Parses Gemini response and saves structured events to Firestore.
+    Cities of a bulk request: ?cities=A,B,C or the cities within radius_km
+    (default 30) of lat/lng. Raises ValueError for invalid parameters.
+    """
+    cities = [name.strip() for name in (args.get("cities") or "").split(",") if name.strip()]
+    if not cities:
+        lat, lng = args.get("lat"), args.get("lng")
+        if not (lat and lng):
+            raise ValueError("'cities' or 'lat'/'lng' is required")
+        radius_km = float(args.get("radius_km") or 30)
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValueError(f"'radius_km' must be between 0 and {MAX_RADIUS_KM}")
+        with span("city_lookup"):
+            nearby = find_nearby_cities(float(lat), float(lng), radius_km=radius_km,
+                                        max_rows=MAX_BULK_CITIES)
+        cities = [place["name"] for place in nearby if place.get("name")]
+    cities = list(dict.fromkeys(cities))
+    if len(cities) > MAX_BULK_CITIES:
+        raise ValueError(f"At most {MAX_BULK_CITIES} cities per request")
+    return cities
+
+@https_fn.on_request()
+@traced("get_events_bulk_v1")
+def get_events_bulk_v1(req: https_fn.Request) -> https_fn.Response:
+    """
+    API Endpoint: Returns the events of several cities (?cities=A,B,C, or
+    lat/lng and radius_km) merged into one list sorted by startTime.
+    Snapshots are read with one get_all; stale cities and cities without data
+    are refreshed in the background (SWR), the latter are listed in
+    X-Pending-Cities instead of being fetched synchronously.
+    """
+    if req.method == 'OPTIONS':
+        return https_fn.Response(
+            status=204,
+            headers={
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+                'Access-Control-Max-Age': '3600'
+            }
+        )
+
+    try:
+        cities = parse_bulk_cities(req.args)
+    except ValueError as e:
+        return https_fn.Response(
+            json.dumps({"error": str(e)}),
+            status=400,
+            mimetype="application/json",
+            headers={"Access-Control-Allow-Origin": "*"}
+        )
+
+    for city in cities:
+        _demand.record(city)
+    _demand.maybe_flush()
+
+    with span("snapshot_read"):
+        snapshots = load_city_snapshots(cities)
+
+    pending = []
+    with span("refresh_trigger"):
+        for city in cities:
+            snapshot = snapshots[city]
+            if snapshot["events"] and not is_cache_stale(
+                    snapshot["events"], snapshot.get("updatedAt"), snapshot.get("churn")):
+                continue
+            if not snapshot["events"]:
+                pending.append(city)
+            try:
+                request_refresh(city)
+            except Exception as e:
+                print(f"SWR PubSub Error: {e}")
+    annotate(cities=len(cities), pending=len(pending))
+
+    with span("merge"):
+        events = merge_sorted_events([snapshots[city]["events"] for city in cities])
+    versions = [snapshots[city].get("version") for city in cities]
+    updated = [snapshots[city].get("updatedAt") for city in cities if snapshots[city]["events"]]
+    churns = [snapshots[city].get("churn") for city in cities if snapshots[city].get("churn") is not None]
+    combined = {
+        "events": events,
+        # Changes whenever one of the cities changes; None (content ETag) if any is unversioned
+        "version": None if None in versions else ",".join(
+            f"{city}:{version}" for city, version in zip(cities, versions)),
+        # The oldest city decides how long the merged list may be cached
+        "updatedAt": None if None in updated else min(updated, default=None),
+        # The busiest city decides the TTL
+        "churn": max(churns, default=None),
+    }
+    headers = {"X-Pending-Cities": ",".join(pending)} if pending else None
+    return events_response(req, ",".join(cities), combined, headers)
+
+def events_response(req, city, snapshot, extra_headers=None):
+    """
+    Builds the JSON response for a city's events with a strong ETag derived
+    from the data version, conditional 304 handling, Cache-Control mirroring
+    the SWR window and gzip/brotli content negotiation. Bodies of versioned
+    snapshots come pre-serialized and pre-compressed from _payload_cache.
+    """
+    events = snapshot["events"]
+    annotate(events=len(events))
+    with span("serialize"):
+        encoded = encoded_events(city, snapshot)
+    etag = encoded.etag
+
+    age = events_age_seconds(events, snapshot.get("updatedAt"))
+    ttl = freshness_ttl(events, snapshot.get("updatedAt"), snapshot.get("churn")) if events else None
+    if not events:
+        max_age = None
+    elif age is None or age > ttl:
+        max_age = 0  # Refresh in progress, let caches revalidate soon
+    else:
+        max_age = min(HTTP_MAX_AGE, ttl - age)
+
+    headers = {
+        "Access-Control-Allow-Origin": "*",  # CORS for frontend
+        "Access-Control-Expose-Headers": "ETag, X-Next-Cursor, X-Pending-Cities",
+        "Cache-Control": cache_control(max_age, HTTP_STALE_WHILE_REVALIDATE),
+        "Vary": "Accept-Encoding",
+    }
+    headers.update(extra_headers or {})
+
+    accepted = negotiate_encoding(req.headers.get("Accept-Encoding"))
+    if etag_matches(req.headers.get("If-None-Match"), etag):
+        # The ETag the 200 would carry for this coding (RFC 9110, 15.4.5)
+        headers["ETag"] = etag_for_encoding(etag, response_coding(encoded.body, accepted))
+        annotate(status=304)
+        return https_fn.Response(status=304, headers=headers)
+
+    with span("compress"):
+        body, encoding = encoded.variant(accepted)
+    annotate(status=200, bytes=len(body), encoding=encoding)
+    headers["ETag"] = etag_for_encoding(etag, encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    return https_fn.Response(body, mimetype="application/json", headers=headers)
+
+def parse_json_response(raw_response):
+    """
+    Parses the JSON of a Gemini response, bare or in a code fence.
+    Raises ValueError if it can't be parsed.
     """
     # Simple extraction of JSON from Markdown (Gemini often wraps in ```json)
     json_str = raw_response
@@ -221,65 +1084,344 @@ def process_and_save_events(city_name, raw_response):
         json_str = raw_response.split("```json")[1].split("```")[0].strip()
     elif "```" in raw_response:
         json_str = raw_response.split("```")[1].split("```")[0].strip()
-        
+
+    with span("parse"):
+        return json.loads(json_str)
+
+def parse_batch_response(raw_response):
+    """
+    Parses a city-keyed batch response (see batch_fetch).
+    Returns None if it can't be parsed, usually because it was cut off.
+    """
+    try:
+        return parse_json_response(raw_response)
+    except Exception as e:
+        print(f"Batch: JSON Parse Error: {e}. Raw: {str(raw_response)[:200]}")
+        return None
+
+def parse_events(raw_response):
+    """
+    Extracts the JSON list of events from a Gemini response.
+    Returns None if it can't be parsed. Also the check for caching a
+    response, so whatever it accepts must be readable by both fetch paths.
+    """
     try:
-        events = json.loads(json_str)
+        return parse_json_response(raw_response)
     except Exception as e:
+        # Fences missing or around something else: read the event array the
+        # way the streaming path does
+        events = JsonArrayStream().feed(str(raw_response))
+        if events:
+            return events
         # Safeguard: ensure we are slicing a string
         snippet = str(raw_response)[:200]
         print(f"JSON Parse Error: {e}. Raw: {snippet}")
+        return None
+
+def process_and_save_events(city_name, raw_response):
+    """
+    Parses Gemini response and saves structured events to Firestore.
+    """
+    events = parse_events(raw_response)
+    if events is None:
         return 0
-        
-    batch = get_db().batch()
+    return save_events(city_name, events)
+
+def prepare_event(event_data, city_name, deadline=None):
+    """
+    Adds the backend fields to a Gemini event (in place) and returns its document ID.
+    """
+    doc_id = event_id(city_name, event_data)
+    event_data["contentHash"] = content_hash(event_data)
+    event_data["city"] = city_name
+    event_data["fetchedAt"] = datetime.datetime.now(datetime.timezone.utc)
+    # Normalized, indexed start time for window queries
+    start_ts = parse_start_time(event_data.get("startTime"))
+    if start_ts:
+        event_data["startTs"] = start_ts
+    event_data["expiresAt"] = event_expires_at(start_ts, event_data["fetchedAt"])
+    if GEOCODE_AT_INGEST:
+        locate_event(event_data, city_name, deadline)
+    return doc_id
+
+def event_expires_at(start_ts, fetched_at):
+    """
+    When an event may be pruned: EVENT_RETENTION_HOURS after its start, or
+    UNDATED_EVENT_RETENTION_DAYS after it was fetched if it has no start time.
+    """
+    if start_ts:
+        return start_ts + datetime.timedelta(hours=EVENT_RETENTION_HOURS)
+    return fetched_at + datetime.timedelta(days=UNDATED_EVENT_RETENTION_DAYS)
+
+def _geocode_deadline(city_name, events, deadline=None):
+    if not GEOCODE_AT_INGEST:
+        return None
+    # Geocoding gets one time budget per fetch; cached venues are resolved with one get_all
+    _geocoder.prefetch(f"{e.get('address')}, {city_name}" for e in events if e.get("address"))
+    return deadline if deadline is not None else time.monotonic() + GEOCODE_BUDGET_SECONDS
+
+def save_events(city_name, events, refresh_snapshot=True, geocode_deadline=None):
+    """
+    Normalizes events and writes them to Firestore (chunked bulk write).
+    Calls that save parts of one fetch pass the fetch's `geocode_deadline`.
+    """
+    deadline = _geocode_deadline(city_name, events, geocode_deadline)
+    db = get_db()
+    writer = BulkWriter(db, label=f"Save {city_name}")
     for event_data in events:
-        # Create a unique ID based on title and address to avoid simple duplicates
-        title = event_data.get('title', 'Unknown')
-        address = event_data.get('address', 'Unknown')
-        event_id = f"{city_name}_{title}_{address}".replace(" ", "_").replace("/", "_")
-        doc_ref = get_db().collection("events").document(event_id)
-        
-        event_data["city"] = city_name
-        event_data["fetchedAt"] = datetime.datetime.now(datetime.timezone.utc)
-        
-        batch.set(doc_ref, event_data, merge=True)
+        doc_ref = db.collection("events").document(prepare_event(event_data, city_name, deadline))
+        writer.set(doc_ref, event_data, merge=True)
         
-    batch.commit()
+    with span("commit"):
+        writer.flush()
+    if refresh_snapshot:
+        refresh_city_snapshot(city_name)
     return len(events)
 
-@pubsub_fn.on_message_published(topic="fetch-events")
+def refresh_city_events(city_name, events):
+    """
+    Diff-based refresh of a city: compares content hashes with the stored
+    events, upserts only new or changed ones and deletes only the ones that
+    vanished. Unchanged docs are not touched (no writes, no client churn).
+    Returns {"added", "updated", "deleted", "unchanged"}.
+    """
+    db = get_db()
+    collection = db.collection("events")
+    with span("diff_read"):
+        existing = {
+            doc.id: doc.to_dict().get("contentHash")
+            for doc in collection.where("city", "==", city_name).select(["contentHash"]).stream()
+        }
+
+    incoming = {}
+    for event_data in events:
+        incoming[event_id(city_name, event_data)] = event_data
+
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    changed = {}
+    for doc_id, event_data in incoming.items():
+        if doc_id not in existing:
+            stats["added"] += 1
+        elif existing[doc_id] != content_hash(event_data):
+            stats["updated"] += 1
+        else:
+            stats["unchanged"] += 1
+            continue
+        changed[doc_id] = event_data
+
+    writer = BulkWriter(db, label=f"Refresh {city_name}")
+    deadline = _geocode_deadline(city_name, changed.values())
+    for event_data in changed.values():
+        doc_id = prepare_event(event_data, city_name, deadline)
+        writer.set(collection.document(doc_id), event_data)
+    for doc_id in existing.keys() - incoming.keys():
+        writer.delete(collection.document(doc_id))
+        stats["deleted"] += 1
+    with span("commit"):
+        writer.flush()
+    annotate(**stats)
+
+    # Fraction of events that changed, averaged over refreshes; sets the
+    # city's TTL and prioritizes future refreshes
+    churned = stats["added"] + stats["updated"] + stats["deleted"]
+    previous = read_refresh_metadata(db, [city_doc_id(city_name)]).get(city_doc_id(city_name), {})
+    metadata = {"churn": update_churn(previous.get("churn"), churned / max(1, churned + stats["unchanged"]))}
+    if churned:
+        refresh_city_snapshot(city_name, metadata)
+    else:
+        # Same content: only record that the city was refreshed
+        touch_snapshot(db, city_doc_id(city_name), events, metadata)
+        invalidate_city_events(city_name)
+    return stats
+
+def stream_and_save_events(city_name, chunks, batch_size=STREAM_BATCH_SIZE):
+    """
+    Parses a streamed Gemini response incrementally and writes events in small
+    batches as soon as they are complete, so the app's listeners see the first
+    events while the rest is still being generated. Returns the number saved.
+    """
+    parser = JsonArrayStream()
+    received = []
+    pending = []
+    count = 0
+    streamed = False
+    # One geocoding budget for the whole stream, not one per batch
+    deadline = _geocode_deadline(city_name, [])
+    for chunk in chunks:
+        received.append(chunk)
+        if parser.done:
+            # Drain the rest so the stream completes and its response gets cached
+            continue
+        pending.extend(parser.feed(chunk))
+        streamed = streamed or bool(pending)
+        if len(pending) >= batch_size:
+            if not count:
+                print(f"Stream: First {len(pending)} events for {city_name} arrived, saving")
+            count += save_events(city_name, pending, refresh_snapshot=False, geocode_deadline=deadline)
+            pending = []
+    if not streamed and received:
+        # Nothing came out of the stream: read the whole text like the non-streaming path
+        pending = parse_events("".join(received)) or []
+    if pending:
+        count += save_events(city_name, pending, refresh_snapshot=False, geocode_deadline=deadline)
+    if parser.skipped:
+        print(f"Stream: Skipped {parser.skipped} malformed items for {city_name}")
+    if count:
+        refresh_city_snapshot(city_name)
+    return count
+
+def fetch_and_save_city(city_name):
+    """
+    Synchronous discovery for a city, coalesced so that concurrent requests
+    share a single Gemini call: within an instance via single-flight, across
+    instances via a Firestore lease. Returns the number of events saved.
+    """
+    return _fetch_flight.do(city_name, _fetch_and_save_city_once, city_name)
+
+def _fetch_and_save_city_once(city_name):
+    db = get_db()
+    lease_name = f"fetch_{city_doc_id(city_name)}"
+
+    if not acquire_lease(db, lease_name, INSTANCE_ID, FETCH_LEASE_TTL):
+        # Follower: another instance is fetching, wait for its result
+        print(f"SWR: Waiting for in-flight fetch of '{city_name}' on another instance...")
+        if wait_for_lease(db, lease_name, FETCH_LEASE_TTL):
+            invalidate_city_events(city_name)
+            return len(load_city_events(city_name))
+        # Leader vanished (lease expired), fall through and fetch ourselves
+        if not acquire_lease(db, lease_name, INSTANCE_ID, FETCH_LEASE_TTL):
+            print(f"SWR: Lease for '{city_name}' still contended, fetching anyway")
+
+    try:
+        if GEMINI_STREAMING:
+            return stream_and_save_events(city_name, stream_events_via_gemini(city_name))
+        raw_response = fetch_events_via_gemini(city_name)
+        return process_and_save_events(city_name, raw_response)
+    finally:
+        release_lease(db, lease_name, INSTANCE_ID)
+
+@pubsub_fn.on_message_published(topic="fetch-events", timeout_sec=REFRESH_WORKER_TIMEOUT)
+@traced("fetch_events_for_city_pubsub_v1")
 def fetch_events_for_city_pubsub_v1(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublishedData]) -> None:
     """
-    Triggered via Pub/Sub to fetch events for a specific city.
-    Performs a 'clean sweep': Deletes old events -> Fetches new -> Saves new.
+    Triggered via Pub/Sub to fetch events for a specific city, or for several
+    cities ({"cities": [...]}) with batched prompts.
+    Performs a diff-based refresh: Fetches new -> upserts changed -> deletes vanished.
+    If the fetch fails, the existing events are left in place.
     """
     try:
         data = event.data.message.json
-        city_name = data.get("city")
-        if not city_name:
+        city_names = data.get("cities") or ([data["city"]] if data.get("city") else [])
+        city_names = drop_redundant_refreshes(city_names, data.get("requestedAt"))
+        if not city_names:
             return
-            
-        print(f"PubSub: Starting background update for {city_name}...")
-        
-        # 1. Delete all existing events for this city to prevent duplicates/stale data
-        events_ref = get_db().collection("events").where("city", "==", city_name)
-        docs = list(events_ref.stream())
-        
-        if docs:
-            batch = get_db().batch()
-            for doc in docs:
-                batch.delete(doc.reference)
-            batch.commit()
-            print(f"PubSub: Deleted {len(docs)} old events for {city_name}.")
-            
-        # 2. Fetch fresh data
-        raw_response = fetch_events_via_gemini(city_name)
-        count = process_and_save_events(city_name, raw_response)
-        print(f"PubSub: Successfully saved {count} NEW events for {city_name}.")
+
+        if len(city_names) > 1:
+            print(f"PubSub: Starting batched background update for {len(city_names)} cities...")
+            refresh_cities_batched(city_names)
+        else:
+            print(f"PubSub: Starting background update for {city_names[0]}...")
+            refresh_city_from_gemini(city_names[0])
         
     except Exception as e:
         print(f"PubSub Error: {e}")
 
-@https_fn.on_call()
+def drop_redundant_refreshes(city_names, requested_at):
+    """
+    Filters out cities whose snapshot was refreshed after the message was
+    published (by an earlier duplicate message or a synchronous fetch).
+    """
+    if not city_names or not requested_at:
+        return city_names
+    requested_at = datetime.datetime.fromisoformat(requested_at)
+    metadata = read_refresh_metadata(get_db(), [city_doc_id(n) for n in city_names])
+    remaining = []
+    for name in city_names:
+        updated_at = metadata.get(city_doc_id(name), {}).get("updatedAt")
+        if updated_at and updated_at > requested_at:
+            print(f"PubSub: {name} was refreshed after this request, dropping it")
+        else:
+            remaining.append(name)
+    return remaining
+
+def refresh_city_from_gemini(city_name):
+    """
+    Single-city background refresh. Returns the diff stats, or None if the
+    fetch failed and the existing events were kept.
+    """
+    # 1. Fetch fresh data
+    raw_response = fetch_events_via_gemini(city_name)
+    events = parse_events(raw_response)
+    if not events:
+        print(f"PubSub: No events fetched for {city_name}, keeping existing data.")
+        return None
+
+    # 2. Apply the diff against the stored events
+    stats = refresh_city_events(city_name, events)
+    print(f"PubSub: Refreshed {city_name}: {stats}")
+    return stats
+
+def refresh_cities_batched(city_names, budget_seconds=REFRESH_WORKER_TIMEOUT - REFRESH_WORKER_MARGIN):
+    """
+    Refreshes many cities with as few Gemini calls as possible. Each batch
+    response is split per city and saved through the normal diff refresh.
+    Truncated responses are retried with smaller batches; cities that came
+    back empty (or whose batch failed) are fetched individually.
+    Cities that can't be fetched within `budget_seconds` are requeued.
+    Returns {city: diff stats or None} for the cities handled here.
+    """
+    deadline = time.monotonic() + budget_seconds
+    pending = list(dict.fromkeys(city_names))
+    single = []
+    results = {}
+    while pending:
+        batch = pending[:_batch_sizer.size()]
+        if len(batch) == 1:
+            single.append(pending.pop(0))
+            continue
+        if time.monotonic() + batch_call_timeout(len(batch)) > deadline:
+            break
+        try:
+            raw_response, output_tokens, truncated = fetch_events_batch_via_gemini(batch)
+        except Exception as e:
+            # Timeouts and errors shrink later batches like truncated responses do
+            print(f"Batch: Gemini error for {batch}: {e}. Falling back to single-city fetches")
+            _batch_sizer.observe(len(batch), 0, truncated=True)
+            single.extend(batch)
+            del pending[:len(batch)]
+            continue
+
+        parsed = parse_batch_response(raw_response) if raw_response else None
+        # An unparseable object is almost always a response cut off mid-way
+        truncated = truncated or (bool(raw_response) and parsed is None)
+        _batch_sizer.observe(len(batch), output_tokens, truncated)
+        if truncated:
+            print(f"Batch: Response for {len(batch)} cities truncated, retrying with smaller batches")
+            continue
+
+        del pending[:len(batch)]
+        for city_name, events in split_batch_response(parsed, batch).items():
+            if events:
+                results[city_name] = refresh_city_events(city_name, events)
+            else:
+                single.append(city_name)
+
+    if single:
+        print(f"Batch: Fetching {len(single)} cities individually: {single}")
+    while single and time.monotonic() + GEMINI_DEADLINE_SECONDS <= deadline:
+        city_name = single.pop(0)
+        results[city_name] = refresh_city_from_gemini(city_name)
+
+    requeue = single + pending
+    if requeue:
+        print(f"Batch: Out of time, requeueing {len(requeue)} cities: {requeue}")
+        future = publish_refresh_batch(requeue) if len(requeue) > 1 else publish_refresh(requeue[0])
+        # Sent before the worker returns (the publisher batches in the background)
+        future.result(timeout=PUBSUB_PUBLISH_TIMEOUT)
+    return results
+
+@https_fn.on_call(timeout_sec=HTTP_FUNCTION_TIMEOUT)
+@traced("trigger_fetch_v1")
 def trigger_fetch_v1(req: https_fn.CallableRequest) -> dict:
     """
     Manually trigger a fetch and SAVE for a city (for debugging/POC).
@@ -297,12 +1439,185 @@ def trigger_fetch_v1(req: https_fn.CallableRequest) -> dict:
     except Exception as e:
         return {"error": str(e)}
 
-@scheduler_fn.on_schedule(schedule="every 6 hours")
+@https_fn.on_call()
+def get_metrics_v1(req: https_fn.CallableRequest) -> dict:
+    """
+    Stage latency histograms (ms) of sampled traces, client usage and Gemini
+    cache counters of this instance (for debugging/POC).
+    """
+    return {
+        "instance": INSTANCE_ID,
+        "histograms": metrics_snapshot(),
+        "clients": usage_stats(),
+        "geminiCache": _gemini_cache.stats(),
+    }
+
+@https_fn.on_call()
+def get_top_cities_v1(req: https_fn.CallableRequest) -> dict:
+    """
+    Most requested cities in the last hour or day (for debugging/POC).
+    """
+    window = req.data.get("window", "hour")
+    n = int(req.data.get("n", 10))
+    window_hours = 24 if window == "day" else 1
+    return {
+        "window": window,
+        "cities": [{"city": city, "requests": count}
+                   for city, count in top_cities(get_db(), window_hours=window_hours, n=n)],
+    }
+
+@scheduler_fn.on_schedule(schedule=f"every {SCHEDULER_INTERVAL_MINUTES} minutes")
+@traced("scheduled_event_fetch_v1", sample_rate=1.0)
 def scheduled_event_fetch_v1(event: scheduler_fn.ScheduledEvent) -> None:
     """
-    Runs every 6 hours and triggers a fetch for 'active' cities.
+    Runs every 30 minutes and queues background refreshes (Pub/Sub fetch-events)
+    for the cities that need them most: ranked by demand, staleness and churn,
+    limited to this run's slice of the Gemini budget and paced by a rate limit.
     """
-    cities_ref = get_db().collection("cities").where("status", "==", "active")
-    for city_doc in cities_ref.stream():
-        city_name = city_doc.to_dict().get("name")
-        print(f"Scheduled fetch triggered for {city_name}")
+    db = get_db()
+
+    # Candidates: most requested cities of the last day plus all 'active' cities
+    demand = dict(top_cities(db, window_hours=24, n=SCHEDULER_MAX_DEMANDED_CITIES))
+    for city_doc in db.collection("cities").where("status", "==", "active").stream():
+        name = city_doc.to_dict().get("name")
+        if name:
+            demand.setdefault(name, 0)
+
+    plan = plan_refreshes(refresh_candidates(demand), STALE_AFTER_SECONDS, refresh_budget_per_run())
+    # Mark the planned cities as in flight like request_refresh does, so requests
+    # for them don't queue duplicates (and skip cities claimed since the read)
+    plan = [name for name in plan if claim_refresh(db, city_doc_id(name), REFRESH_IN_FLIGHT_TTL)]
+    limiter = TokenBucket(SCHEDULER_PUBLISH_RATE)
+    # Consecutive cities of the plan share one message / batched Gemini prompt
+    batch_size = _batch_sizer.size()
+    futures = []
+    for i in range(0, len(plan), batch_size):
+        batch = plan[i:i + batch_size]
+        limiter.acquire()
+        try:
+            if len(batch) > 1:
+                futures.append((batch, publish_refresh_batch(batch)))
+            else:
+                futures.append((batch, publish_refresh(batch[0])))
+        except Exception as e:
+            print(f"Scheduler PubSub Error for {batch}: {e}")
+    # The publisher sends in the background, the last messages may still be
+    # queued: wait for all of them before the invocation ends
+    for batch, future in futures:
+        try:
+            future.result(timeout=PUBSUB_PUBLISH_TIMEOUT)
+        except Exception as e:
+            print(f"Scheduler PubSub Error for {batch}: {e}")
+    print(f"Scheduled refresh triggered for {len(plan)}/{len(demand)} cities: {plan}")
+
+def refresh_budget_per_run():
+    """
+    Share of the Gemini refresh budget per window for one scheduler run, so
+    refreshes are spread over the window instead of bursting.
+    """
+    runs_per_window = max(1, REFRESH_WINDOW_HOURS * 60 // SCHEDULER_INTERVAL_MINUTES)
+    return math.ceil(GEMINI_REFRESH_BUDGET / runs_per_window)
+
+def refresh_candidates(demand):
+    """
+    Combines demand with each city's refresh metadata (age, churn and its
+    TTL, the same one is_cache_stale applies) read from the snapshot docs. Cities with a refresh already in flight are skipped.
+    """
+    names = list(demand)
+    metadata = read_refresh_metadata(get_db(), [city_doc_id(n) for n in names])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    candidates = []
+    for name in names:
+        meta = metadata.get(city_doc_id(name), {})
+        in_flight_since = meta.get(REFRESH_MARKER_FIELD)
+        if in_flight_since and (now - in_flight_since).total_seconds() < REFRESH_IN_FLIGHT_TTL:
+            continue
+        updated_at = meta.get("updatedAt")
+        candidates.append({
+            "name": name,
+            "demand": demand[name],
+            "age": (now - updated_at).total_seconds() if updated_at else None,
+            "churn": meta.get("churn"),
+            "ttl": city_ttl(meta.get("churn"), meta.get(DUE_FIELD), updated_at),
+        })
+    return candidates
+
+@scheduler_fn.on_schedule(schedule=f"every {PRUNE_INTERVAL_HOURS} hours")
+@traced("prune_expired_events_v1", sample_rate=1.0)
+def prune_expired_events_v1(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Runs every 6 hours and deletes past events (see prune_expired_events).
+    """
+    prune_expired_events()
+
+def prune_expired_events(now=None, max_deletes=None):
+    """
+    Deletes events whose expiresAt has passed in chunked, parallel bulk
+    deletes, then rebuilds the snapshots of the affected cities. Events
+    stored before expiresAt existed are matched by their startTs instead.
+    At most `max_deletes` (PRUNE_MAX_DELETES) per run, the rest follows in
+    the next run. Returns {"deleted", "cities", "seconds"}.
+    """
+    started = time.monotonic()
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    max_deletes = PRUNE_MAX_DELETES if max_deletes is None else max_deletes
+    db = get_db()
+    collection = db.collection("events")
+    writer = BulkWriter(db, label="Prune events")
+    legacy_cutoff = now - datetime.timedelta(hours=EVENT_RETENTION_HOURS)
+    deleted = 0
+    cities = set()
+
+    for field, cutoff in (("expiresAt", now), ("startTs", legacy_cutoff)):
+        while deleted < max_deletes:
+            page_size = min(PRUNE_PAGE_SIZE, max_deletes - deleted)
+            with span("prune_read"):
+                docs = list(collection.where(field, "<", cutoff).select(["city"]).limit(page_size).stream())
+            for doc in docs:
+                writer.delete(doc.reference)
+                cities.add(doc.get("city"))
+            # Deletes must be committed before the next page is queried
+            with span("commit"):
+                writer.flush()
+            deleted += len(docs)
+            if len(docs) < page_size:
+                break
+
+    # Pruning is not a refresh: the cities keep their refresh time and markers
+    with span("snapshots"):
+        for city in sorted(c for c in cities if c):
+            try:
+                refresh_city_snapshot(city, touch_refresh=False)
+            except Exception as e:
+                print(f"Prune: Snapshot rebuild for {city} failed: {e}")
+
+    stats = {"deleted": deleted, "cities": len(cities), "seconds": round(time.monotonic() - started, 3)}
+    annotate(**stats)
+    print(f"Prune: Deleted {deleted} expired events of {stats['cities']} cities in {stats['seconds']:.1f}s")
+    return stats
+
+# Cold start: build the clients this instance's entry point uses in the
+# background while the runtime waits for the first request
+PREWARM_CLIENTS = os.environ.get("PREWARM_CLIENTS", "true") == "true"
+
+def _warm_gemini():
+    if GEMINI_API_KEY:
+        get_gemini_client(GEMINI_API_KEY)
+
+def _warm_publisher():
+    get_publisher()
+    ensure_topic(TOPIC_ID)
+
+ENTRY_POINT_WARMERS = {
+    "get_events_v1": (get_db, _warm_publisher, get_city_index),
+    "get_events_bulk_v1": (get_db, _warm_publisher, get_city_index),
+    "fetch_events_for_city_pubsub_v1": (get_db, _warm_gemini),
+    "trigger_fetch_v1": (get_db, _warm_gemini),
+    "get_top_cities_v1": (get_db,),
+    "scheduled_event_fetch_v1": (get_db, _warm_publisher),
+    "prune_expired_events_v1": (get_db,),
+}
+
+# FUNCTION_TARGET is set by the functions runtime (not during deploy analysis or tests)
+if PREWARM_CLIENTS and os.environ.get("FUNCTION_TARGET") in ENTRY_POINT_WARMERS:
+    prewarm(ENTRY_POINT_WARMERS[os.environ["FUNCTION_TARGET"]])
@@ -0,0 +1,42 @@
+"""
+Ranking of cities for proactive background refreshes.
+
+The scheduled job runs several times per staleness window and refreshes the
+cities that matter most before users hit stale data: popular cities first,
+cities close to (or past) their own staleness threshold (see staleness.py)
+first, and cities whose events change a lot between refreshes first.
+"""
+import math
+
+# Refresh once a city has used up this fraction of its freshness window
+REFRESH_AT_FRACTION = 0.75
+# Churn assumed for cities without an observed refresh yet
+DEFAULT_CHURN = 0.5
+
+
+def refresh_score(age_seconds, ttl_seconds, demand=0, churn=None):
+    """
+    Priority of refreshing a city now (0 if it isn't due yet).
+    Never-refreshed cities (age None) are treated as exactly stale.
+    """
+    age_ratio = 1.0 if age_seconds is None else age_seconds / ttl_seconds
+    if age_ratio < REFRESH_AT_FRACTION:
+        return 0.0
+    churn = DEFAULT_CHURN if churn is None else churn
+    return (1.0 + math.log1p(demand)) * min(age_ratio, 4.0) * (0.5 + churn)
+
+
+def plan_refreshes(cities, ttl_seconds, budget):
+    """
+    cities: iterable of dicts with 'name', 'age' (seconds or None), 'demand',
+    'churn' and optionally the city's own 'ttl' (else `ttl_seconds`).
+    Returns up to `budget` city names, highest priority first.
+    """
+    scored = []
+    for city in cities:
+        ttl = city.get("ttl") or ttl_seconds
+        score = refresh_score(city.get("age"), ttl, city.get("demand", 0), city.get("churn"))
+        if score > 0:
+            scored.append((score, city["name"]))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [name for _, name in scored[:max(0, budget)]]
@@ -0,0 +1,117 @@
+import datetime
+import threading
+import time
+
+from firebase_admin import firestore
+
+LEASES_COLLECTION = "leases"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within an instance.
+    The first caller runs the function, everyone else waits and shares its
+    result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def acquire_lease(db, name, owner, ttl_seconds):
+    """
+    Tries to take the lease doc leases/{name} across instances.
+    Returns True if we are the leader. Expired leases are taken over.
+    """
+    ref = db.collection(LEASES_COLLECTION).document(name)
+
+    @firestore.transactional
+    def _acquire(transaction):
+        snapshot = ref.get(transaction=transaction)
+        now = _now()
+        if snapshot.exists:
+            lease = snapshot.to_dict() or {}
+            expires_at = lease.get("expiresAt")
+            if lease.get("owner") != owner and expires_at and expires_at > now:
+                return False
+        transaction.set(ref, {
+            "owner": owner,
+            "acquiredAt": now,
+            "expiresAt": now + datetime.timedelta(seconds=ttl_seconds),
+        })
+        return True
+
+    return _acquire(db.transaction())
+
+
+def release_lease(db, name, owner):
+    """
+    Releases a lease we hold. Best effort: an expired lease simply times out.
+    """
+    ref = db.collection(LEASES_COLLECTION).document(name)
+    try:
+        snapshot = ref.get()
+        if snapshot.exists and (snapshot.to_dict() or {}).get("owner") == owner:
+            ref.delete()
+    except Exception as e:
+        print(f"Lease release error for {name}: {e}")
+
+
+def wait_for_lease(db, name, timeout_seconds, poll_interval=1.0, sleep=time.sleep):
+    """
+    Polls until the lease is released or has expired.
+    Returns True if the holder released it, False if it expired or we timed out
+    (in which case the caller should do the work itself).
+    """
+    ref = db.collection(LEASES_COLLECTION).document(name)
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        sleep(poll_interval)
+        snapshot = ref.get()
+        if not snapshot.exists:
+            return True
+        expires_at = (snapshot.to_dict() or {}).get("expiresAt")
+        if expires_at and expires_at <= _now():
+            return False
+    return False
@@ -0,0 +1,218 @@
+"""
+Aggregated per-city snapshot documents.
+
+Each city has one document in `citySnapshots` holding its pre-sorted event list
+(compressed if large) and a version number, so serving a city is a single
+point read instead of a query over all its event documents. The per-event
+documents in `events` stay the source of truth for the app's listeners.
+"""
+import datetime
+import heapq
+import json
+import zlib
+
+from firebase_admin import firestore
+
+from http_cache import encode_json
+from staleness import events_due_at
+
+SNAPSHOTS_COLLECTION = "citySnapshots"
+
+# Compress payloads above this size; skip snapshots that can't fit in a doc (1 MiB)
+COMPRESS_THRESHOLD_BYTES = 32 * 1024
+MAX_PAYLOAD_BYTES = 900 * 1024
+
+# Set while a background refresh of the city is queued, cleared by the next snapshot write
+REFRESH_MARKER_FIELD = "refreshInFlight"
+# When enough of the events upcoming at the last refresh have started (see staleness.city_ttl)
+DUE_FIELD = "dueAt"
+
+
+def _start_key(event):
+    return str(event.get("startTime", "0"))
+
+
+def sort_events(events):
+    events.sort(key=_start_key)
+    return events
+
+
+def merge_sorted_events(event_lists):
+    """
+    k-way merge of event lists that are each sorted by startTime (see sort_events).
+    """
+    return list(heapq.merge(*event_lists, key=_start_key))
+
+
+def encode_snapshot(city_name, events):
+    """
+    Builds the snapshot document fields for a sorted event list.
+    Returns None if the payload is too large for a single document.
+    """
+    payload = encode_json(events)
+    encoding = "json"
+    if len(payload) > COMPRESS_THRESHOLD_BYTES:
+        payload = zlib.compress(payload, 6)
+        encoding = "zlib"
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        return None
+    return {
+        "city": city_name,
+        "count": len(events),
+        "encoding": encoding,
+        "payload": payload,
+        "updatedAt": datetime.datetime.now(datetime.timezone.utc),
+    }
+
+
+def decode_snapshot(data):
+    """
+    Returns (events, version, updated_at) from snapshot document fields.
+    Timestamps inside events come back as strings (as in the HTTP response).
+    """
+    payload = data.get("payload") or b"[]"
+    if data.get("encoding") == "zlib":
+        payload = zlib.decompress(payload)
+    events = json.loads(payload)
+    return events, data.get("version", 0), data.get("updatedAt")
+
+
+def read_refresh_metadata(db, doc_ids):
+    """
+    Reads only the refresh metadata (updatedAt, churn, dueAt, refreshInFlight) of many snapshots
+    with one get_all and a field mask. Returns {doc_id: fields}; missing docs are omitted.
+    """
+    refs = [db.collection(SNAPSHOTS_COLLECTION).document(doc_id) for doc_id in doc_ids]
+    if not refs:
+        return {}
+    return {
+        doc.id: doc.to_dict() or {}
+        for doc in db.get_all(refs, field_paths=["updatedAt", "churn", DUE_FIELD, REFRESH_MARKER_FIELD])
+        if doc.exists
+    }
+
+
+def _snapshot_from_doc(data):
+    # Docs holding only refresh metadata (claim_refresh on a city without a
+    # snapshot yet) are not snapshots
+    if "payload" not in data:
+        return None
+    events, version, updated_at = decode_snapshot(data)
+    return {"events": events, "version": version, "updatedAt": updated_at, "churn": data.get("churn")}
+
+
+def read_snapshot(db, doc_id):
+    """
+    Point read of a city snapshot. Returns {"events", "version", "updatedAt",
+    "churn"} or None (also for docs without a stored event list).
+    """
+    doc = db.collection(SNAPSHOTS_COLLECTION).document(doc_id).get()
+    if not doc.exists:
+        return None
+    return _snapshot_from_doc(doc.to_dict() or {})
+
+
+def read_snapshots(db, doc_ids):
+    """
+    Reads many city snapshots with one get_all (a single batched RPC).
+    Returns {doc_id: snapshot} (see read_snapshot); missing docs are omitted.
+    """
+    refs = [db.collection(SNAPSHOTS_COLLECTION).document(doc_id) for doc_id in doc_ids]
+    if not refs:
+        return {}
+    snapshots = {}
+    for doc in db.get_all(refs):
+        snapshot = _snapshot_from_doc(doc.to_dict() or {}) if doc.exists else None
+        if snapshot is not None:
+            snapshots[doc.id] = snapshot
+    return snapshots
+
+
+def _snapshot_fields(city_name, events, extra, touch_refresh):
+    # Fields of a snapshot write, or None if the list is too large
+    fields = encode_snapshot(city_name, events)
+    if fields is None:
+        print(f"Snapshot for {city_name} too large ({len(events)} events), falling back to queries")
+        return None
+    fields["version"] = firestore.Increment(1)
+    if touch_refresh:
+        fields[REFRESH_MARKER_FIELD] = firestore.DELETE_FIELD
+        fields[DUE_FIELD] = events_due_at(events, fields["updatedAt"])
+    else:
+        del fields["updatedAt"]
+    fields.update(extra or {})
+    return fields
+
+
+def write_snapshot(db, doc_id, city_name, events, extra=None, touch_refresh=True):
+    """
+    Stores the sorted event list of a city and bumps its version.
+    `extra` fields (refresh metadata such as churn) are stored alongside.
+    With touch_refresh=False (rebuilds that don't come from a refresh, e.g.
+    after pruning) updatedAt, dueAt and the refreshInFlight marker are left as they are.
+    Returns False (and removes the snapshot) if the list is too large.
+    """
+    ref = db.collection(SNAPSHOTS_COLLECTION).document(doc_id)
+    fields = _snapshot_fields(city_name, events, extra, touch_refresh)
+    if fields is None:
+        ref.delete()
+        return False
+    ref.set(fields, merge=True)
+    return True
+
+
+def rebuild_snapshot(db, doc_id, city_name, query, extra=None, touch_refresh=True):
+    """
+    Rebuilds a city's snapshot from the query over its event docs (see
+    write_snapshot). Reads and write run in one transaction, so of two
+    concurrent rebuilds the one that read an older event list can't
+    overwrite the other's snapshot: it is retried against the current docs.
+    """
+    ref = db.collection(SNAPSHOTS_COLLECTION).document(doc_id)
+
+    @firestore.transactional
+    def _rebuild(transaction):
+        events = sort_events([doc.to_dict() for doc in query.get(transaction=transaction)])
+        fields = _snapshot_fields(city_name, events, extra, touch_refresh)
+        if fields is None:
+            transaction.delete(ref)
+            return False
+        transaction.set(ref, fields, merge=True)
+        return True
+
+    return _rebuild(db.transaction())
+
+
+def touch_snapshot(db, doc_id, events, extra=None):
+    """
+    Marks a snapshot as refreshed without changing its content or version.
+    `events` are the city's (unchanged) events.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    fields = {"updatedAt": now, DUE_FIELD: events_due_at(events, now), REFRESH_MARKER_FIELD: firestore.DELETE_FIELD}
+    fields.update(extra or {})
+    db.collection(SNAPSHOTS_COLLECTION).document(doc_id).set(fields, merge=True)
+    return now
+
+
+def claim_refresh(db, doc_id, ttl_seconds, now=None):
+    """
+    Sets the snapshot's refreshInFlight marker unless another refresh was
+    requested less than `ttl_seconds` ago. Transactional, so of many
+    concurrent requests for a stale city only one queues a refresh.
+    Returns True if the caller should publish the refresh.
+    """
+    ref = db.collection(SNAPSHOTS_COLLECTION).document(doc_id)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+
+    @firestore.transactional
+    def _claim(transaction):
+        snapshot = ref.get(transaction=transaction, field_paths=[REFRESH_MARKER_FIELD])
+        if snapshot.exists:
+            marked_at = (snapshot.to_dict() or {}).get(REFRESH_MARKER_FIELD)
+            if marked_at and (now - marked_at).total_seconds() < ttl_seconds:
+                return False
+        transaction.set(ref, {REFRESH_MARKER_FIELD: now}, merge=True)
+        return True
+
+    return _claim(db.transaction())
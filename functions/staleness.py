@@ -0,0 +1,73 @@
+"""
+Per-city staleness policy.
+
+Every refresh observes the fraction of a city's events that changed (churn).
+An exponentially weighted average of it is stored on the city's snapshot and
+mapped to the city's TTL: cities whose events rarely change are refreshed
+less often (up to MAX_TTL_SECONDS), busy ones more often (down to
+MIN_TTL_SECONDS). A city is also due once a share (DUE_SHARE) of the events
+that were still upcoming at its last refresh have started, so lists that are
+running into the past get refreshed sooner. That time is stored with the
+snapshot (see events_due_at), so the scheduler can apply the same TTL without
+reading the events.
+"""
+import math
+
+from events import parse_start_time
+
+# TTL of cities without observed churn yet (the former fixed threshold)
+DEFAULT_TTL_SECONDS = 86400
+MIN_TTL_SECONDS = 6 * 3600
+MAX_TTL_SECONDS = 72 * 3600
+# Churn at and above which a city gets MIN_TTL_SECONDS
+HIGH_CHURN = 0.5
+# Weight of the latest observation in the churn average
+CHURN_EWMA_ALPHA = 0.5
+# Fraction of the upcoming events that may have started before a city is due
+DUE_SHARE = 0.25
+
+
+def update_churn(previous, observed, alpha=CHURN_EWMA_ALPHA):
+    """
+    Folds the churn observed by one refresh into the city's average.
+    """
+    if previous is None:
+        return observed
+    return alpha * observed + (1 - alpha) * previous
+
+
+def churn_ttl(churn):
+    """
+    TTL in seconds for an average churn, interpolated geometrically from
+    MAX_TTL_SECONDS (no changes) to MIN_TTL_SECONDS (HIGH_CHURN or more).
+    """
+    if churn is None:
+        return DEFAULT_TTL_SECONDS
+    ratio = min(max(churn, 0.0) / HIGH_CHURN, 1.0)
+    return MAX_TTL_SECONDS * math.pow(MIN_TTL_SECONDS / MAX_TTL_SECONDS, ratio)
+
+
+def events_due_at(events, refreshed_at, share=DUE_SHARE):
+    """
+    When `share` of the events that are upcoming at `refreshed_at` (an aware
+    datetime) will have started, or None if there are none.
+    """
+    starts = sorted(
+        start for start in (parse_start_time(event.get("startTs") or event.get("startTime")) for event in events)
+        if start is not None and start > refreshed_at
+    )
+    if not starts:
+        return None
+    return starts[max(1, math.ceil(share * len(starts))) - 1]
+
+
+def city_ttl(churn, due_at=None, refreshed_at=None):
+    """
+    Seconds a city's events stay fresh after `refreshed_at`: the churn based
+    TTL, cut short at `due_at` (see events_due_at) but never below
+    MIN_TTL_SECONDS, so busy cities don't refresh continuously.
+    """
+    ttl = churn_ttl(churn)
+    if due_at is not None and refreshed_at is not None:
+        ttl = min(ttl, max(MIN_TTL_SECONDS, (due_at - refreshed_at).total_seconds()))
+    return ttl
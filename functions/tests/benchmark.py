@@ -0,0 +1,267 @@
+"""
+Offline load test / benchmark for get_events_v1 and the refresh pipeline.
+
+Replays a traffic mix against main.py with the in-memory fakes from
+tests/fakes.py and reports throughput and latency percentiles per scenario:
+
+    hot    fresh, popular cities (served from snapshot / instance cache,
+           some conditional requests)
+    stale  bursts on stale cities (SWR: serve stale, queue one refresh that
+           the fake Pub/Sub delivers to the worker)
+    cold   lookups by coordinate of cities without data (GeoNames, then a
+           synchronous, coalesced Gemini fetch)
+
+Usage (from functions/):
+
+    python -m tests.benchmark                    # run and print the report
+    python -m tests.benchmark --compare          # fail on regressions vs. the baseline
+    python -m tests.benchmark --save-baseline    # store the report as new baseline
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import main
+import tracing
+from demand import DemandCounter
+from gemini_cache import GeminiResponseCache
+from geocoding import Geocoder
+from ratelimit import TokenBucket
+from tests.fakes import FakeFirestore, FakeGemini, FakeHttp, FakePublisher, fake_events
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+# Allowed slowdown of p95 latency / throughput before --compare fails
+DEFAULT_TOLERANCE = 0.5
+
+DEFAULT_CONFIG = {
+    "requests": 2000,
+    "concurrency": 32,
+    "mix": {"hot": 0.8, "stale": 0.15, "cold": 0.05},
+    "hot_cities": 20,
+    "stale_cities": 5,
+    "conditional_fraction": 0.3,
+    "events_per_city": 40,
+    "gemini_latency": 0.2,
+    "firestore_latency": 0.002,
+    "geonames_latency": 0.02,
+    "seed": 42,
+}
+
+
+class FakeRequest:
+    def __init__(self, args, headers=None):
+        self.method = "GET"
+        self.args = args
+        self.headers = headers or {}
+        self.remote_addr = "127.0.0.1"
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    samples = sorted(samples_ms)
+
+    def pct(q):
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+    return {"count": len(samples), "p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99),
+            "max": round(samples[-1], 2)}
+
+
+@contextlib.contextmanager
+def fake_backends(config):
+    """
+    Points main.py at fresh fakes and resets its per-instance state.
+    Yields (db, gemini, http, publisher).
+    """
+    db = FakeFirestore(read_latency=config["firestore_latency"], commit_latency=config["firestore_latency"])
+    gemini = FakeGemini(latency=config["gemini_latency"], events_per_city=config["events_per_city"])
+    http = FakeHttp(latency=config["geonames_latency"])
+
+    def deliver(payload):
+        event = SimpleNamespace(data=SimpleNamespace(message=SimpleNamespace(json=payload)))
+        main.fetch_events_for_city_pubsub_v1.__wrapped__(event)
+
+    publisher = FakePublisher(deliver)
+    state = (main._event_cache, main._payload_cache, main._nearby_cache, main._refresh_debounce,
+             main._prefetch_seen)
+    for cache in state:
+        cache.clear()
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patch("main.get_db", lambda: db))
+        stack.enter_context(patch("main.get_gemini_client", lambda api_key: gemini))
+        stack.enter_context(patch("main.get_publisher", lambda: publisher))
+        stack.enter_context(patch("main.get_topic_path", lambda: "projects/bench/topics/fetch-events"))
+        stack.enter_context(patch("main.http_get", http))
+        stack.enter_context(patch("main.get_city_index", lambda: None))
+        stack.enter_context(patch("main.GEMINI_API_KEY", "fake-key"))
+        # The fake geocoder has no rate limit to respect
+        stack.enter_context(patch("main._geocoder", Geocoder(lambda: db, http_get=http, sleep=lambda s: None)))
+        stack.enter_context(patch("main._demand", DemandCounter(lambda: db)))
+        stack.enter_context(patch("main._gemini_cache", GeminiResponseCache(None)))
+        stack.enter_context(patch("tracing.TRACE_SAMPLE_RATE", 0.0))
+        prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        stack.enter_context(patch("main._prefetch_executor", prefetch))
+        stack.enter_context(patch("main._prefetch_limiter", TokenBucket(main.PREFETCH_PER_MINUTE / 60, capacity=5)))
+        try:
+            yield db, gemini, http, publisher
+        finally:
+            prefetch.shutdown(wait=True)
+            publisher.shutdown()
+            for cache in state:
+                cache.clear()
+
+
+def seed_cities(db, config):
+    """
+    Stores fresh hot cities and backdated stale cities. Returns their names.
+    """
+    hot = [f"Hot City {i}" for i in range(config["hot_cities"])]
+    stale = [f"Stale City {i}" for i in range(config["stale_cities"])]
+    for city in hot + stale:
+        main.save_events(city, fake_events(city, config["events_per_city"]))
+    backdated = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=main.STALE_AFTER_SECONDS + 3600)
+    for city in stale:
+        db.collection("citySnapshots").document(main.city_doc_id(city)).set(
+            {"updatedAt": backdated}, merge=True)
+    main._event_cache.clear()
+    return hot, stale
+
+
+def plan_requests(config, hot, stale):
+    rng = random.Random(config["seed"])
+    scenarios = list(config["mix"])
+    weights = [config["mix"][name] for name in scenarios]
+    # Cold coordinates repeat a little, like several users opening a new city at once
+    cold_pool = max(1, int(config["requests"] * config["mix"].get("cold", 0) / 4))
+    plan = []
+    for _ in range(config["requests"]):
+        scenario = rng.choices(scenarios, weights)[0]
+        if scenario == "hot":
+            # Popularity follows a rough power law
+            city = hot[min(len(hot) - 1, int(rng.paretovariate(1.2)) - 1)]
+            plan.append((scenario, {"city": city}, rng.random() < config["conditional_fraction"]))
+        elif scenario == "stale":
+            plan.append((scenario, {"city": rng.choice(stale)}, False))
+        else:
+            i = rng.randrange(cold_pool)
+            plan.append((scenario, {"lat": f"{40 + i * 0.5:.4f}", "lng": f"{5 + i * 0.5:.4f}"}, False))
+    return plan
+
+
+def run(config=None):
+    """
+    Runs one benchmark and returns the report dict.
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    with fake_backends(config) as (db, gemini, http, publisher):
+        hot, stale = seed_cities(db, config)
+        seeded_calls = gemini.calls
+        plan = plan_requests(config, hot, stale)
+
+        etags = {}
+        etags_lock = threading.Lock()
+        latencies = {name: [] for name in config["mix"]}
+        statuses = {}
+        errors = []
+
+        def _one(item):
+            scenario, args, conditional = item
+            headers = {"Accept-Encoding": "gzip"}
+            if conditional:
+                with etags_lock:
+                    etag = etags.get(args.get("city"))
+                if etag:
+                    headers["If-None-Match"] = etag
+            started = time.perf_counter()
+            try:
+                response = main.get_events_v1(FakeRequest(args, headers))
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            latencies[scenario].append(elapsed_ms)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if "city" in args and response.headers.get("ETag"):
+                with etags_lock:
+                    etags[args["city"]] = response.headers["ETag"]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=config["concurrency"]) as pool:
+            list(pool.map(_one, plan))
+        wall = time.perf_counter() - started
+        publisher.drain()
+
+        all_latencies = [ms for samples in latencies.values() for ms in samples]
+        return {
+            "config": config,
+            "wall_seconds": round(wall, 3),
+            "throughput_rps": round(len(all_latencies) / wall, 1) if wall else 0.0,
+            "scenarios": {name: percentiles(samples) for name, samples in latencies.items()},
+            "all": percentiles(all_latencies),
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+            "errors": len(errors),
+            "gemini_calls": gemini.calls - seeded_calls,
+            "refreshes_published": len(publisher.published),
+            "geonames_requests": http.requests,
+            "firestore": dict(db.stats),
+        }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns a list of regressions of `report` against `baseline`.
+    """
+    regressions = []
+    for name, summary in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name, {})
+        if "p95" in summary and "p95" in before and summary["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{name} p95 {summary['p95']}ms > baseline {before['p95']}ms")
+    if report["throughput_rps"] < baseline.get("throughput_rps", 0) * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} rps < baseline {baseline['throughput_rps']} rps")
+    if report["errors"] > baseline.get("errors", 0):
+        regressions.append(f"{report['errors']} errors")
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=DEFAULT_CONFIG["requests"])
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONFIG["concurrency"])
+    parser.add_argument("--gemini-latency", type=float, default=DEFAULT_CONFIG["gemini_latency"])
+    parser.add_argument("--compare", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run({"requests": args.requests, "concurrency": args.concurrency,
+                  "gemini_latency": args.gemini_latency})
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
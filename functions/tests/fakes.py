@@ -0,0 +1,450 @@
+"""
+In-memory fakes of the backends used by main.py, for load tests and
+benchmarks that must run offline: Firestore (documents, queries, batches,
+get_all, transactions and field transforms), Gemini (configurable latency and
+payload size, streaming), GeoNames / Nominatim over HTTP and Pub/Sub.
+"""
+import copy
+import datetime
+import itertools
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP
+from google.cloud.firestore_v1.transforms import Increment
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _apply(target, data, merge):
+    """
+    Applies a set() payload (with transforms and sentinels) to a stored dict.
+    """
+    result = target if merge else {}
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            result.pop(key, None)
+        elif value is SERVER_TIMESTAMP:
+            result[key] = datetime.datetime.now(datetime.timezone.utc)
+        elif isinstance(value, Increment):
+            current = result.get(key)
+            result[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict) and merge:
+            nested = result.get(key)
+            result[key] = _apply(nested if isinstance(nested, dict) else {}, value, True)
+        elif isinstance(value, dict):
+            result[key] = _apply({}, value, False)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths is not None:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, collection, doc_id):
+        self._db = db
+        self.collection_id = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, transaction=None, field_paths=None, timeout=None):
+        return self._db._read(self, field_paths)
+
+    def set(self, data, merge=False, timeout=None):
+        self._db._write([("set", self, data, merge)])
+
+    def update(self, data):
+        if not self._db._read(self).exists:
+            raise KeyError(f"No document to update: {self.path}")
+        self._db._write([("set", self, data, True)])
+
+    def delete(self):
+        self._db._write([("delete", self, None, False)])
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), orders=(), projection=None, limit=None, after=None):
+        self._db = db
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._projection = projection
+        self._limit = limit
+        self._after = after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, projection=self._projection,
+                     limit=self._limit, after=self._after)
+        state.update(changes)
+        return FakeQuery(self._db, self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def select(self, fields):
+        return self._copy(projection=list(fields))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        return self._copy(after=values)
+
+    def _sort_key(self, doc_id, data):
+        return tuple(doc_id if field == "__name__" else data.get(field) for field, _ in self._orders)
+
+    def stream(self, transaction=None, timeout=None):
+        docs = self._db._scan(self._collection)
+        matches = []
+        for doc_id, data in docs:
+            ok = True
+            for field, op, value in self._filters:
+                # Documents without the field never match (as in Firestore)
+                if field not in data:
+                    ok = False
+                    break
+                try:
+                    ok = _OPERATORS[op](data[field], value)
+                except TypeError:
+                    ok = False
+                if not ok:
+                    break
+            if ok:
+                matches.append((doc_id, data))
+
+        if self._orders:
+            # Firestore excludes documents missing an order_by field
+            matches = [m for m in matches
+                       if all(f == "__name__" or f in m[1] for f, _ in self._orders)]
+            matches.sort(key=lambda m: self._sort_key(*m))
+        if self._after is not None:
+            after = tuple(self._after.get(field) for field, _ in self._orders)
+            matches = [m for m in matches if self._sort_key(*m) > after]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+
+        self._db._count("reads", max(1, len(matches)))
+        for doc_id, data in matches:
+            ref = FakeDocumentReference(self._db, self._collection, doc_id)
+            yield FakeDocumentSnapshot(ref, data, self._projection)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = f"auto{next(self._db._ids):012d}"
+        return FakeDocumentReference(self._db, self._collection, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(("set", ref, data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(("set", ref, data, True))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None, False))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A write batch can contain at most 500 operations")
+        latency = self._db.commit_latency
+        if latency:
+            time.sleep(latency)
+        self._db._write(self._ops)
+        self._db._count("commits")
+        self._ops = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Works with firestore.transactional. Transactions of one database are
+    serialized, which is stricter than Firestore's optimistic concurrency.
+    """
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._id = None
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._db._transaction_lock.acquire()
+        self._id = next(self._db._ids)
+
+    def _commit(self):
+        try:
+            self._db._write(self._ops)
+            self._db._count("commits")
+        finally:
+            self._clean_up()
+            self._db._transaction_lock.release()
+
+    def _rollback(self):
+        if self._id is not None:
+            self._clean_up()
+            self._db._transaction_lock.release()
+
+
+class FakeFirestore:
+    """
+    Thread-safe in-memory Firestore with operation counters.
+    `read_latency` / `commit_latency` (seconds) simulate network round trips.
+    """
+
+    def __init__(self, read_latency=0.0, commit_latency=0.0):
+        self.read_latency = read_latency
+        self.commit_latency = commit_latency
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._transaction_lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.stats = {"reads": 0, "writes": 0, "commits": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        refs = list(refs)
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        with self._lock:
+            self.stats["reads"] += len(refs)
+            docs = [(ref, copy.deepcopy(self._collections.get(ref.collection_id, {}).get(ref.id)))
+                    for ref in refs]
+        for ref, data in docs:
+            yield FakeDocumentSnapshot(ref, data, field_paths)
+
+    def _read(self, ref, field_paths=None):
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        with self._lock:
+            self.stats["reads"] += 1
+            data = copy.deepcopy(self._collections.get(ref.collection_id, {}).get(ref.id))
+        return FakeDocumentSnapshot(ref, data, field_paths)
+
+    def _scan(self, collection):
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data))
+                    for doc_id, data in self._collections.get(collection, {}).items()]
+
+    def _write(self, ops):
+        with self._lock:
+            for kind, ref, data, merge in ops:
+                docs = self._collections.setdefault(ref.collection_id, {})
+                if kind == "delete":
+                    docs.pop(ref.id, None)
+                else:
+                    docs[ref.id] = _apply(docs.get(ref.id, {}) if merge else {}, data, merge)
+                self.stats["writes"] += 1
+
+    def documents(self, collection):
+        """
+        Test helper: {doc_id: data} of a collection.
+        """
+        with self._lock:
+            return copy.deepcopy(self._collections.get(collection, {}))
+
+
+def fake_events(city_name, count=30, description_bytes=200, start=None):
+    """
+    Deterministic event list for a city, shaped like Gemini's output.
+    """
+    start = start or datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=18, minute=0, second=0, microsecond=0)
+    categories = ("Music", "Sports", "Theater", "Food", "Art")
+    return [{
+        "title": f"{city_name} Event {i}",
+        "description": ("Lorem ipsum " * (description_bytes // 12 + 1))[:description_bytes],
+        "category": categories[i % len(categories)],
+        "startTime": (start + datetime.timedelta(days=i % 7, hours=i % 5)).replace(tzinfo=None).isoformat(),
+        "address": f"Street {i}, {city_name}",
+    } for i in range(count)]
+
+
+class FakeGemini:
+    """
+    Stands in for google.genai.Client: answers single-city, batched and
+    streamed prompts with fake_events after `latency` seconds.
+    """
+    _SINGLE = re.compile(r"events as possible in (.+?) for the next 7 days")
+    _BATCH = re.compile(r"^\s*- (.+)$", re.MULTILINE)
+
+    def __init__(self, latency=0.0, events_per_city=30, description_bytes=200, chunk_size=512):
+        self.latency = latency
+        self.events_per_city = events_per_city
+        self.description_bytes = description_bytes
+        self.chunk_size = chunk_size
+        self.models = self
+        self.calls = 0
+        self.cities = []
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        batch = self._BATCH.findall(prompt)
+        if batch:
+            with self._lock:
+                self.cities.extend(batch)
+            return json.dumps({name: fake_events(name, self.events_per_city, self.description_bytes)
+                               for name in batch})
+        single = self._SINGLE.search(prompt)
+        city_name = single.group(1) if single else "Unknown"
+        with self._lock:
+            self.cities.append(city_name)
+        return json.dumps(fake_events(city_name, self.events_per_city, self.description_bytes))
+
+    def generate_content(self, model, contents, config=None):
+        text = "```json\n" + self._answer(contents) + "\n```"
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(finish_reason="STOP")],
+            usage_metadata=SimpleNamespace(candidates_token_count=len(text) // 4),
+        )
+
+    def generate_content_stream(self, model, contents, config=None):
+        text = self._answer(contents)
+        for i in range(0, len(text), self.chunk_size):
+            yield SimpleNamespace(text=text[i:i + self.chunk_size])
+
+
+class FakeHttp:
+    """
+    Stands in for http_get against GeoNames and Nominatim. Nearby lookups
+    return a city named after the rounded coordinate; geocoding returns a
+    point derived from the query text.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, params=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        params = params or {}
+        if "geonames" in url:
+            lat, lng = float(params["lat"]), float(params["lng"])
+            payload = {"geonames": [{
+                "name": f"City {round(lat, 1)}_{round(lng, 1)}",
+                "lat": str(lat), "lng": str(lng), "population": 50000, "distance": "0.0",
+            }]}
+        else:
+            digest = sum(map(ord, params.get("q", ""))) % 1000
+            payload = [{"lat": str(52.0 + digest / 10000), "lon": str(10.5 + digest / 10000)}]
+        return SimpleNamespace(json=lambda: payload, status_code=200)
+
+
+class FakePublisher:
+    """
+    Stands in for the Pub/Sub PublisherClient: delivers each message to
+    `handler(payload)` on a worker pool, like push subscriptions would.
+    """
+
+    def __init__(self, handler=None, max_workers=4):
+        self.handler = handler
+        self.published = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pubsub")
+        self._futures = []
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def create_topic(self, request=None):
+        return None
+
+    def publish(self, topic, data):
+        payload = json.loads(data)
+        with self._lock:
+            self.published.append(payload)
+        if self.handler is None:
+            future = Future()
+            future.set_result(str(len(self.published)))
+            return future
+        future = self._executor.submit(self.handler, payload)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def drain(self, timeout=60):
+        """
+        Waits until all delivered messages (including ones published by
+        handlers) were processed.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                pending = [f for f in self._futures if not f.done()]
+            if not pending:
+                return
+            pending[0].result(timeout=max(0.0, deadline - time.monotonic()))
+        raise TimeoutError("messages still in flight")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
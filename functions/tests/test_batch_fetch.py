@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from batch_fetch import BatchSizer, build_batch_prompt, split_batch_response
+
+
+class TestBatchFetch:
+    def test_prompt_lists_every_city(self):
+        prompt = build_batch_prompt(["Braunschweig", "Hannover"])
+        assert "- Braunschweig" in prompt and "- Hannover" in prompt
+
+    def test_split_matches_keys_and_drops_junk(self):
+        parsed = {
+            "braunschweig ": [{"title": "Basketball"}, "not an event"],
+            "Hannover": "no events",
+            "Berlin": [{"title": "Not requested"}],
+        }
+        assert split_batch_response(parsed, ["Braunschweig", "Hannover", "Wolfsburg"]) == {
+            "Braunschweig": [{"title": "Basketball"}],
+            "Hannover": [],
+            "Wolfsburg": [],
+        }
+        assert split_batch_response([{"title": "x"}], ["Braunschweig"]) == {"Braunschweig": []}
+
+
+class TestBatchSizer:
+    def test_size_fits_output_limit(self):
+        sizer = BatchSizer(max_output_tokens=10000, max_batch=8, tokens_per_city=2500)
+        assert sizer.size() == 3
+
+    def test_truncation_halves_and_success_grows_back(self):
+        sizer = BatchSizer(max_output_tokens=100000, max_batch=8, tokens_per_city=1000)
+        assert sizer.size() == 8
+        sizer.observe(8, 0, truncated=True)
+        assert sizer.size() == 4
+        sizer.observe(4, 4000, truncated=False)
+        assert sizer.size() == 5
+
+    def test_large_outputs_shrink_batches(self):
+        sizer = BatchSizer(max_output_tokens=32768, max_batch=8, tokens_per_city=2400)
+        for _ in range(10):
+            sizer.observe(4, 4 * 12000, truncated=False)
+        assert sizer.size() == 2
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from tests import benchmark
+
+
+def test_small_offline_run_coalesces_fetches_and_refreshes():
+    """Smoke run of the load test: every cold city costs one Gemini call, every stale city one refresh."""
+    report = benchmark.run({
+        "requests": 150, "concurrency": 8, "hot_cities": 5, "stale_cities": 2,
+        "events_per_city": 10, "gemini_latency": 0.05, "firestore_latency": 0.0,
+        "geonames_latency": 0.0,
+    })
+    cold_cities = max(1, int(150 * benchmark.DEFAULT_CONFIG["mix"]["cold"] / 4))
+
+    assert report["errors"] == 0
+    assert sum(report["statuses"].values()) == 150
+    assert report["refreshes_published"] == 2
+    assert report["gemini_calls"] <= cold_cities + 2
+    for summary in report["scenarios"].values():
+        assert summary["count"] == 0 or summary["p50"] <= summary["p95"] <= summary["p99"]
+
+
+def test_compare_flags_regressions():
+    baseline = {"throughput_rps": 100.0, "errors": 0, "scenarios": {"hot": {"p95": 10.0}}}
+    ok = {"throughput_rps": 90.0, "errors": 0, "scenarios": {"hot": {"p95": 12.0}}}
+    slow = {"throughput_rps": 40.0, "errors": 1, "scenarios": {"hot": {"p95": 30.0}}}
+    assert benchmark.compare(ok, baseline, tolerance=0.5) == []
+    assert len(benchmark.compare(slow, baseline, tolerance=0.5)) == 3
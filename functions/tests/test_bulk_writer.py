@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from google.api_core import exceptions
+from bulk_writer import BulkWriteError, BulkWriter
+
+
+class RecordingDb:
+    """Fake client whose batches record committed operation counts."""
+
+    def __init__(self, failures=None):
+        self.committed = []
+        self.failures = list(failures or [])
+        self._lock = threading.Lock()
+
+    def batch(self):
+        db = self
+        ops = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, merge=False: ops.append(("set", ref))
+        batch.delete.side_effect = lambda ref: ops.append(("delete", ref))
+
+        def commit():
+            with db._lock:
+                if db.failures:
+                    raise db.failures.pop(0)
+                db.committed.append(len(ops))
+        batch.commit.side_effect = commit
+        return batch
+
+
+class TestBulkWriter:
+    def test_operations_are_chunked(self):
+        db = RecordingDb()
+        writer = BulkWriter(db, chunk_size=400)
+        for i in range(1001):
+            writer.set(f"ref{i}", {"i": i}, merge=True)
+        stats = writer.flush()
+
+        assert sorted(db.committed) == [201, 400, 400]
+        assert stats["ops"] == 1001
+        assert stats["chunks"] == 3
+
+    def test_single_chunk_is_committed_inline(self):
+        db = RecordingDb()
+        with BulkWriter(db) as writer:
+            writer.delete("ref")
+        assert db.committed == [1]
+        assert writer._executor is None
+
+    def test_transient_errors_are_retried(self):
+        db = RecordingDb(failures=[exceptions.ServiceUnavailable("busy"), exceptions.Aborted("contention")])
+        writer = BulkWriter(db, sleep=lambda s: None)
+        writer.set("ref", {})
+        stats = writer.flush()
+
+        assert db.committed == [1]
+        assert stats["retries"] == 2
+
+    def test_permanent_errors_fail_the_flush(self):
+        db = RecordingDb(failures=[exceptions.InvalidArgument("bad")])
+        writer = BulkWriter(db, sleep=lambda s: None)
+        writer.set("ref", {})
+        with pytest.raises(BulkWriteError) as error:
+            writer.flush()
+        assert error.value.stats["failed_chunks"] == 1
+
+    def test_retries_are_bounded(self):
+        db = RecordingDb(failures=[exceptions.ServiceUnavailable("busy")] * 3)
+        writer = BulkWriter(db, max_attempts=3, sleep=lambda s: None)
+        writer.set("ref", {})
+        with pytest.raises(BulkWriteError):
+            writer.flush()
+        assert db.committed == []
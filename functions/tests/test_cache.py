@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def test_get_and_set(self):
+        cache = TTLCache()
+        cache.set("Braunschweig", [1, 2])
+        assert cache.get("Braunschweig") == [1, 2]
+        assert cache.get("Hannover") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl_seconds=10, clock=clock)
+        cache.set("Braunschweig", [1])
+        clock.now = 9
+        assert cache.get("Braunschweig") == [1]
+        clock.now = 11
+        assert cache.get("Braunschweig") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction_by_entries(self):
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_eviction_by_bytes(self):
+        cache = TTLCache(max_bytes=100)
+        cache.set("a", 1, size=60)
+        cache.set("b", 2, size=60)
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] == 60
+
+    def test_oversized_entry_is_not_cached(self):
+        cache = TTLCache(max_bytes=100)
+        assert cache.set("a", 1, size=101) is False
+        assert cache.get("a") is None
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set("a", 1, size=10)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] == 0
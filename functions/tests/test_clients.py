@@ -0,0 +1,38 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import clients
+
+
+class TestHttpSession:
+    def test_session_is_pooled_with_timeouts_and_retries(self, monkeypatch):
+        monkeypatch.setattr(clients, "_http_session", None)
+        session = clients.get_http_session()
+        assert clients.get_http_session() is session
+
+        adapter = session.get_adapter("https://api.geonames.org")
+        assert adapter.max_retries.total == clients.HTTP_RETRY.total
+        assert adapter._pool_maxsize == clients.HTTP_POOL_SIZE
+
+        sent = []
+        monkeypatch.setattr(requests.Session, "request", lambda self, method, url, **kw: sent.append(kw))
+        before = clients.usage_stats().get("http.requests", 0)
+        clients.http_get("https://api.geonames.org/x")
+        clients.http_get("https://api.geonames.org/x", timeout=1)
+        assert [kw["timeout"] for kw in sent] == [clients.HTTP_TIMEOUT, 1]
+        assert clients.usage_stats()["http.requests"] == before + 2
+
+
+def test_gemini_client_is_built_once_per_key(monkeypatch):
+    monkeypatch.setattr(clients, "_gemini_clients", {})
+    genai = MagicMock()
+    monkeypatch.setitem(sys.modules, "google.genai", genai)
+    monkeypatch.setattr(sys.modules["google"], "genai", genai, raising=False)
+    first = clients.get_gemini_client("key")
+    assert clients.get_gemini_client("key") is first
+    genai.Client.assert_called_once()
+    assert genai.Client.call_args.kwargs["http_options"] == {"timeout": clients.GEMINI_TIMEOUT_SECONDS * 1000}
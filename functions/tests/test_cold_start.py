@@ -0,0 +1,44 @@
+"""
+Cold-start budget: importing main.py (what every new instance does before its
+first request) must stay cheap and must not construct SDK clients.
+"""
+import json
+import os
+import subprocess
+import sys
+
+FUNCTIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+COLD_START_BUDGET_SECONDS = float(os.environ.get("COLD_START_BUDGET_SECONDS", "2.0"))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+import firebase_admin
+print(json.dumps({
+    "seconds": elapsed,
+    "modules": [m for m in ("google.genai", "google.cloud.pubsub_v1") if m in sys.modules],
+    "apps": len(firebase_admin._apps),
+}))
+"""
+
+
+def measure_import():
+    env = {k: v for k, v in os.environ.items() if k != "FUNCTION_TARGET"}
+    # Best of three, a single run is noisy on shared CI machines
+    runs = []
+    for _ in range(3):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=FUNCTIONS_DIR, env=env,
+                             capture_output=True, text=True, check=True, timeout=60)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def test_import_stays_within_budget_and_builds_no_clients():
+    result = measure_import()
+    print(f"main.py import: {result['seconds'] * 1000:.0f} ms (budget {COLD_START_BUDGET_SECONDS * 1000:.0f} ms)")
+    assert result["seconds"] < COLD_START_BUDGET_SECONDS
+    # Heavy SDKs are imported by the clients that need them, not at import
+    assert result["modules"] == []
+    assert result["apps"] == 0
@@ -0,0 +1,66 @@
+import datetime
+import os
+import sys
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from demand import DemandCounter, top_cities
+
+NOW = datetime.datetime(2025, 12, 29, 18, 30, tzinfo=datetime.timezone.utc)
+
+
+class TestDemandCounter:
+    def test_flush_writes_one_aggregated_doc(self):
+        db = MagicMock()
+        counter = DemandCounter(lambda: db, now=lambda: NOW)
+        for _ in range(3):
+            counter.record("Braunschweig", 52.2688, 10.5268)
+        counter.record("Hannover")
+
+        assert counter.flush() == 4
+
+        db.collection.return_value.document.assert_called_once_with(f"2025122918_{counter.shard}")
+        ref = db.collection.return_value.document.return_value
+        fields = ref.set.call_args.args[0]
+        assert fields["cities"]["Braunschweig"].value == 3
+        assert fields["cities"]["Hannover"].value == 1
+        assert fields["locations"]["52.3_10.5"].value == 3
+        assert ref.set.call_args.kwargs == {"merge": True}
+
+        # Nothing new to write
+        assert counter.flush() == 0
+        assert ref.set.call_count == 1
+
+    def test_failed_flush_keeps_counts(self):
+        db = MagicMock()
+        db.collection.return_value.document.return_value.set.side_effect = RuntimeError("unavailable")
+        counter = DemandCounter(lambda: db, now=lambda: NOW)
+        counter.record("Braunschweig")
+        try:
+            counter.flush()
+        except RuntimeError:
+            pass
+        db.collection.return_value.document.return_value.set.side_effect = None
+        assert counter.flush() == 1
+
+    def test_maybe_flush_waits_for_interval(self):
+        clock = [0.0]
+        db = MagicMock()
+        counter = DemandCounter(lambda: db, flush_interval=60, clock=lambda: clock[0], now=lambda: NOW)
+        counter.record("Braunschweig")
+        assert counter.maybe_flush() is False
+        db.collection.assert_not_called()
+
+
+def test_top_cities_sums_shards_and_hours():
+    db = MagicMock()
+    shard_a = MagicMock()
+    shard_a.to_dict.return_value = {"cities": {"Braunschweig": 5, "Hannover": 2}}
+    shard_b = MagicMock()
+    shard_b.to_dict.return_value = {"cities": {"Hannover": 7}}
+    db.collection.return_value.where.return_value.stream.return_value = [shard_a, shard_b]
+
+    assert top_cities(db, window_hours=24, n=1, now=NOW) == [("Hannover", 9)]
+    field, op, buckets = db.collection.return_value.where.call_args.args
+    assert (field, op) == ("bucket", "in")
+    assert buckets[0] == "2025122918" and buckets[-1] == "2025122819"
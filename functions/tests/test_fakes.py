@@ -0,0 +1,75 @@
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from firebase_admin import firestore
+
+from singleflight import acquire_lease, release_lease
+from tests.fakes import FakeFirestore, FakeGemini, FakeHttp, FakePublisher
+
+NOW = datetime.datetime(2025, 12, 29, 18, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestFakeFirestore:
+    def test_queries_filter_order_page_and_project(self):
+        db = FakeFirestore()
+        events = db.collection("events")
+        for i, city in enumerate(["Braunschweig", "Hannover", "Braunschweig", "Braunschweig"]):
+            events.document(f"e{i}").set({"city": city, "startTs": NOW + datetime.timedelta(hours=i), "title": f"E{i}"})
+
+        query = events.where("city", "==", "Braunschweig").order_by("startTs").order_by("__name__")
+        assert [d.id for d in query.stream()] == ["e0", "e2", "e3"]
+        page = list(query.limit(2).stream())
+        rest = query.start_after({"startTs": page[-1].get("startTs"), "__name__": page[-1].id})
+        assert [d.id for d in rest.stream()] == ["e3"]
+        assert list(query.select(["title"]).limit(1).stream())[0].to_dict() == {"title": "E0"}
+        assert [d.id for d in events.where("city", "in", ["Hannover"]).stream()] == ["e1"]
+
+    def test_merge_transforms_and_batches(self):
+        db = FakeFirestore()
+        ref = db.collection("demandCounters").document("b_0")
+        ref.set({"cities": {"Braunschweig": firestore.Increment(2)}, "marker": NOW}, merge=True)
+        ref.set({"cities": {"Braunschweig": firestore.Increment(3), "Hannover": firestore.Increment(1)},
+                 "marker": firestore.DELETE_FIELD}, merge=True)
+        assert ref.get().to_dict() == {"cities": {"Braunschweig": 5, "Hannover": 1}}
+
+        batch = db.batch()
+        batch.set(db.collection("events").document("a"), {"x": 1})
+        batch.delete(ref)
+        batch.commit()
+        assert not ref.get().exists
+        assert [d.id for d in db.get_all([db.collection("events").document("a")]) if d.exists] == ["a"]
+        assert db.stats["commits"] == 1
+
+    def test_transactions_work_with_lease_helpers(self):
+        db = FakeFirestore()
+        assert acquire_lease(db, "fetch_Braunschweig", "a", 60)
+        assert not acquire_lease(db, "fetch_Braunschweig", "b", 60)
+        release_lease(db, "fetch_Braunschweig", "a")
+        assert acquire_lease(db, "fetch_Braunschweig", "b", 60)
+
+
+def test_fake_gemini_answers_single_and_batched_prompts():
+    import main
+    gemini = FakeGemini(events_per_city=3)
+    single = gemini.models.generate_content("m", main.build_events_prompt("Braunschweig"))
+    assert len(main.parse_events(single.text)) == 3
+    chunks = list(gemini.models.generate_content_stream("m", main.build_events_prompt("Hannover")))
+    assert len(main.parse_events("".join(c.text for c in chunks))) == 3
+    batched = gemini.models.generate_content("m", main.build_batch_prompt(["Peine", "Wolfsburg"]))
+    assert set(main.parse_events(batched.text)) == {"Peine", "Wolfsburg"}
+    assert gemini.calls == 3
+
+
+def test_fake_http_and_publisher():
+    http = FakeHttp()
+    assert http("http://api.geonames.org/findNearbyPlaceNameJSON", params={"lat": 52.27, "lng": 10.53}).json()["geonames"]
+    assert http("https://nominatim.openstreetmap.org/search", params={"q": "Markt 1"}).json()[0]["lat"]
+
+    received = []
+    publisher = FakePublisher(received.append)
+    publisher.publish("topic", b'{"city": "Braunschweig"}')
+    publisher.drain()
+    publisher.shutdown()
+    assert received == [{"city": "Braunschweig"}]
@@ -0,0 +1,58 @@
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gemini_cache import FileResponseStore, GeminiResponseCache, response_key
+
+NOW = datetime.datetime(2025, 12, 29, 18, 30, tzinfo=datetime.timezone.utc)
+GROUNDED = {"tools": [{"google_search": {}}]}
+
+
+class TestResponseKey:
+    def test_key_covers_model_prompt_config_and_day(self):
+        key = response_key("gemini-2.5-flash", "events in Braunschweig", GROUNDED, "2025-12-29")
+        assert key == response_key("gemini-2.5-flash", "events in Braunschweig",
+                                   {"tools": [{"google_search": {}}]}, "2025-12-29")
+        assert key != response_key("gemini-2.5-pro", "events in Braunschweig", GROUNDED, "2025-12-29")
+        assert key != response_key("gemini-2.5-flash", "events in Hannover", GROUNDED, "2025-12-29")
+        assert key != response_key("gemini-2.5-flash", "events in Braunschweig", None, "2025-12-29")
+        assert key != response_key("gemini-2.5-flash", "events in Braunschweig", GROUNDED, "2025-12-30")
+
+
+class TestGeminiResponseCache:
+    def test_memory_then_persistent_tier(self, tmp_path):
+        store = FileResponseStore(str(tmp_path))
+        cache = GeminiResponseCache(store, ttl_seconds=3600, now=lambda: NOW)
+        assert cache.get("k") is None
+        cache.set("k", "[]")
+        assert cache.get("k") == "[]"
+
+        # A fresh instance (cold memory tier) finds the entry in the store
+        other = GeminiResponseCache(store, ttl_seconds=3600, now=lambda: NOW)
+        assert other.get("k") == "[]"
+        assert other.get("k") == "[]"
+        assert cache.stats()["memory_hits"] == 1 and cache.stats()["misses"] == 1
+        assert other.stats()["store_hits"] == 1 and other.stats()["memory_hits"] == 1
+
+    def test_persistent_entries_expire(self, tmp_path):
+        store = FileResponseStore(str(tmp_path))
+        GeminiResponseCache(store, ttl_seconds=60, now=lambda: NOW).set("k", "[]")
+        later = GeminiResponseCache(store, ttl_seconds=60,
+                                    now=lambda: NOW + datetime.timedelta(seconds=61))
+        assert later.get("k") is None
+        assert later.stats()["hit_rate"] == 0.0
+
+    def test_store_errors_degrade_to_misses(self):
+        class BrokenStore:
+            def get(self, key, now):
+                raise RuntimeError("unavailable")
+
+            def set(self, key, text, expires_at, model=None):
+                raise RuntimeError("unavailable")
+
+        cache = GeminiResponseCache(BrokenStore(), now=lambda: NOW)
+        assert cache.get("k") is None
+        cache.set("k", "[]")
+        assert cache.get("k") == "[]"
+        assert cache.stats()["store_errors"] == 2
@@ -0,0 +1,99 @@
+import math
+import os
+import sys
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import geohash
+from geocoding import Geocoder, geocode_key
+from geoindex import haversine_km
+
+
+class TestGeohash:
+    def test_encode_known_value(self):
+        assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+    def test_covering_prefixes_contain_points_in_radius(self):
+        lat, lng = 52.2688, 10.5268
+        prefixes = geohash.covering_prefixes(lat, lng, 10)
+        assert 1 <= len(prefixes) <= geohash.MAX_COVERING_CELLS
+        for dlat, dlng in [(0.08, 0), (-0.08, 0), (0, 0.13), (0, -0.13), (0.05, 0.05)]:
+            point = (lat + dlat, lng + dlng)
+            assert haversine_km(lat, lng, *point) <= 10
+            code = geohash.encode(*point)
+            assert any(code.startswith(p) for p in prefixes)
+
+    def test_covering_stays_close_to_the_circle(self):
+        """At the app's 30 km radius the cells cover a few times the circle, not whole regions."""
+        lat, lng, radius = 52.2688, 10.5268, 30
+        prefixes = geohash.covering_prefixes(lat, lng, radius)
+        assert len(prefixes) <= geohash.MAX_COVERING_CELLS
+        assert len(prefixes[0]) >= 4
+        height, width = geohash.cell_size_degrees(len(prefixes[0]))
+        cell_km2 = height * geohash.KM_PER_DEGREE_LAT * width * geohash.KM_PER_DEGREE_LAT * math.cos(math.radians(lat))
+        assert len(prefixes) * cell_km2 < 4 * math.pi * radius ** 2
+
+    def test_larger_radius_uses_shorter_prefixes(self):
+        small = geohash.covering_prefixes(52.2688, 10.5268, 1)
+        large = geohash.covering_prefixes(52.2688, 10.5268, 80)
+        assert len(large[0]) < len(small[0])
+
+
+def _geocoder(results):
+    db = MagicMock()
+    db.collection.return_value.document.return_value.get.return_value.exists = False
+    response = MagicMock()
+    response.json.return_value = results
+    http_get = MagicMock(return_value=response)
+    return Geocoder(lambda: db, http_get=http_get, sleep=lambda s: None), db, http_get
+
+
+class TestGeocoder:
+    def test_lookup_is_persisted_and_cached_in_memory(self):
+        geocoder, db, http_get = _geocoder([{"lat": "52.2625", "lon": "10.5211"}])
+
+        assert geocoder.geocode("Schlossplatz 1, Braunschweig") == (52.2625, 10.5211)
+        assert geocoder.geocode("schlossplatz  1, braunschweig") == (52.2625, 10.5211)
+
+        assert http_get.call_count == 1
+        saved = db.collection.return_value.document.return_value.set.call_args.args[0]
+        assert saved["found"] is True
+        db.collection.assert_called_with("geocodeCache")
+
+    def test_persistent_tier_hit_skips_service(self):
+        geocoder, db, http_get = _geocoder([])
+        doc = db.collection.return_value.document.return_value.get.return_value
+        doc.exists = True
+        doc.to_dict.return_value = {"found": True, "lat": 52.0, "lng": 10.0}
+
+        assert geocoder.geocode("Markt 1, Braunschweig") == (52.0, 10.0)
+        http_get.assert_not_called()
+
+    def test_misses_are_cached(self):
+        geocoder, _, http_get = _geocoder([])
+        assert geocoder.geocode("Nowhere") is None
+        assert geocoder.geocode("Nowhere") is None
+        assert http_get.call_count == 1
+
+    def test_deadline_skips_service(self):
+        geocoder, _, http_get = _geocoder([{"lat": "1", "lon": "2"}])
+        assert geocoder.geocode("Markt 1", deadline=0) is None
+        http_get.assert_not_called()
+
+    def test_prefetch_uses_get_all(self):
+        geocoder, db, http_get = _geocoder([])
+        doc = MagicMock(exists=True, id=geocode_key("Markt 1"))
+        doc.to_dict.return_value = {"found": True, "lat": 52.0, "lng": 10.0}
+        db.get_all.return_value = [doc]
+
+        geocoder.prefetch(["Markt 1"])
+        assert geocoder.geocode("Markt 1") == (52.0, 10.0)
+        db.collection.return_value.document.return_value.get.assert_not_called()
+
+    def test_prefetch_remembers_missing_docs(self):
+        geocoder, db, http_get = _geocoder([])
+        db.get_all.return_value = []
+
+        geocoder.prefetch(["Markt 1"])
+        assert geocoder.geocode("Markt 1", deadline=0) is None
+        db.collection.return_value.document.return_value.get.assert_not_called()
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from geoindex import CityIndex, haversine_km
+
+CITIES = [
+    (2945024, "Braunschweig", 52.26594, 10.52673, "DE", 248292),
+    (2910831, "Hannover", 52.37052, 9.73322, "DE", 515140),
+    (2807184, "Wolfsburg", 52.42452, 10.7815, "DE", 123064),
+    (2950159, "Berlin", 52.52437, 13.41053, "DE", 3426354),
+    (2643743, "London", 51.50853, -0.12574, "GB", 8961989),
+    (4030939, "Suva", -18.14161, 178.44149, "FJ", 77366),
+]
+
+DUMP_LINE = "\t".join([
+    "2945024", "Braunschweig", "Braunschweig", "Brunswick", "52.26594", "10.52673",
+    "P", "PPLA2", "DE", "", "06", "00", "03101", "03101000", "248292", "", "75",
+    "Europe/Berlin", "2020-01-01",
+])
+
+
+class TestCityIndex:
+    def test_haversine(self):
+        assert haversine_km(52.26594, 10.52673, 52.37052, 9.73322) == pytest.approx(55.2, abs=0.5)
+
+    def test_nearest_first_within_radius(self):
+        index = CityIndex(CITIES)
+        nearby = index.nearby(52.2688, 10.5268, radius_km=30)
+        assert [c["name"] for c in nearby] == ["Braunschweig", "Wolfsburg"]
+        assert float(nearby[0]["distance"]) < 1
+
+    def test_max_rows(self):
+        index = CityIndex(CITIES)
+        nearby = index.nearby(52.3, 10.5, radius_km=300, max_rows=2)
+        assert len(nearby) == 2
+
+    def test_nothing_in_radius(self):
+        index = CityIndex(CITIES)
+        assert index.nearby(0.0, 0.0, radius_km=50) == []
+
+    def test_antimeridian(self):
+        index = CityIndex(CITIES)
+        nearby = index.nearby(-18.1, -179.9, radius_km=300)
+        assert [c["name"] for c in nearby] == ["Suva"]
+
+    def test_from_geonames_dump(self, tmp_path):
+        path = tmp_path / "cities15000.txt"
+        path.write_text(DUMP_LINE + "\nbroken line\n", encoding="utf-8")
+        index = CityIndex.from_geonames_dump(str(path))
+        assert len(index) == 1
+        assert index.nearby(52.27, 10.53, radius_km=10)[0]["population"] == 248292
+
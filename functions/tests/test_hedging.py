@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from hedging import CircuitBreaker, LatencyTracker, hedged_call
+
+
+def slow(value, seconds, release=None):
+    def _call():
+        if release is not None:
+            release.wait(seconds)
+        else:
+            time.sleep(seconds)
+        return value
+    return _call
+
+
+def failing():
+    raise RuntimeError("grounding failed")
+
+
+class TestHedgedCall:
+    def test_fast_primary_never_starts_fallback(self):
+        started = []
+        def fallback():
+            started.append(True)
+            return "fallback"
+        assert hedged_call(lambda: "primary", fallback, hedge_delay=1.0, deadline=2.0) == "primary"
+        assert started == []
+
+    def test_slow_primary_is_hedged(self):
+        release = threading.Event()
+        result = hedged_call(slow("primary", 5, release), slow("fallback", 0), hedge_delay=0.05,
+                             deadline=2.0)
+        release.set()
+        assert result == "fallback"
+
+    def test_failed_primary_falls_back_immediately(self):
+        begin = time.monotonic()
+        assert hedged_call(failing, slow("fallback", 0), hedge_delay=10, deadline=20) == "fallback"
+        assert time.monotonic() - begin < 1
+
+    def test_invalid_results_are_skipped(self):
+        result = hedged_call(lambda: "", lambda: "[]", hedge_delay=10, deadline=20, is_valid=bool)
+        assert result == "[]"
+
+    def test_deadline_bounds_the_wait(self):
+        release = threading.Event()
+        begin = time.monotonic()
+        with pytest.raises(TimeoutError):
+            hedged_call(slow("primary", 5, release), slow("fallback", 5, release),
+                        hedge_delay=0.05, deadline=0.2)
+        release.set()
+        assert time.monotonic() - begin < 1
+
+    def test_all_failures_raise_last_error(self):
+        with pytest.raises(RuntimeError):
+            hedged_call(failing, failing, hedge_delay=0, deadline=1)
+
+
+class TestCircuitBreaker:
+    def test_opens_after_failures_and_half_opens(self):
+        clock = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60, clock=lambda: clock[0])
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        clock[0] = 61
+        assert breaker.allow()       # one trial call
+        assert not breaker.allow()   # others wait for its outcome
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        clock[0] = 122
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(default=15.0, min_samples=5)
+    assert tracker.percentile(0.9) == 15.0
+    for seconds in range(1, 11):
+        tracker.record(seconds)
+    assert tracker.percentile(0.9) == 10
+    assert tracker.percentile(0.5) == 6
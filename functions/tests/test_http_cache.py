@@ -0,0 +1,98 @@
+import datetime
+import gzip
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import http_cache
+from http_cache import (
+    EncodedBody, cache_control, compress, encode_json, etag_for_encoding, etag_matches, make_etag,
+    negotiate_encoding,
+)
+
+
+class TestETags:
+    def test_etag_is_stable_and_quoted(self):
+        etag = make_etag("Braunschweig", 3)
+        assert etag == make_etag("Braunschweig", 3)
+        assert etag != make_etag("Braunschweig", 4)
+        assert etag.startswith('"') and etag.endswith('"')
+
+    def test_matches_across_codings_and_weak_tags(self):
+        etag = make_etag("Braunschweig", 3)
+        gzip_etag = etag_for_encoding(etag, "gzip")
+        assert gzip_etag != etag
+        assert etag_matches(gzip_etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+
+
+class TestNegotiation:
+    def test_identity_without_header(self):
+        assert negotiate_encoding(None) == "identity"
+        assert negotiate_encoding("deflate") == "identity"
+
+    def test_gzip(self, monkeypatch):
+        monkeypatch.setattr(http_cache, "brotli", None)
+        assert negotiate_encoding("gzip, deflate, br") == "gzip"
+        assert negotiate_encoding("gzip;q=0") == "identity"
+
+    def test_prefers_brotli_when_available(self, monkeypatch):
+        monkeypatch.setattr(http_cache, "brotli", object())
+        assert negotiate_encoding("gzip, br") == "br"
+        assert negotiate_encoding("gzip, br;q=0.5") == "gzip"
+
+    def test_compress_skips_small_bodies(self):
+        assert compress(b"[]", "gzip") == (b"[]", "identity")
+        body = b"[" + b'{"title": "Jazz Night"},' * 100 + b"{}]"
+        compressed, encoding = compress(body, "gzip")
+        assert encoding == "gzip"
+        assert gzip.decompress(compressed) == body
+
+
+def test_cache_control():
+    assert cache_control(300, 3600) == "public, max-age=300, stale-while-revalidate=3600"
+    assert cache_control(None, 3600) == "no-cache"
+
+
+class TestEncoding:
+    EVENTS = [{"title": "Jazz Night", "city": "Braunschweig",
+               "fetchedAt": datetime.datetime(2025, 12, 29, 12, 0, 30, 500, tzinfo=datetime.timezone.utc)}]
+
+    def test_encodes_datetimes_as_iso_8601(self):
+        decoded = json.loads(encode_json(self.EVENTS))
+        assert decoded[0]["fetchedAt"] == "2025-12-29T12:00:30.000500+00:00"
+
+    def test_encodes_firestore_timestamps_as_iso_8601(self, monkeypatch):
+        from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+        events = [{"fetchedAt": DatetimeWithNanoseconds(2025, 1, 1, 12, 0, 0, 123456,
+                                                        tzinfo=datetime.timezone.utc)}]
+        expected = b'[{"fetchedAt":"2025-01-01T12:00:00.123456+00:00"}]'
+        assert encode_json(events) == expected
+        monkeypatch.setattr(http_cache, "orjson", None)
+        assert encode_json(events) == expected
+
+    def test_stdlib_fallback_matches(self, monkeypatch):
+        expected = encode_json(self.EVENTS + [{"title": "Café"}])
+        monkeypatch.setattr(http_cache, "orjson", None)
+        assert encode_json(self.EVENTS + [{"title": "Café"}]) == expected
+
+    def test_encoded_body_compresses_once_per_coding(self, monkeypatch):
+        calls = []
+
+        def _compress(body, encoding):
+            calls.append(encoding)
+            return compress(body, encoding)
+
+        monkeypatch.setattr(http_cache, "compress", _compress)
+        body = encode_json([{"title": "Jazz Night", "description": "x" * 100}] * 20)
+        encoded = EncodedBody(body, make_etag("Braunschweig", 1))
+
+        assert encoded.variant("identity") == (body, "identity")
+        gzipped, encoding = encoded.variant("gzip")
+        assert encoding == "gzip" and gzip.decompress(gzipped) == body
+        assert encoded.variant("gzip")[0] is gzipped
+        assert calls == ["gzip"]
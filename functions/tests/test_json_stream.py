@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from json_stream import JsonArrayStream
+
+
+class TestJsonArrayStream:
+    def test_objects_are_emitted_when_complete(self):
+        stream = JsonArrayStream()
+        assert stream.feed('```json\n[{"title": "Jazz') == []
+        assert stream.feed(' Night"}, {"title"') == [{"title": "Jazz Night"}]
+        assert stream.feed(': "Basketball"}]\n```') == [{"title": "Basketball"}]
+        assert stream.done
+
+    def test_braces_and_quotes_inside_strings(self):
+        stream = JsonArrayStream()
+        text = '[{"title": "Party {\\"VIP\\"} [2025]", "tags": ["a", {"b": 1}]}]'
+        assert stream.feed(text) == [{"title": 'Party {"VIP"} [2025]', "tags": ["a", {"b": 1}]}]
+
+    def test_char_by_char(self):
+        stream = JsonArrayStream()
+        objects = []
+        for ch in 'Sure! [{"a": 1}, {"b": "x\\\\"}, {"c": [1, 2]}] trailing {"d": 4}':
+            objects.extend(stream.feed(ch))
+        assert objects == [{"a": 1}, {"b": "x\\"}, {"c": [1, 2]}]
+
+    def test_malformed_items_are_skipped(self):
+        stream = JsonArrayStream()
+        assert stream.feed('[{"a": 1,}, "text", {"b": 2}]') == [{"b": 2}]
+        assert stream.skipped == 1
+
+    def test_brackets_in_prose_before_the_array(self):
+        stream = JsonArrayStream()
+        text = 'Here are events in Braunschweig [Oct 17-24]:\n```json\n[{"title": "A"}, {"title": "B"}]\n```'
+        objects = []
+        for ch in text:
+            objects.extend(stream.feed(ch))
+        assert objects == [{"title": "A"}, {"title": "B"}]
+        assert stream.done
+
+    def test_unclosed_bracket_before_code_fence(self):
+        stream = JsonArrayStream()
+        assert stream.feed('Events [updated daily:\n```json\n[{"title": "A"}]\n```') == [{"title": "A"}]
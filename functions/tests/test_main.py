@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import MagicMock, patch
+import gzip
 import json
 import sys
 import os
@@ -12,14 +13,57 @@ with patch('firebase_admin.initialize_app'), patch('firebase_admin.firestore.cli
     import main
     main.GEMINI_API_KEY = 'test-key' # Ensure it's set in the module scope
 
+@pytest.fixture(autouse=True)
+def clear_event_cache():
+    main._event_cache.clear()
+    main._nearby_cache.clear()
+    main._gemini_cache.clear()
+    main._refresh_debounce.clear()
+    main._payload_cache.clear()
+    main._prefetch_seen.clear()
+    yield
+    main._event_cache.clear()
+    main._nearby_cache.clear()
+    main._gemini_cache.clear()
+    main._refresh_debounce.clear()
+    main._payload_cache.clear()
+    main._prefetch_seen.clear()
+
+@pytest.fixture(autouse=True)
+def mock_lease():
+    """Single instance: the cross-instance fetch lease is always ours."""
+    with patch('main.acquire_lease', return_value=True) as acquire, patch('main.release_lease'):
+        yield acquire
+
+@pytest.fixture(autouse=True)
+def mock_geocoder():
+    """No geocoding service calls in unit tests."""
+    with patch('main._geocoder') as geocoder:
+        geocoder.geocode.return_value = None
+        yield geocoder
+
+@pytest.fixture(autouse=True)
+def mock_demand():
+    """Demand counters are not flushed from unit tests."""
+    with patch('main._demand') as demand:
+        yield demand
+
+@pytest.fixture(autouse=True)
+def mock_prefetch():
+    """Neighbour prefetches are not scheduled in the background from unit tests."""
+    with patch('main.schedule_prefetch') as schedule:
+        yield schedule
+
 @pytest.fixture
 def mock_db():
     with patch('main.get_db') as mock:
+        # No city snapshot docs by default (reads fall back to the events query)
+        mock.return_value.collection.return_value.document.return_value.get.return_value.exists = False
         yield mock
 
 @pytest.fixture
 def mock_genai_client():
-    with patch('main.genai.Client') as mock:
+    with patch('main.get_gemini_client') as mock:
         yield mock
 
 def test_get_events_v1_success(mock_db):
@@ -61,6 +105,404 @@ def test_get_events_v1_success(mock_db):
     assert data[0]["title"] == "Basketball"
     assert data[1]["title"] == "Jazz Night"
 
+def test_get_events_v1_serves_warm_cache(mock_db):
+    """Second request for the same city is served without touching Firestore."""
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+
+    mock_query = mock_db.return_value.collection.return_value.where.return_value
+    mock_doc = MagicMock()
+    mock_doc.to_dict.return_value = {
+        "title": "Jazz Night",
+        "startTime": "2025-12-30T20:00",
+        "city": "Braunschweig",
+        "fetchedAt": main.datetime.datetime.now(main.datetime.timezone.utc)
+    }
+    mock_query.stream.return_value = [mock_doc]
+
+    first = main.get_events_v1(req)
+    second = main.get_events_v1(req)
+
+    assert json.loads(first.data) == json.loads(second.data)
+    assert mock_query.stream.call_count == 1
+
+def test_get_events_v1_reads_city_snapshot(mock_db):
+    """A city snapshot doc is served with a single point read, no events query."""
+    from snapshots import encode_snapshot
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+
+    fields = encode_snapshot("Braunschweig", [
+        {"title": "Basketball", "startTime": "2025-12-29T18:00",
+         "fetchedAt": main.datetime.datetime.now(main.datetime.timezone.utc)},
+    ])
+    fields["version"] = 3
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = fields
+    mock_query = mock_db.return_value.collection.return_value.where.return_value
+
+    response = main.get_events_v1(req)
+
+    assert json.loads(response.data)[0]["title"] == "Basketball"
+    mock_query.stream.assert_not_called()
+    assert main.load_city_snapshot("Braunschweig")["version"] == 3
+
+def test_refresh_marker_doc_does_not_hide_legacy_events():
+    """A doc holding only the refreshInFlight marker is not a snapshot: stored events are backfilled."""
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    fetched_at = main.datetime.datetime.now(main.datetime.timezone.utc) - main.datetime.timedelta(days=2)
+    db.collection("events").document("Wolfsburg_Hockey_Arena").set(
+        {"city": "Wolfsburg", "title": "Hockey", "startTime": "2025-12-30T19:00", "fetchedAt": fetched_at})
+
+    with patch('main.get_db', return_value=db), patch('main.publish_refresh') as publish, \
+            patch('main.fetch_and_save_city') as fetch:
+        assert main.request_refresh("Wolfsburg") is True
+        assert main.read_snapshots(db, [main.city_doc_id("Wolfsburg")]) == {}
+        snapshot = main.load_city_snapshot("Wolfsburg")
+
+    publish.assert_called_once_with("Wolfsburg")
+    fetch.assert_not_called()
+    assert [e["title"] for e in snapshot["events"]] == ["Hockey"]
+    stored = db.collection("citySnapshots").document(main.city_doc_id("Wolfsburg")).get().to_dict()
+    assert stored["count"] == 1
+    assert main.REFRESH_MARKER_FIELD in stored
+    assert "updatedAt" not in stored
+
+def test_get_events_v1_conditional_request(mock_db):
+    """ETag follows the snapshot version; a matching If-None-Match returns 304."""
+    from snapshots import encode_snapshot
+    events = [{"title": f"Event {i}", "startTime": f"2025-12-{i + 1:02d}T18:00",
+               "description": "x" * 100,
+               "fetchedAt": main.datetime.datetime.now(main.datetime.timezone.utc)}
+              for i in range(20)]
+    fields = encode_snapshot("Braunschweig", events)
+    fields["version"] = 7
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = fields
+
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+    req.headers = {"Accept-Encoding": "gzip"}
+    response = main.get_events_v1(req)
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    assert "stale-while-revalidate=" in response.headers["Cache-Control"]
+    assert len(json.loads(gzip.decompress(response.data))) == 20
+
+    req.headers = {"If-None-Match": response.headers["ETag"], "Accept-Encoding": "gzip"}
+    not_modified = main.get_events_v1(req)
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+    # Same ETag as the 200 for the same coding
+    assert not_modified.headers["ETag"] == response.headers["ETag"]
+    req.headers = {"If-None-Match": response.headers["ETag"]}
+    assert main.get_events_v1(req).headers["ETag"] != response.headers["ETag"]
+
+    fields["version"] = 8
+    main._event_cache.clear()
+    req.headers = {"If-None-Match": response.headers["ETag"]}
+    assert main.get_events_v1(req).status_code == 200
+
+def test_get_events_v1_serializes_and_compresses_once_per_version(mock_db):
+    """Warm requests reuse the encoded and gzipped body of the snapshot version."""
+    import http_cache
+    from snapshots import encode_snapshot
+    events = [{"title": f"Event {i}", "startTime": f"2025-12-{i + 1:02d}T18:00",
+               "description": "x" * 100} for i in range(20)]
+    fields = encode_snapshot("Braunschweig", events)
+    fields["version"] = 4
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = fields
+
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+    req.headers = {"Accept-Encoding": "gzip"}
+    with patch('main.encode_json', wraps=main.encode_json) as encode, \
+         patch('http_cache.compress', wraps=http_cache.compress) as compress:
+        first = main.get_events_v1(req)
+        second = main.get_events_v1(req)
+        main._event_cache.clear()
+        third = main.get_events_v1(req)
+
+    assert encode.call_count == 1
+    assert compress.call_count == 1
+    assert first.data == second.data == third.data
+    assert json.loads(gzip.decompress(first.data)) == events
+
+def test_get_events_bulk_v1_merges_cities_with_one_read(mock_db):
+    """Snapshots of all cities are read with one get_all and merged by startTime."""
+    from snapshots import encode_snapshot
+    docs = []
+    for city, events in (
+            ("Braunschweig", [{"title": "Jazz Night", "startTime": "2025-12-29T20:00"},
+                              {"title": "Derby", "startTime": "2025-12-31T15:00"}]),
+            ("Wolfsburg", [{"title": "Hockey", "startTime": "2025-12-30T19:00"}])):
+        doc = MagicMock()
+        doc.id = main.city_doc_id(city)
+        doc.exists = True
+        doc.to_dict.return_value = dict(encode_snapshot(city, events), version=2)
+        docs.append(doc)
+    mock_db.return_value.get_all.return_value = docs
+
+    req = MagicMock()
+    req.method = "GET"
+    req.args = {"cities": "Braunschweig, Wolfsburg"}
+    req.headers = {}
+    with patch('main.request_refresh') as refresh:
+        response = main.get_events_bulk_v1(req)
+        again = main.get_events_bulk_v1(req)
+
+    assert [e["title"] for e in json.loads(response.data)] == ["Jazz Night", "Hockey", "Derby"]
+    assert again.data == response.data
+    assert mock_db.return_value.get_all.call_count == 1
+    mock_db.return_value.collection.return_value.where.return_value.stream.assert_not_called()
+    refresh.assert_not_called()
+    assert "X-Pending-Cities" not in response.headers
+
+def test_get_events_bulk_v1_refreshes_missing_cities_in_background(mock_db):
+    """Cities without data are queued for a refresh and reported as pending."""
+    mock_db.return_value.get_all.return_value = []
+    mock_db.return_value.collection.return_value.where.return_value.stream.return_value = []
+
+    req = MagicMock()
+    req.method = "GET"
+    req.args = {"cities": "Braunschweig,Wolfsburg"}
+    req.headers = {}
+    with patch('main.request_refresh') as refresh, patch('main.fetch_and_save_city') as fetch:
+        response = main.get_events_bulk_v1(req)
+
+    assert response.status_code == 200
+    assert json.loads(response.data) == []
+    assert response.headers["X-Pending-Cities"] == "Braunschweig,Wolfsburg"
+    assert [c.args[0] for c in refresh.call_args_list] == ["Braunschweig", "Wolfsburg"]
+    fetch.assert_not_called()
+
+def test_get_events_bulk_v1_rejects_too_many_cities():
+    req = MagicMock()
+    req.method = "GET"
+    req.args = {"cities": ",".join(f"City {i}" for i in range(main.MAX_BULK_CITIES + 1))}
+    assert main.get_events_bulk_v1(req).status_code == 400
+    req.args = {}
+    assert main.get_events_bulk_v1(req).status_code == 400
+
+def test_get_events_v1_time_window_is_pushed_down(mock_db):
+    """from/to/limit/fields are translated into the Firestore query."""
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {"payload": b'[{"title": "Basketball"}]', "version": 1}
+
+    query = mock_db.return_value.collection.return_value.where.return_value
+    for method in ("where", "order_by", "start_after", "select", "limit"):
+        getattr(query, method).return_value = query
+    start_ts = main.datetime.datetime(2025, 12, 29, 17, 0, tzinfo=main.datetime.timezone.utc)
+    mock_doc = MagicMock()
+    mock_doc.id = "Braunschweig_Basketball_Arena"
+    mock_doc.to_dict.return_value = {"title": "Basketball", "startTs": start_ts}
+    mock_doc.get.return_value = start_ts
+    query.stream.return_value = [mock_doc]
+
+    req = MagicMock()
+    req.args = {"city": "Braunschweig", "from": "2025-12-29", "to": "2025-12-30",
+                "limit": "1", "fields": "title"}
+    req.headers = {}
+    response = main.get_events_v1(req)
+
+    assert json.loads(response.data) == [{"title": "Basketball"}]
+    query.where.assert_any_call("startTs", ">=", main.parse_start_time("2025-12-29"))
+    query.where.assert_any_call("startTs", "<", main.parse_start_time("2025-12-30"))
+    query.select.assert_called_once_with(["startTs", "title"])
+    query.limit.assert_called_once_with(1)
+
+    # The cursor points after the last returned doc
+    cursor = response.headers["X-Next-Cursor"]
+    assert main.decode_cursor(cursor) == (start_ts, "Braunschweig_Basketball_Arena")
+
+def test_get_events_v1_rejects_invalid_window(mock_db):
+    req = MagicMock()
+    req.headers = {}
+    for args in ({"from": "2025-12-29", "limit": "0"},
+                 {"from": "2025-12-29", "fields": "a..b"},
+                 # Paging without a window would skip events without a start time
+                 {"limit": "10"}):
+        req.args = dict(args, city="Braunschweig")
+        response = main.get_events_v1(req)
+        assert response.status_code == 400, args
+
+def test_get_events_v1_projects_whole_list_without_window(mock_db):
+    """fields alone is served from the snapshot, so undated events are kept."""
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {
+        "payload": b'[{"title": "Undated", "address": "Markt"}, {"title": "Basketball", "startTime": "2025-12-29T18:00"}]',
+        "version": 1,
+    }
+    req = MagicMock()
+    req.args = {"city": "Braunschweig", "fields": "title"}
+    req.headers = {}
+
+    with patch('main.publish_refresh'):
+        response = main.get_events_v1(req)
+
+    assert json.loads(response.data) == [{"title": "Undated"}, {"title": "Basketball"}]
+    mock_db.return_value.collection.return_value.where.return_value.order_by.assert_not_called()
+
+def test_process_and_save_events_geocodes_addresses(mock_db, mock_geocoder):
+    """Events get a location and geohash from the (cached) geocoder."""
+    mock_geocoder.geocode.return_value = (52.2625, 10.5211)
+    mock_batch = mock_db.return_value.batch.return_value
+
+    main.process_and_save_events("Braunschweig", '[{"title": "Jazz Night", "address": "Schlossplatz 1"}]')
+
+    mock_geocoder.geocode.assert_called_once()
+    assert mock_geocoder.geocode.call_args.args[0] == "Schlossplatz 1, Braunschweig"
+    saved = mock_batch.set.call_args.args[1]
+    assert saved["location"] == {"latitude": 52.2625, "longitude": 10.5211}
+    assert saved["geohash"] == main.geohash.encode(52.2625, 10.5211, 9)
+
+def test_process_and_save_events_geocodes_place_name_locations(mock_db, mock_geocoder):
+    """A 'location' that is a place name or malformed is replaced by geocoded coordinates."""
+    mock_geocoder.geocode.return_value = (52.2625, 10.5211)
+    mock_batch = mock_db.return_value.batch.return_value
+    raw = ('[{"title": "Jazz Night", "address": "Schlossplatz 1", "location": "Schloss"},'
+           ' {"title": "Basketball", "address": "Arena", "location": {"latitude": "52.1", "longitude": "x"}},'
+           ' {"title": "Theater", "location": {"latitude": "52.26", "longitude": 10.52}}]')
+
+    assert main.process_and_save_events("Braunschweig", raw) == 3
+
+    assert mock_geocoder.geocode.call_count == 2
+    saved = {call.args[1]["title"]: call.args[1] for call in mock_batch.set.call_args_list}
+    assert saved["Jazz Night"]["location"] == {"latitude": 52.2625, "longitude": 10.5211}
+    assert saved["Basketball"]["location"] == {"latitude": 52.2625, "longitude": 10.5211}
+    assert saved["Theater"]["location"] == {"latitude": 52.26, "longitude": 10.52}
+
+def test_get_events_v1_radius_mode(mock_db):
+    """radius_km scans geohash prefixes and filters by exact distance."""
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {"payload": b'[{"title": "Basketball"}]', "version": 1}
+
+    near = MagicMock()
+    near.to_dict.return_value = {"title": "Jazz Night", "startTime": "2025-12-30T20:00",
+                                 "location": {"latitude": 52.2625, "longitude": 10.5211}}
+    far = MagicMock()
+    far.to_dict.return_value = {"title": "Far Away", "startTime": "2025-12-29T20:00",
+                                "location": {"latitude": 52.5, "longitude": 10.9}}
+    query = mock_db.return_value.collection.return_value.where.return_value
+    query.where.return_value.limit.return_value.stream.return_value = [near, far]
+
+    req = MagicMock()
+    req.args = {"city": "Braunschweig", "lat": "52.2688", "lng": "10.5268", "radius_km": "5"}
+    req.headers = {}
+    response = main.get_events_v1(req)
+
+    # The mock returns the same docs for every prefix query
+    titles = [e["title"] for e in json.loads(response.data)]
+    assert set(titles) == {"Jazz Night"}
+    assert query.where.call_count == len(main.geohash.covering_prefixes(52.2688, 10.5268, 5))
+    query.where.return_value.limit.assert_called_with(main.RADIUS_SCAN_LIMIT)
+
+def test_process_and_save_events_invalidates_cache(mock_db):
+    """Saving events for a city drops its cached event list."""
+    main._event_cache.set("Braunschweig", [{"title": "Old"}])
+
+    main.process_and_save_events("Braunschweig", '[{"title": "New", "address": "Markt"}]')
+
+    assert main._event_cache.get("Braunschweig") is None
+
+def test_fetch_and_save_city_coalesces_concurrent_calls(mock_db):
+    """Concurrent sync fetches of the same city share one Gemini call."""
+    import threading
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_stream(city):
+        started.set()
+        release.wait(5)
+        yield '[{"title": "Jazz Night", "address": "Markt"}]'
+
+    with patch('main.stream_events_via_gemini', side_effect=slow_stream) as fetch:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(main.fetch_and_save_city("Braunschweig")))
+                   for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join(5)
+
+    assert fetch.call_count == 1
+    assert results == [1] * 5
+
+def test_fetch_and_save_city_follower_waits_for_leader(mock_db, mock_lease):
+    """If another instance holds the lease, we wait for its result instead of calling Gemini."""
+    mock_lease.return_value = False
+    mock_query = mock_db.return_value.collection.return_value.where.return_value
+    mock_doc = MagicMock()
+    mock_doc.to_dict.return_value = {"title": "Jazz Night", "city": "Braunschweig"}
+    mock_query.stream.return_value = [mock_doc]
+
+    with patch('main.wait_for_lease', return_value=True), patch('main.stream_events_via_gemini') as fetch:
+        count = main.fetch_and_save_city("Braunschweig")
+
+    fetch.assert_not_called()
+    assert count == 1
+
+def test_get_events_v1_records_demand(mock_db, mock_demand):
+    """Requests are counted in memory; the request path never writes counters."""
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+    req.headers = {}
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {"payload": b'[{"title": "Basketball"}]', "version": 1}
+
+    with patch('main.publish_refresh'):
+        main.get_events_v1(req)
+
+    mock_demand.record.assert_called_once_with("Braunschweig")
+    mock_demand.maybe_flush.assert_called_once()
+
+def test_get_events_v1_ignores_invalid_coordinates_with_city(mock_db, mock_demand):
+    req = MagicMock()
+    req.args = {"city": "Braunschweig", "lat": "foo", "lng": "1"}
+    req.headers = {}
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {"payload": b'[{"title": "Basketball"}]', "version": 1}
+
+    with patch('main.publish_refresh'):
+        response = main.get_events_v1(req)
+
+    assert response.status_code == 200
+    mock_demand.record.assert_called_once_with("Braunschweig")
+
+def test_get_events_v1_sampled_trace_reports_stages(mock_db, capsys):
+    import json
+    req = MagicMock()
+    req.args = {"city": "Braunschweig"}
+    req.headers = {}
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    snapshot_doc = mock_db.return_value.collection.return_value.document.return_value.get.return_value
+    snapshot_doc.exists = True
+    snapshot_doc.to_dict.return_value = {"payload": b'[{"title": "Basketball"}]', "version": 1, "updatedAt": now}
+
+    with patch('tracing.TRACE_SAMPLE_RATE', 1.0):
+        main.get_events_v1(req)
+
+    entry = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert entry["trace"] == "get_events_v1"
+    assert {"snapshot_read", "serialize", "compress"} <= set(entry["stagesMs"])
+    assert (entry["cache"], entry["swr"], entry["events"], entry["status"]) == ("miss", "fresh", 1, 200)
+    assert "get_events_v1.total" in main.metrics_snapshot()
+
 def test_get_events_v1_missing_params(mock_db):
     """Test behavior when coordinates are missing (should default to Braunschweig)."""
     req = MagicMock()
@@ -75,6 +517,59 @@ def test_get_events_v1_missing_params(mock_db):
     assert response.status_code == 200
     assert "Access-Control-Allow-Origin" in response.headers
 
+def test_get_events_v1_prefetches_neighbouring_cities(mock_db, mock_prefetch):
+    """The other cities near a coordinate are handed to the prefetch stage."""
+    nearby = [{"name": "Braunschweig"}, {"name": "Wolfsburg"}, {"name": "Salzgitter"}]
+    mock_doc = MagicMock()
+    mock_doc.to_dict.return_value = {
+        "title": "Jazz Night", "startTime": "2025-12-30T20:00", "city": "Braunschweig",
+        "fetchedAt": main.datetime.datetime.now(main.datetime.timezone.utc)}
+    mock_db.return_value.collection.return_value.where.return_value.stream.return_value = [mock_doc]
+
+    req = MagicMock()
+    req.args = {"lat": "52.2688", "lng": "10.5268"}
+    with patch('main.find_nearby_cities', return_value=nearby):
+        response = main.get_events_v1(req)
+
+    assert json.loads(response.data)[0]["title"] == "Jazz Night"
+    mock_prefetch.assert_called_once_with(["Wolfsburg", "Salzgitter"])
+
+def test_prefetch_neighbours_refreshes_missing_and_stale_cities(mock_db):
+    """Fresh cities are skipped, the rest is refreshed within the rate limit and deduplicated."""
+    from ratelimit import TokenBucket
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    metadata = {
+        main.city_doc_id("Wolfsburg"): {"updatedAt": now},
+        main.city_doc_id("Hildesheim"): {"updatedAt": now - main.datetime.timedelta(days=2)},
+    }
+    cities = ["Wolfsburg", "Salzgitter", "Hildesheim"]
+    with patch('main.read_refresh_metadata', return_value=metadata) as read, \
+            patch('main.request_refresh', return_value=True) as refresh, \
+            patch('main._prefetch_limiter', TokenBucket(1 / 60, capacity=1, clock=lambda: 0.0)):
+        first = main.prefetch_neighbours(cities)
+        second = main.prefetch_neighbours(cities)
+
+    assert first == ["Salzgitter"]
+    assert second == []
+    refresh.assert_called_once_with("Salzgitter")
+    # Hildesheim was rate limited, not deduplicated: it is read again on the next request
+    assert read.call_args_list[1].args[1] == [main.city_doc_id("Hildesheim")]
+
+def test_find_nearby_cities_uses_offline_index():
+    """Coordinates are resolved locally and cached by quantized coordinates."""
+    from geoindex import CityIndex
+    index = CityIndex([(2945024, "Braunschweig", 52.26594, 10.52673, "DE", 248292)])
+
+    with patch('main.get_city_index', return_value=index) as get_index, \
+            patch('main.find_nearby_cities_via_geonames') as web:
+        first = main.find_nearby_cities(52.2688, 10.5268, radius_km=30)
+        second = main.find_nearby_cities(52.2689, 10.5269, radius_km=30)
+
+    web.assert_not_called()
+    assert first[0]["name"] == "Braunschweig"
+    assert second is first
+    assert get_index.call_count == 1
+
 def test_process_and_save_events_parsing(mock_db):
     """Test JSON parsing and Firestore saving logic."""
     city_name = "Braunschweig"
@@ -104,11 +599,498 @@ def test_process_and_save_events_parsing(mock_db):
     assert count == 1
     
     # Verify batch usage
-    mock_db.return_value.collection.assert_called_with("events")
+    mock_db.return_value.collection.assert_any_call("events")
     mock_batch.set.assert_called_once()
     mock_batch.commit.assert_called_once()
 
-def test_fetch_events_via_gemini_calls_correct_model(mock_genai_client):
+    # Verify the normalized start time (Europe/Berlin -> UTC)
+    saved = mock_batch.set.call_args.args[1]
+    assert saved["startTs"] == main.datetime.datetime(2025, 12, 31, 21, 0, tzinfo=main.datetime.timezone.utc)
+    assert saved["expiresAt"] == saved["startTs"] + main.datetime.timedelta(hours=main.EVENT_RETENTION_HOURS)
+
+    # Verify the city snapshot was rebuilt (in a transaction)
+    mock_db.return_value.collection.assert_any_call("citySnapshots")
+    mock_db.return_value.transaction.return_value.set.assert_called_once()
+
+def test_prune_expired_events_deletes_past_events_and_rebuilds_snapshots():
+    """Expired events (and legacy ones by startTs) are deleted in pages; snapshots follow."""
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    now = main.datetime.datetime(2025, 12, 29, 18, 0, tzinfo=main.datetime.timezone.utc)
+    hour = main.datetime.timedelta(hours=1)
+    events = db.collection("events")
+    for i in range(5):
+        events.document(f"past{i}").set({"city": "Braunschweig", "expiresAt": now - hour * (i + 1)})
+    events.document("legacy").set({"city": "Wolfsburg", "startTs": now - hour * 48})
+    events.document("tonight").set({"city": "Braunschweig", "startTs": now + hour,
+                                    "expiresAt": now + hour * 25})
+
+    with patch('main.get_db', return_value=db), patch('main.PRUNE_PAGE_SIZE', 2), \
+            patch('main.refresh_city_snapshot') as refresh:
+        stats = main.prune_expired_events(now=now)
+
+    assert stats["deleted"] == 6
+    assert stats["cities"] == 2
+    assert [doc.id for doc in events.stream()] == ["tonight"]
+    assert sorted(c.args[0] for c in refresh.call_args_list) == ["Braunschweig", "Wolfsburg"]
+
+def test_prune_expired_events_keeps_refresh_metadata():
+    """Rebuilding snapshots after a prune doesn't make a stale city look freshly refreshed."""
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    hour = main.datetime.timedelta(hours=1)
+    tomorrow = (now + hour * 24).isoformat()
+    events = db.collection("events")
+    events.document("past").set({"city": "Braunschweig", "title": "Past", "startTime": (now - hour * 30).isoformat(),
+                                 "expiresAt": now - hour * 6})
+    events.document("next").set({"city": "Braunschweig", "title": "Next", "startTime": tomorrow,
+                                 "expiresAt": now + hour * 48})
+    refreshed_at = now - hour * 30
+    in_flight = now - main.datetime.timedelta(minutes=1)
+
+    def stale():
+        main._event_cache.clear()
+        snapshot = main.load_city_snapshot("Braunschweig")
+        return main.is_cache_stale(snapshot["events"], snapshot["updatedAt"], snapshot["churn"])
+
+    with patch('main.get_db', return_value=db):
+        main.refresh_city_snapshot("Braunschweig")
+        db.collection("citySnapshots").document(main.city_doc_id("Braunschweig")).set(
+            {"updatedAt": refreshed_at, main.REFRESH_MARKER_FIELD: in_flight}, merge=True)
+        before = stale()
+        main.prune_expired_events(now=now)
+        after = stale()
+        candidates = main.refresh_candidates({"Braunschweig": 1})
+
+    stored = db.collection("citySnapshots").document(main.city_doc_id("Braunschweig")).get().to_dict()
+    assert before is True and after is True
+    assert stored["updatedAt"] == refreshed_at
+    assert stored[main.REFRESH_MARKER_FIELD] == in_flight
+    assert stored["count"] == 1
+    # The refresh that is already queued still counts as in flight
+    assert candidates == []
+
+def test_refresh_city_snapshot_does_not_overwrite_newer_rebuild():
+    import threading
+    import time
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    events = db.collection("events")
+    events.document("a").set({"city": "Braunschweig", "title": "A", "startTime": "2025-12-30T18:00"})
+    city_events_query = main.city_events_query
+    concurrent = []
+
+    class SlowQuery:
+        # Another instance saves an event and rebuilds while this rebuild reads
+        def __init__(self, query):
+            self._query = query
+
+        def get(self, transaction=None):
+            docs = self._query.get(transaction=transaction)
+            if not concurrent:
+                def save_and_rebuild():
+                    events.document("b").set({"city": "Braunschweig", "title": "B", "startTime": "2025-12-31T18:00"})
+                    main.refresh_city_snapshot("Braunschweig")
+                concurrent.append(threading.Thread(target=save_and_rebuild))
+                concurrent[0].start()
+                time.sleep(0.05)
+            return docs
+
+    with patch('main.get_db', return_value=db), \
+            patch('main.city_events_query', side_effect=lambda city: SlowQuery(city_events_query(city))):
+        main.refresh_city_snapshot("Braunschweig")
+        concurrent[0].join()
+        main._event_cache.clear()
+        snapshot = main.load_city_snapshot("Braunschweig")
+
+    assert [e["title"] for e in snapshot["events"]] == ["A", "B"]
+    assert snapshot["version"] == 2
+
+def test_prune_expired_events_stops_at_max_deletes():
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    now = main.datetime.datetime(2025, 12, 29, 18, 0, tzinfo=main.datetime.timezone.utc)
+    for i in range(5):
+        db.collection("events").document(f"past{i}").set({"city": "Braunschweig", "expiresAt": now})
+
+    with patch('main.get_db', return_value=db), patch('main.refresh_city_snapshot'):
+        stats = main.prune_expired_events(now=now + main.datetime.timedelta(seconds=1), max_deletes=3)
+
+    assert stats["deleted"] == 3
+    assert len(list(db.collection("events").stream())) == 2
+
+def test_stream_and_save_events_shares_one_geocoding_budget(mock_db):
+    """All batches of a stream geocode against the same deadline."""
+    deadlines = []
+
+    def _prepare(event_data, city_name, deadline=None):
+        deadlines.append(deadline)
+        return event_data["title"]
+
+    chunks = ['[{"title": "A"}, {"title": "B"},', ' {"title": "C"}]']
+    with patch('main.GEOCODE_AT_INGEST', True), patch('main.prepare_event', side_effect=_prepare), \
+            patch('main.refresh_city_snapshot'):
+        assert main.stream_and_save_events("Braunschweig", iter(chunks), batch_size=1) == 3
+
+    assert len(deadlines) == 3
+    assert deadlines[0] is not None and len(set(deadlines)) == 1
+
+def test_stream_and_save_events_writes_in_batches(mock_db):
+    """Events are written as soon as a batch is complete, snapshot rebuilt once at the end."""
+    chunks = ['Here you go:\n```json\n[{"title": "A", "address": "X"}, {"ti',
+              'tle": "B", "address": "Y"}, {"title": "C", ',
+              '"address": "Z"}]\n```']
+    mock_batch = mock_db.return_value.batch.return_value
+
+    with patch('main.refresh_city_snapshot') as refresh:
+        count = main.stream_and_save_events("Braunschweig", iter(chunks), batch_size=2)
+
+    assert count == 3
+    assert mock_batch.commit.call_count == 2
+    refresh.assert_called_once_with("Braunschweig")
+
+def test_refresh_city_events_applies_diff(mock_db):
+    """Only new/changed events are written, vanished ones deleted, unchanged ones untouched."""
+    from events import content_hash
+    unchanged_event = {"title": "Jazz Night", "address": "Markt", "startTime": "2025-12-30T20:00"}
+    changed_event = {"title": "Basketball", "address": "Arena", "startTime": "2025-12-29T19:00"}
+    new_event = {"title": "Theater", "address": "Staatstheater", "startTime": "2025-12-31T19:00"}
+
+    def stored(doc_id, event):
+        doc = MagicMock()
+        doc.id = doc_id
+        doc.to_dict.return_value = {"contentHash": content_hash(event)}
+        return doc
+
+    query = mock_db.return_value.collection.return_value.where.return_value
+    query.select.return_value.stream.return_value = [
+        stored("Braunschweig_Jazz_Night_Markt", unchanged_event),
+        stored("Braunschweig_Basketball_Arena", dict(changed_event, startTime="2025-12-29T18:00")),
+        stored("Braunschweig_Gone_Somewhere", {"title": "Gone"}),
+    ]
+    mock_batch = mock_db.return_value.batch.return_value
+
+    with patch('main.refresh_city_snapshot') as refresh:
+        stats = main.refresh_city_events("Braunschweig", [dict(unchanged_event), changed_event, new_event])
+
+    assert stats == {"added": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+    assert mock_batch.set.call_count == 2
+    assert mock_batch.delete.call_count == 1
+    refresh.assert_called_once_with("Braunschweig", {"churn": 0.75})
+
+def test_refresh_city_events_averages_churn(mock_db):
+    """The stored churn is an average over refreshes, not only the latest one."""
+    query = mock_db.return_value.collection.return_value.where.return_value
+    query.select.return_value.stream.return_value = []
+    previous = MagicMock()
+    previous.id = main.city_doc_id("Braunschweig")
+    previous.exists = True
+    previous.to_dict.return_value = {"churn": 0.0}
+    mock_db.return_value.get_all.return_value = [previous]
+
+    with patch('main.refresh_city_snapshot') as refresh:
+        main.refresh_city_events("Braunschweig", [{"title": "Jazz Night", "address": "Markt"}])
+
+    refresh.assert_called_once_with("Braunschweig", {"churn": 0.5})
+
+def test_refresh_city_events_without_changes_only_touches_snapshot(mock_db):
+    from events import content_hash
+    event = {"title": "Jazz Night", "address": "Markt"}
+    doc = MagicMock()
+    doc.id = "Braunschweig_Jazz_Night_Markt"
+    doc.to_dict.return_value = {"contentHash": content_hash(event)}
+    query = mock_db.return_value.collection.return_value.where.return_value
+    query.select.return_value.stream.return_value = [doc]
+
+    with patch('main.refresh_city_snapshot') as refresh, patch('main.touch_snapshot') as touch:
+        stats = main.refresh_city_events("Braunschweig", [dict(event)])
+
+    assert stats["unchanged"] == 1
+    mock_db.return_value.batch.return_value.commit.assert_not_called()
+    refresh.assert_not_called()
+    touch.assert_called_once()
+
+def test_pubsub_refresh_keeps_data_when_fetch_fails(mock_db):
+    event = MagicMock()
+    event.data.message.json = {"city": "Braunschweig"}
+
+    with patch('main.fetch_events_via_gemini', return_value="503 UNAVAILABLE"), \
+            patch('main.refresh_city_events') as refresh:
+        main.fetch_events_for_city_pubsub_v1.__wrapped__(event)
+
+    refresh.assert_not_called()
+    mock_db.return_value.batch.return_value.delete.assert_not_called()
+
+def test_scheduled_event_fetch_publishes_ranked_cities(mock_db):
+    """Due cities are queued by priority; fresh ones are skipped."""
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    active = MagicMock()
+    active.to_dict.return_value = {"name": "Wolfsburg", "status": "active"}
+    mock_db.return_value.collection.return_value.where.return_value.stream.return_value = [active]
+
+    def snapshot_meta(doc_id, hours_old):
+        doc = MagicMock(exists=True, id=doc_id)
+        doc.to_dict.return_value = {"updatedAt": now - main.datetime.timedelta(hours=hours_old), "churn": 0.2}
+        return doc
+    mock_db.return_value.get_all.return_value = [
+        snapshot_meta("Braunschweig", 23), snapshot_meta("Hannover", 2),
+    ]
+
+    with patch('main.publish_refresh_batch') as publish, patch('main.claim_refresh', return_value=True), \
+            patch('main.top_cities', return_value=[("Hannover", 500), ("Braunschweig", 50)]):
+        main.scheduled_event_fetch_v1.__wrapped__(MagicMock())
+
+    # Wolfsburg was never refreshed, Braunschweig is almost stale, Hannover is fresh
+    publish.assert_called_once_with(["Braunschweig", "Wolfsburg"])
+    # The messages are sent before the invocation returns
+    publish.return_value.result.assert_called_once()
+
+def test_scheduled_event_fetch_logs_failed_publishes(mock_db, capsys):
+    mock_db.return_value.collection.return_value.where.return_value.stream.return_value = []
+    mock_db.return_value.get_all.return_value = []
+
+    with patch('main.publish_refresh') as publish, patch('main._batch_sizer', main.BatchSizer(max_batch=1)), \
+            patch('main.claim_refresh', return_value=True), \
+            patch('main.top_cities', return_value=[("Hannover", 500), ("Braunschweig", 50)]):
+        publish.return_value.result.side_effect = [None, TimeoutError("not sent")]
+        main.scheduled_event_fetch_v1.__wrapped__(MagicMock())
+
+    assert publish.return_value.result.call_count == 2
+    assert "Scheduler PubSub Error for ['Braunschweig']: not sent" in capsys.readouterr().out
+
+def test_scheduled_refresh_marks_cities_in_flight():
+    """Scheduled cities get the refreshInFlight marker, so requests don't publish them again."""
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    db.collection("citySnapshots").document(main.city_doc_id("Hannover")).set(
+        {main.REFRESH_MARKER_FIELD: now})
+
+    with patch('main.get_db', return_value=db), patch('main.publish_refresh') as publish, \
+            patch('main.refresh_candidates', return_value=[
+                {"name": "Braunschweig", "demand": 50, "age": None, "churn": None, "ttl": 86400},
+                {"name": "Hannover", "demand": 500, "age": None, "churn": None, "ttl": 86400}]):
+        main.scheduled_event_fetch_v1.__wrapped__(MagicMock())
+        assert main.request_refresh("Braunschweig") is False
+
+    # Hannover was claimed by a request since the metadata was read
+    publish.assert_called_once_with("Braunschweig")
+
+def test_scheduler_and_requests_agree_on_city_ttl():
+    """The scheduler applies the same TTL as is_cache_stale, without reading the events."""
+    from tests.fakes import FakeFirestore
+    db = FakeFirestore()
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    events = db.collection("events")
+    for i in range(4):
+        start = now + main.datetime.timedelta(hours=10 * (i + 1))
+        events.document(f"e{i}").set({"city": "Braunschweig", "title": f"E{i}", "startTime": start.isoformat()})
+
+    with patch('main.get_db', return_value=db):
+        main.refresh_city_snapshot("Braunschweig", {"churn": 0.0})
+        snapshot = main.load_city_snapshot("Braunschweig")
+        candidate, = main.refresh_candidates({"Braunschweig": 1})
+
+    ttl = main.freshness_ttl(snapshot["events"], snapshot["updatedAt"], snapshot["churn"])
+    assert candidate["ttl"] == ttl
+    # Due when the first of the four upcoming events starts, not after 72 hours
+    assert 9 * 3600 < ttl <= 10 * 3600
+
+def test_request_refresh_is_debounced_and_deduplicated(mock_db):
+    """Only the first request publishes; other instances see the in-flight marker."""
+    with patch('main.claim_refresh', side_effect=[True, False]) as claim, \
+            patch('main.publish_refresh') as publish:
+        assert main.request_refresh("Braunschweig") is True
+        assert main.request_refresh("Braunschweig") is False  # debounced, no transaction
+        assert claim.call_count == 1
+        assert main.request_refresh("Hannover") is False  # claimed elsewhere
+
+    publish.assert_called_once_with("Braunschweig")
+
+def test_pubsub_drops_refreshes_done_since_publish(mock_db):
+    now = main.datetime.datetime.now(main.datetime.timezone.utc)
+    event = MagicMock()
+    event.data.message.json = {
+        "cities": ["Braunschweig", "Hannover"],
+        "requestedAt": (now - main.datetime.timedelta(minutes=5)).isoformat(),
+    }
+    refreshed = MagicMock(exists=True, id="Braunschweig")
+    refreshed.to_dict.return_value = {"updatedAt": now}
+    mock_db.return_value.get_all.return_value = [refreshed]
+
+    with patch('main.refresh_city_from_gemini') as single, \
+            patch('main.refresh_cities_batched') as batched:
+        main.fetch_events_for_city_pubsub_v1.__wrapped__(event)
+
+    batched.assert_not_called()
+    single.assert_called_once_with("Hannover")
+
+def test_pubsub_multi_city_message_uses_batched_refresh(mock_db):
+    event = MagicMock()
+    event.data.message.json = {"cities": ["Braunschweig", "Hannover"]}
+
+    with patch('main.refresh_cities_batched') as batched:
+        main.fetch_events_for_city_pubsub_v1.__wrapped__(event)
+
+    batched.assert_called_once_with(["Braunschweig", "Hannover"])
+
+def test_refresh_cities_batched_splits_and_falls_back(mock_db):
+    """Truncated batches are retried smaller; empty cities are fetched one by one."""
+    responses = [
+        ('{"Braunschweig": [{"title": "Basketb', 32768, True),
+        ('{"braunschweig": [{"title": "Basketball"}], "Hannover": []}', 3000, False),
+    ]
+    calls = []
+    def fake_batch(city_names):
+        calls.append(list(city_names))
+        return responses.pop(0)
+
+    with patch('main._batch_sizer', main.BatchSizer(max_batch=4)), \
+            patch('main.fetch_events_batch_via_gemini', side_effect=fake_batch), \
+            patch('main.refresh_city_events', return_value={"added": 1}) as refresh, \
+            patch('main.refresh_city_from_gemini', return_value=None) as single:
+        results = main.refresh_cities_batched(["Braunschweig", "Hannover", "Wolfsburg", "Braunschweig"])
+
+    assert calls == [["Braunschweig", "Hannover", "Wolfsburg"], ["Braunschweig", "Hannover"]]
+    refresh.assert_called_once_with("Braunschweig", [{"title": "Basketball"}])
+    assert [c.args[0] for c in single.call_args_list] == ["Hannover", "Wolfsburg"]
+    assert results == {"Braunschweig": {"added": 1}, "Hannover": None, "Wolfsburg": None}
+
+def test_refresh_cities_batched_shrinks_batches_after_errors(mock_db):
+    """A failed (e.g. timed out) batch falls back to single fetches and shrinks later batches."""
+    with patch('main._batch_sizer', main.BatchSizer(max_batch=4)) as sizer, \
+            patch('main.fetch_events_batch_via_gemini', side_effect=TimeoutError("timed out")), \
+            patch('main.refresh_city_from_gemini', return_value=None) as single:
+        main.refresh_cities_batched(["Braunschweig", "Hannover", "Wolfsburg", "Celle"])
+
+    assert single.call_count == 4
+    assert sizer.size() == 2
+
+def test_refresh_cities_batched_requeues_what_does_not_fit(mock_db):
+    """Cities left when the worker's time budget runs out are published again."""
+    with patch('main.fetch_events_batch_via_gemini') as batch, \
+            patch('main.refresh_city_from_gemini') as single, \
+            patch('main.publish_refresh_batch') as publish:
+        results = main.refresh_cities_batched(["Braunschweig", "Hannover"], budget_seconds=10)
+
+    batch.assert_not_called()
+    single.assert_not_called()
+    publish.assert_called_once_with(["Braunschweig", "Hannover"])
+    publish.return_value.result.assert_called_once()
+    assert results == {}
+
+def test_batched_call_timeout_grows_with_cities(mock_genai_client, mock_db):
+    response = mock_genai_client.return_value.models.generate_content.return_value
+    response.candidates = []
+    response.usage_metadata = None
+    response.text = "{}"
+    cities = [f"City {i}" for i in range(8)]
+
+    with patch('main.GEMINI_API_KEY', 'key'):
+        main.fetch_events_batch_via_gemini(cities)
+
+    config = mock_genai_client.return_value.models.generate_content.call_args.kwargs["config"]
+    assert config["http_options"]["timeout"] == int(main.batch_call_timeout(8) * 1000)
+    assert main.GEMINI_CALL_TIMEOUT < main.batch_call_timeout(8) <= main.REFRESH_WORKER_TIMEOUT / 2
+
+def test_refresh_cities_batched_retries_cut_off_objects(mock_db):
+    """A batch response cut off inside its object is not read as a bare event list."""
+    responses = [
+        ('{"Braunschweig": [{"title": "Basketball"}, {"title": "Jaz', 5000, False),
+        ('{"Braunschweig": [{"title": "Basketball"}]}', 3000, False),
+        ('{"Hannover": [{"title": "Theater"}]}', 3000, False),
+    ]
+    calls = []
+    def fake_batch(city_names):
+        calls.append(list(city_names))
+        return responses.pop(0)
+
+    with patch('main._batch_sizer', main.BatchSizer(max_batch=4)), \
+            patch('main.fetch_events_batch_via_gemini', side_effect=fake_batch), \
+            patch('main.refresh_city_events', return_value={"added": 1}), \
+            patch('main.refresh_city_from_gemini', return_value=None) as single:
+        main.refresh_cities_batched(["Braunschweig", "Hannover", "Wolfsburg", "Celle"])
+
+    assert calls[0] == ["Braunschweig", "Hannover", "Wolfsburg", "Celle"]
+    assert calls[1] == ["Braunschweig", "Hannover"]
+    # Nor cached as a valid response
+    main.remember_gemini_response("prompt", None, '{"A": [{"title": "x"}, {"ti', main.parse_batch_response)
+    assert main._gemini_cache.get(main.response_key(main.GEMINI_MODEL, "prompt", None)) is None
+
+def test_fetch_events_via_gemini_answers_repeats_from_cache(mock_db):
+    """A response that parsed once is reused for the same prompt; garbage is not cached."""
+    prompt = main.build_events_prompt("Braunschweig")
+    main.remember_gemini_response(prompt, main.GROUNDED_CONFIG, "not json")
+    main.remember_gemini_response(prompt, main.GROUNDED_CONFIG, '[{"title": "Basketball"}]')
+
+    with patch('main.GEMINI_API_KEY', None):
+        assert main.fetch_events_via_gemini("Braunschweig") == '[{"title": "Basketball"}]'
+        assert list(main.stream_events_via_gemini("Braunschweig")) == ['[{"title": "Basketball"}]']
+        assert "error" in main.fetch_events_via_gemini("Hannover")
+    assert main._gemini_cache.stats()["memory_hits"] >= 2
+
+def test_streamed_fetch_answers_repeats_from_cache(mock_genai_client, mock_db):
+    """A streamed response is cached even though parsing finishes before the stream ends."""
+    from gemini_cache import GeminiResponseCache
+    chunks = ['```json\n[{"title": "Jazz Night", "address": "Markt"},',
+              ' {"title": "Basketball", "address": "Arena"}]', '\n```', '']
+
+    def _stream(**kwargs):
+        return iter([MagicMock(text=text) for text in chunks])
+
+    client = mock_genai_client.return_value
+    client.models.generate_content_stream.side_effect = _stream
+    with patch('main._gemini_cache', GeminiResponseCache(None)) as cache, \
+            patch('main.GEMINI_STREAMING', True):
+        assert main.fetch_and_save_city("Testcity") == 2
+        assert main.fetch_and_save_city("Testcity") == 2
+        stats = cache.stats()
+
+    assert client.models.generate_content_stream.call_count == 1
+    assert stats["memory_hits"] >= 1
+
+def test_streamed_fetch_reads_past_brackets_in_prose(mock_genai_client, mock_db):
+    """Brackets in the prose before the fence neither end the stream nor poison the cache."""
+    from gemini_cache import GeminiResponseCache
+    chunks = ['Here are events in Braunschweig [Oct 17-24]:\n```json\n[{"title": "Jazz Night", ',
+              '"address": "Markt"}, {"title": "Basketball", "address": "Arena"}]\n```']
+
+    def _stream(**kwargs):
+        return iter([MagicMock(text=text) for text in chunks])
+
+    client = mock_genai_client.return_value
+    client.models.generate_content_stream.side_effect = _stream
+    with patch('main._gemini_cache', GeminiResponseCache(None)), \
+            patch('main.GEMINI_STREAMING', True):
+        assert main.fetch_and_save_city("Testcity") == 2
+        # Answered from the cached response
+        assert main.fetch_and_save_city("Testcity") == 2
+
+    assert client.models.generate_content_stream.call_count == 1
+    assert [e["title"] for e in main.parse_events("".join(chunks))] == ["Jazz Night", "Basketball"]
+
+def test_sync_fetch_deadlines_fit_the_function_timeout():
+    # The leader's Gemini deadline ends before its lease; a follower can wait
+    # out the lease and still fetch itself before the request times out
+    assert main.GEMINI_DEADLINE_SECONDS < main.FETCH_LEASE_TTL
+    assert main.FETCH_LEASE_TTL + main.GEMINI_DEADLINE_SECONDS < main.HTTP_FUNCTION_TIMEOUT
+
+def test_hedged_gemini_call_skips_grounding_while_circuit_is_open():
+    calls = []
+    def make_call(config):
+        def _call():
+            calls.append(config)
+            return "[]"
+        return _call
+
+    with patch('main._grounding_breaker', main.CircuitBreaker(failure_threshold=1)) as breaker:
+        breaker.record_failure()
+        assert main.hedged_gemini_call(make_call, main.LatencyTracker(), is_valid=bool) == "[]"
+
+    assert calls == [None]
+
+def test_fetch_events_via_gemini_calls_correct_model(mock_genai_client, mock_db):
     """Verify that we are using the working model (gemini-2.5-flash)."""
     # Setup mock
     mock_client_instance = mock_genai_client.return_value
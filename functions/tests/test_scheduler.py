@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ratelimit import TokenBucket
+from scheduler import plan_refreshes, refresh_score
+
+DAY = 86400
+
+
+class TestRefreshPlanning:
+    def test_fresh_cities_are_not_due(self):
+        assert refresh_score(DAY * 0.5, DAY, demand=1000, churn=1.0) == 0
+
+    def test_demand_staleness_and_churn_raise_priority(self):
+        base = refresh_score(DAY, DAY, demand=10, churn=0.2)
+        assert refresh_score(DAY, DAY, demand=100, churn=0.2) > base
+        assert refresh_score(DAY * 2, DAY, demand=10, churn=0.2) > base
+        assert refresh_score(DAY, DAY, demand=10, churn=0.8) > base
+
+    def test_plan_respects_budget_and_order(self):
+        cities = [
+            {"name": "Braunschweig", "age": DAY * 0.9, "demand": 50, "churn": 0.3},
+            {"name": "Hannover", "age": DAY * 1.5, "demand": 500, "churn": 0.3},
+            {"name": "Wolfsburg", "age": None, "demand": 0},
+            {"name": "Peine", "age": DAY * 0.1, "demand": 10},
+        ]
+        assert plan_refreshes(cities, DAY, budget=2) == ["Hannover", "Braunschweig"]
+        assert plan_refreshes(cities, DAY, budget=10) == ["Hannover", "Braunschweig", "Wolfsburg"]
+        assert plan_refreshes(cities, DAY, budget=0) == []
+
+    def test_plan_uses_each_citys_ttl(self):
+        cities = [
+            {"name": "Quiet Town", "age": DAY, "demand": 10, "churn": 0.0, "ttl": 3 * DAY},
+            {"name": "Busy City", "age": DAY * 0.5, "demand": 10, "churn": 0.6, "ttl": DAY * 0.25},
+        ]
+        assert plan_refreshes(cities, DAY, budget=10) == ["Busy City"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    def test_try_acquire_respects_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+        clock.now = 0.5
+        assert bucket.try_acquire()
+
+    def test_acquire_waits_for_tokens(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+        for _ in range(5):
+            bucket.acquire()
+        assert clock.now == 2.0
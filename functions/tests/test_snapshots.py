@@ -0,0 +1,43 @@
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import snapshots
+from snapshots import decode_snapshot, encode_snapshot, merge_sorted_events
+
+
+class TestSnapshotEncoding:
+    def test_roundtrip_small_payload_is_plain_json(self):
+        fetched_at = datetime.datetime(2025, 12, 29, 12, 0, tzinfo=datetime.timezone.utc)
+        events = [{"title": "Jazz Night", "fetchedAt": fetched_at}]
+        fields = encode_snapshot("Braunschweig", events)
+        fields["version"] = 2
+
+        assert fields["encoding"] == "json"
+        assert fields["count"] == 1
+        decoded, version, _ = decode_snapshot(fields)
+        assert version == 2
+        assert decoded == [{"title": "Jazz Night", "fetchedAt": fetched_at.isoformat()}]
+
+    def test_large_payload_is_compressed(self):
+        events = [{"title": f"Event {i}", "description": "x" * 500} for i in range(200)]
+        fields = encode_snapshot("Braunschweig", events)
+
+        assert fields["encoding"] == "zlib"
+        assert len(fields["payload"]) < snapshots.COMPRESS_THRESHOLD_BYTES
+        assert decode_snapshot(fields)[0] == events
+
+    def test_oversized_payload_is_rejected(self, monkeypatch):
+        monkeypatch.setattr(snapshots, "MAX_PAYLOAD_BYTES", 10)
+        assert encode_snapshot("Braunschweig", [{"title": "Jazz Night"}]) is None
+
+
+def test_merge_sorted_events_interleaves_cities():
+    braunschweig = [{"title": "A", "startTime": "2025-12-29T18:00"},
+                    {"title": "C", "startTime": "2025-12-31T20:00"}]
+    wolfsburg = [{"title": "D"}, {"title": "B", "startTime": "2025-12-30T19:00"}]
+
+    merged = merge_sorted_events([braunschweig, wolfsburg, []])
+
+    assert [e["title"] for e in merged] == ["D", "A", "B", "C"]
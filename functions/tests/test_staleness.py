@@ -0,0 +1,62 @@
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from staleness import (
+    DEFAULT_TTL_SECONDS, MAX_TTL_SECONDS, MIN_TTL_SECONDS, churn_ttl, city_ttl, events_due_at,
+    update_churn,
+)
+
+REFRESHED = datetime.datetime(2025, 12, 29, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestChurnTTL:
+    def test_unknown_churn_keeps_default(self):
+        assert churn_ttl(None) == DEFAULT_TTL_SECONDS
+
+    def test_quiet_cities_live_longer_than_busy_ones(self):
+        assert churn_ttl(0.0) == MAX_TTL_SECONDS
+        assert churn_ttl(0.5) == MIN_TTL_SECONDS
+        assert churn_ttl(1.0) == MIN_TTL_SECONDS
+        assert MIN_TTL_SECONDS < churn_ttl(0.25) < MAX_TTL_SECONDS
+
+    def test_churn_is_averaged(self):
+        assert update_churn(None, 0.6) == 0.6
+        assert update_churn(0.2, 0.6) == 0.4
+        assert update_churn(0.2, 0.6, alpha=1.0) == 0.6
+
+
+class TestEventsDue:
+    EVENTS = [
+        {"title": "Past", "startTime": "2025-12-29T10:00:00+00:00"},
+        {"title": "Undated"},
+        {"title": "Soon", "startTs": "2025-12-30T08:00:00+00:00", "startTime": "2025-12-30 09:00"},
+        {"title": "Later", "startTime": "2026-01-05T20:00:00+00:00"},
+    ]
+
+    def test_due_when_a_share_of_upcoming_events_started(self):
+        # 2 upcoming events: the first one is a quarter (rounded up) of them
+        assert events_due_at(self.EVENTS, REFRESHED) == datetime.datetime(
+            2025, 12, 30, 8, 0, tzinfo=datetime.timezone.utc)
+        assert events_due_at(self.EVENTS[:2], REFRESHED) is None
+
+    def test_upcoming_events_shorten_ttl(self):
+        due_at = events_due_at(self.EVENTS, REFRESHED)
+        # Due 20 hours after the refresh, quiet city would wait 72 hours
+        assert city_ttl(0.0, due_at, REFRESHED) == 20 * 3600
+        assert city_ttl(0.0, events_due_at(self.EVENTS[3:], REFRESHED), REFRESHED) == MAX_TTL_SECONDS
+        assert city_ttl(None) == DEFAULT_TTL_SECONDS
+
+    def test_evenly_spread_week_keeps_churn_ttl(self):
+        # 30 events over a week: a quarter of them start after ~45 hours
+        events = [{"startTime": (REFRESHED + datetime.timedelta(hours=5.6 * (i + 1))).isoformat()}
+                  for i in range(30)]
+        due_at = events_due_at(events, REFRESHED)
+        assert city_ttl(None, due_at, REFRESHED) == DEFAULT_TTL_SECONDS
+        assert city_ttl(0.5, due_at, REFRESHED) == MIN_TTL_SECONDS
+        assert 40 * 3600 < city_ttl(0.0, due_at, REFRESHED) < 48 * 3600
+
+    def test_shortened_ttl_has_a_floor(self):
+        events = [{"title": "Now", "startTime": "2025-12-29T12:30:00+00:00"}]
+        assert city_ttl(0.0, events_due_at(events, REFRESHED), REFRESHED) == MIN_TTL_SECONDS
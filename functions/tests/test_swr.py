@@ -77,3 +77,29 @@ class TestStaleCheck:
             "fetchedAt": stale_time_str
         }
         assert is_cache_stale([event]) is True
+
+    def test_newest_fetched_at_counts(self):
+        """Unsorted lists: the most recent fetch decides, not the first event."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        events = [
+            {"title": "Event 1", "fetchedAt": now - datetime.timedelta(hours=30)},
+            {"title": "Event 2", "fetchedAt": now - datetime.timedelta(hours=2)},
+        ]
+        assert is_cache_stale(events) is False
+
+    def test_city_refresh_time_and_churn(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        events = [{"title": "Event 1", "fetchedAt": now - datetime.timedelta(days=5)}]
+        refreshed_at = now - datetime.timedelta(hours=30)
+        assert is_cache_stale(events, refreshed_at) is True
+        # Nothing changed in recent refreshes: the city keeps a longer TTL
+        assert is_cache_stale(events, refreshed_at, churn=0.0) is False
+        assert is_cache_stale(events, now - datetime.timedelta(hours=8), churn=0.9) is True
+
+    def test_passing_next_event_makes_data_stale(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        refreshed_at = now - datetime.timedelta(hours=10)
+        events = [{"title": "Event 1", "startTime": (now - datetime.timedelta(hours=1)).isoformat()}]
+        assert is_cache_stale(events, refreshed_at, churn=0.0) is True
+        events[0]["startTime"] = (now + datetime.timedelta(hours=1)).isoformat()
+        assert is_cache_stale(events, refreshed_at, churn=0.0) is False
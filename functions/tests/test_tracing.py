@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tracing
+from tracing import Histogram, annotate, metrics_snapshot, span, traced
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    tracing.reset_metrics()
+    yield
+    tracing.reset_metrics()
+
+
+def last_log(capsys):
+    return json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+
+class TestTracing:
+    def test_sampled_trace_logs_stages_and_attributes(self, capsys):
+        @traced("handler", sample_rate=1.0)
+        def handler():
+            with span("snapshot_read", docs=1):
+                pass
+            for _ in range(2):
+                with span("commit"):
+                    pass
+            annotate(cache="hit", events=3)
+            return "ok"
+
+        assert handler() == "ok"
+        entry = last_log(capsys)
+        assert entry["trace"] == "handler" and entry["severity"] == "INFO"
+        assert set(entry["stagesMs"]) == {"snapshot_read", "commit"}
+        assert entry["cache"] == "hit" and entry["events"] == 3 and entry["snapshot_read.docs"] == 1
+
+        metrics = metrics_snapshot()
+        assert metrics["handler.commit"]["count"] == 2
+        assert metrics["handler.total"]["count"] == 1
+
+    def test_unsampled_requests_are_not_traced(self, capsys):
+        @traced("handler", sample_rate=0.0)
+        def handler():
+            with span("snapshot_read") as s:
+                s.set(docs=1)
+            annotate(cache="miss")
+            return "ok"
+
+        assert handler() == "ok"
+        assert capsys.readouterr().out == ""
+        assert metrics_snapshot() == {}
+
+    def test_errors_are_logged_and_reraised(self, capsys):
+        @traced("handler", sample_rate=1.0)
+        def handler():
+            with span("gemini"):
+                raise TimeoutError("deadline")
+
+        with pytest.raises(TimeoutError):
+            handler()
+        entry = last_log(capsys)
+        assert entry["severity"] == "ERROR"
+        assert entry["error"] == "TimeoutError" and entry["gemini.error"] == "TimeoutError"
+
+    def test_spans_outside_traces_are_noops(self):
+        with span("orphan"):
+            annotate(ignored=True)
+        assert metrics_snapshot() == {}
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(size=100)
+    for value in range(1, 101):
+        histogram.record(value)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (51, 96, 100, 100)
@@ -0,0 +1,226 @@
+"""
+Lightweight request tracing: per-stage spans, structured JSON logs and
+in-process latency histograms.
+
+A sampled trace times its spans, records them in the histograms and ends with
+one JSON log line (Cloud Logging parses JSON on stdout; log-based metrics can
+be built on its fields). Unsampled requests get a shared no-op trace, so the
+instrumentation costs a context variable lookup per span.
+
+    @traced("get_events_v1")
+    def handler(req):
+        with span("snapshot_read"):
+            ...
+        annotate(cache="hit", events=12)
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+# Latest samples kept per histogram
+HISTOGRAM_SIZE = 1024
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Histogram:
+    """
+    Bounded reservoir of the latest durations (ms) with percentile queries.
+    """
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {"count": count}
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+        return {"count": count, "p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99),
+                "max": round(samples[-1], 2)}
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def record(name, value_ms):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    histogram.record(value_ms)
+
+
+def metrics_snapshot():
+    """
+    {histogram name: {count, p50, p95, p99, max}} with durations in ms.
+    """
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {name: histogram.summary() for name, histogram in sorted(items)}
+
+
+def reset_metrics():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attributes", "_started")
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._started) * 1000
+        self.trace._end_span(self, elapsed_ms, exc_type)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    One sampled request. Spans may be opened from several threads.
+    """
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def span(self, name, **attributes):
+        return _Span(self, name, attributes)
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def _end_span(self, span, elapsed_ms, exc_type):
+        record(f"{self.name}.{span.name}", elapsed_ms)
+        with self._lock:
+            # Repeated stages (e.g. batch commits) add up
+            self.stages[span.name] = self.stages.get(span.name, 0.0) + elapsed_ms
+            if span.attributes:
+                self.attributes.update({f"{span.name}.{k}": v for k, v in span.attributes.items()})
+            if exc_type is not None:
+                self.attributes[f"{span.name}.error"] = exc_type.__name__
+
+    def finish(self, error=None):
+        total_ms = (time.perf_counter() - self._started) * 1000
+        record(f"{self.name}.total", total_ms)
+        entry = {
+            "severity": "ERROR" if error else "INFO",
+            "message": f"trace {self.name} {total_ms:.0f}ms",
+            "trace": self.name,
+            "durationMs": round(total_ms, 2),
+            "stagesMs": {k: round(v, 2) for k, v in self.stages.items()},
+        }
+        entry.update(self.attributes)
+        if error:
+            entry["error"] = type(error).__name__
+        print(json.dumps(entry, default=str))
+        return entry
+
+
+class _NoopTrace:
+    __slots__ = ()
+
+    def span(self, name, **attributes):
+        return _NOOP_SPAN
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_TRACE = _NoopTrace()
+
+
+def current_trace():
+    return _current.get() or _NOOP_TRACE
+
+
+def span(name, **attributes):
+    """
+    Times a stage of the current trace (no-op outside a sampled trace).
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return trace.span(name, **attributes)
+
+
+def annotate(**attributes):
+    trace = _current.get()
+    if trace is not None:
+        trace.set(**attributes)
+
+
+def traced(name, sample_rate=None):
+    """
+    Decorator running the function inside a trace, sampled with `sample_rate`
+    (TRACE_SAMPLE_RATE by default, read per call so it can be changed at runtime).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+            if rate <= 0 or random.random() >= rate:
+                return fn(*args, **kwargs)
+            trace = Trace(name)
+            token = _current.set(trace)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                trace.finish(error=e)
+                raise
+            finally:
+                _current.reset(token)
+            trace.finish()
+            return result
+        return wrapper
+    return decorator